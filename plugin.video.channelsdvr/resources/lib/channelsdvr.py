@@ -17,21 +17,17 @@
 # along with Channels DVR.  If not, see <http://www.gnu.org/licenses/>.
 
 # -*- coding: utf-8 -*-
-import os, sys, time, _strptime, datetime, re, traceback, json, inputstreamhelper, threading, requests
+import os, sys, time, _strptime, datetime, calendar, re, traceback, json, hashlib, heapq, inputstreamhelper, threading, requests
 
 from itertools     import repeat, cycle, chain, zip_longest
 from resources.lib import xmltv
+from resources.lib.executor import Executor, CORES
+from resources.lib.guidestore import GuideStore
+from resources.lib.timings import Timer
 from simplecache   import SimpleCache, use_cache
 from six.moves     import urllib
 from kodi_six      import xbmc, xbmcaddon, xbmcplugin, xbmcgui, xbmcvfs, py2_encode, py2_decode
 
-try:
-    from multiprocessing import cpu_count 
-    from multiprocessing.pool import ThreadPool 
-    ENABLE_POOL = True
-    CORES = cpu_count()
-except: ENABLE_POOL = False
-
 PY2 = sys.version_info[0] == 2
 PY3 = sys.version_info[0] == 3
 if PY3: 
@@ -52,17 +48,25 @@ LANGUAGE      = REAL_SETTINGS.getLocalizedString
 ## GLOBALS ##
 MY_MONITOR    = xbmc.Monitor()
 DEBUG         = REAL_SETTINGS.getSettingBool('Enable_Debugging')
+ENABLE_TIMER  = REAL_SETTINGS.getSettingBool('Enable_Timings')
 ENABLE_TS     = REAL_SETTINGS.getSettingBool('Enable_TS')
 DIRECT_URL    = REAL_SETTINGS.getSettingBool('Direct_URL')
 BUILD_FAVS    = REAL_SETTINGS.getSettingBool('Build_Favorites')
 ENABLE_CONFIG = REAL_SETTINGS.getSettingBool('Enable_Config')
 USER_PATH     = REAL_SETTINGS.getSetting('User_Folder')
 ENABLE_TSHIFT = REAL_SETTINGS.getSettingBool('Enable_Timeshift')
+MERGE_GUIDES  = REAL_SETTINGS.getSettingBool('Merge_Guides')
 
 LANG          = 'en' #todo
 CONTENT_TYPE  = 'episodes'
 DISC_CACHE    = False
+TIMEOUT       = 15
 PVR_CLIENT    = 'pvr.iptvsimple'
+TIME_CACHE    = {} #parsed and formatted guide timestamps
+CACHE_LIMIT   = 20000 #entries before TIME_CACHE or CLEAN_CACHE is dropped
+CLEAN_CACHE   = {} #cleaned titles and descriptions, they repeat across the guide days
+CLEAN_TABLE   = dict.fromkeys([idx for idx in range(32) if chr(idx) not in '\n\r\t']) #control characters cleanString drops
+ISO_FORMATS   = ('%Y-%m-%dT%H:%M:%S.%fZ','%Y-%m-%dT%H:%M:00.000Z','%Y-%m-%dT%H:%MZ','%Y-%m-%dT%H:%M:%SZ','%Y-%m-%d')
 PVR_SERVER    = '_channels_app._tcp'
 REMOTE_URL    = 'http://my.channelsdvr.net'
 
@@ -78,9 +82,11 @@ MOVIES_URL    = '%s/dvr/groups/movies/files'%(BASE_URL)
 SOURCES_URL   = '%s/dvr/lineup'%(BASE_URL)
 PROGRAMS_URL  = '%s/dvr/programs'%(BASE_URL)
 
-M3U_TEMP      = os.path.join(SETTINGS_LOC,'channelsdvr.tmp')
+GUIDE_DB      = os.path.join(SETTINGS_LOC,'guide.db')
 M3U_FILE      = os.path.join(USER_PATH,'channelsdvr.m3u')
 XMLTV_FILE    = os.path.join(USER_PATH,'channelsdvr.xml')
+MERGE_M3U     = os.path.join(USER_PATH,'livetv.m3u')
+MERGE_XMLTV   = os.path.join(USER_PATH,'livetv.xml')
 
 MENU          = [(LANGUAGE(30002), '', 0),
                  (LANGUAGE(30017), '', 1),
@@ -117,9 +123,77 @@ def notificationProgress(message, header=ADDON_NAME, time=4):
         dia = ProgressBGDialog((((i + 1) * 100)//time),control=dia,header=header)
     return ProgressBGDialog(100,control=dia)
     
+def parseISO(datestring):
+    #slice 'YYYY-MM-DD[THH:MM[:SS[.fff]]][Z]' directly, strptime is far slower and not thread safe.
+    fields = [int(datestring[0:4]), int(datestring[5:7]), int(datestring[8:10])]
+    if datestring[4:5] != '-' or datestring[7:8] != '-': raise ValueError(datestring)
+    tail = datestring[10:]
+    if tail and tail != 'Z':
+        if tail[0] != 'T' or tail[3:4] != ':': raise ValueError(datestring)
+        fields.extend([int(tail[1:3]), int(tail[4:6])])
+        tail = tail[6:]
+        if tail[:1] == ':':
+            fields.append(int(tail[1:3]))
+            tail = tail[3:]
+            if tail[:1] == '.':
+                frac = tail[1:].rstrip('Z')
+                fields.append(int(frac[:6].ljust(6,'0')))
+                tail = tail[len(frac)+1:]
+        if tail not in ('','Z'): raise ValueError(datestring)
+    return datetime.datetime(*fields)
+
 def strpTime(datestring, format='%Y-%m-%dT%H:%MZ'):
-    try: return datetime.datetime.strptime(datestring, format)
-    except TypeError: return datetime.datetime.fromtimestamp(time.mktime(time.strptime(datestring, format)))
+    key = (datestring, format)
+    try: return TIME_CACHE[key]
+    except (KeyError, TypeError): pass
+    try:
+        if format not in ISO_FORMATS: raise ValueError(format)
+        value = parseISO(datestring)
+    except (ValueError, TypeError):
+        try: value = datetime.datetime.strptime(datestring, format)
+        except TypeError: value = datetime.datetime.fromtimestamp(time.mktime(time.strptime(datestring, format)))
+    if len(TIME_CACHE) >= CACHE_LIMIT: TIME_CACHE.clear()
+    TIME_CACHE[key] = value
+    return value
+
+def strfTime(datestring, format='%Y-%m-%dT%H:%MZ', outformat=xmltv.date_format):
+    #guide timeline boundaries repeat across channels, memoize the formatted string as well.
+    key = (datestring, format, outformat)
+    try: return TIME_CACHE[key]
+    except (KeyError, TypeError): pass
+    value = strpTime(datestring, format).strftime(outformat)
+    TIME_CACHE[key] = value
+    return value
+
+def getEpoch(datestring, format='%Y-%m-%dT%H:%MZ'):
+    return calendar.timegm(strpTime(datestring, format).timetuple())
+
+def parseEXTINF(line):
+    #'#EXTINF:-1 key="value" ...,title' -> ({key: value}, title), attributes in any order.
+    attrs = {}
+    size  = len(line)
+    pos   = line.find(':') + 1
+    while pos < size and line[pos] not in ' \t,': pos += 1 #duration
+    while pos < size:
+        char = line[pos]
+        if   char == ',': return attrs, line[pos+1:].strip()
+        elif char in ' \t': 
+            pos += 1
+            continue
+        equal = line.find('=', pos)
+        if equal == -1: break
+        key = line[pos:equal].strip().lower()
+        if line[equal+1:equal+2] == '"':
+            end = line.find('"', equal + 2)
+            if end == -1: end = size
+            attrs[key] = line[equal+2:end]
+            pos = end + 1
+        else:
+            end = equal + 1
+            while end < size and line[end] not in ' \t,': end += 1
+            attrs[key] = line[equal+1:end]
+            pos = end
+    return attrs, ''
 
 def timezone():
     if time.localtime(time.time()).tm_isdst and time.daylight: return time.altzone / -(60*60) * 100
@@ -130,9 +204,9 @@ def getLocalTime():
     return time.time() + offset.total_seconds()
         
 def log(msg, level=xbmc.LOGDEBUG):
-    try:   msg = str(msg)
-    except Exception as e: 'log str failed! %s'%(str(e))
     if not DEBUG and level != xbmc.LOGERROR: return
+    try:   msg = str(msg() if callable(msg) else msg)
+    except Exception as e: 'log str failed! %s'%(str(e))
     try:   xbmc.log('%s-%s-%s'%(ADDON_ID,ADDON_VERSION,msg),level)
     except Exception as e: 'log failed! %s'%(e)
 
@@ -150,6 +224,16 @@ def slugify(text):
     text = u'_'.join(re.split(r'\s+', text))
     return text
 
+ID_NAMESPACE = slugify(ADDON_NAME) #channel ids are '<number>@<namespace>' in both the m3u and the xmltv
+CHANNEL_IDS  = {}
+def getChannelID(number):
+    #one interned id per channel, shared by its m3u line, its xmltv channel and every programme on it.
+    try: return CHANNEL_IDS[number]
+    except KeyError:
+        chid = CHANNEL_IDS[number] = sys.intern('%s@%s'%(number,ID_NAMESPACE))
+        return chid
+
+TIMER = Timer(ADDON_ID, ENABLE_TIMER, log)
 class Service(object):
     def __init__(self, sysARG=sys.argv):
         self.running    = False
@@ -189,16 +273,18 @@ class Channels(object):
         log('__init__, sysARG = %s'%(sysARG))
         self.sysARG     = sysARG
         self.cache      = SimpleCache()
+        self.executor   = Executor(CORES, log)
         self.m3uList    = []
         self.xmltvList  = {'data'       : self.getData(),
                            'channels'   : [],
                            'programmes' : []}
-        self.channels   = self.getChannels(self.getM3U(),ADDON_VERSION)
-        self.programmes = self.getGuidedata(ADDON_VERSION)
+        self.channels   = self.getM3U()
+        self.guideStore = GuideStore(GUIDE_DB, self.getGuideRows, BASE_URL, datetime.timedelta(minutes=5), log)
         
         
+    @TIMER.timed('fetch')
     def openURL(self, url, life=datetime.timedelta(minutes=5)):
-        log('openURL, url = %s'%(url))
+        log(lambda: 'openURL, url = %s'%(url))
         try:
             cacheName = '%s.%s.openURL.%s'%(ADDON_ID,ADDON_VERSION,url)
             cacheResponse = self.cache.get(cacheName)
@@ -214,37 +300,57 @@ class Channels(object):
             return ''
         
 
-    def saveURL(self, url, file):
-        log('saveURL, url = %s, file = %s'%(url,file))
+    @TIMER.timed('fetch')
+    def getM3U(self, life=datetime.timedelta(minutes=5)):
+        #no channel list endpoint found containing streams, parse the m3u straight off the response.
+        #within 'life' of the last check the cached channels are served as is, after that the request
+        #is conditional, an unchanged lineup costs a 304 and reuses the channels parsed from the last 200.
+        log('getM3U')
+        cacheName = '%s.%s.getM3U.%s'%(ADDON_ID,ADDON_VERSION,M3U_URL)
+        try:    cached = json.loads(self.cache.get(cacheName) or '{}')
+        except: cached = {}
+        if cached.get('channels',[]) and time.time() - cached.get('stamp',0) < life.total_seconds():
+            return cached['channels']
+        header = {}
+        if cached.get('etag',''):     header['If-None-Match']     = cached['etag']
+        if cached.get('modified',''): header['If-Modified-Since'] = cached['modified']
         try:
-            #grab unadulterated m3u, todo option to preserve?
-            #no channel list endpoint found containing streams, use m3u list.
-            response = self.openURL(url)
-            fle = xbmcvfs.File(file, 'w')
-            fle.write(response)
-            fle.close()
-            return response
+            response = requests.get(M3U_URL, headers=header, stream=True, timeout=TIMEOUT)
+            if response.status_code == 304 and cached.get('channels',[]):
+                log('getM3U, lineup unchanged')
+                response.close()
+                cached['stamp'] = time.time()
+                self.cache.set(cacheName, json.dumps(cached), expiration=datetime.timedelta(days=1))
+                return cached['channels']
+            response.raise_for_status()
+            response.encoding = (response.encoding or 'utf-8')
+            channels = self.getChannels(response.iter_lines(decode_unicode=True))
+            response.close()
+            self.cache.set(cacheName, json.dumps({'etag'     : response.headers.get('ETag',''),
+                                                  'modified' : response.headers.get('Last-Modified',''),
+                                                  'stamp'    : time.time(),
+                                                  'channels' : channels}), expiration=datetime.timedelta(days=1))
+            return channels
         except Exception as e: 
-            log("saveURL, Failed! %s"%(e), xbmc.LOGERROR)
-            return ''
-        
-
-    def getM3U(self):
-        log('getM3U')
-        m3uListTMP = self.saveURL(M3U_URL,M3U_TEMP).split('\n')
-        return ['%s\n%s'%(line,m3uListTMP[idx+1]) for idx, line in enumerate(m3uListTMP) if line.startswith('#EXTINF:')]
+            log("getM3U, Failed! %s"%(e), xbmc.LOGERROR)
+            notificationDialog(LANGUAGE(30001))
+            return cached.get('channels',[])
 
 
     # @use_cache(1)
+    @TIMER.timed('parse')
     def getChannels(self, lines, version=ADDON_VERSION):
         log('getChannels')
         items = []
+        attrs = None
         for line in lines:
-            if line.startswith('#EXTINF:'):
-                groups = re.compile('tvg-chno=\"(.*?)\" tvg-logo=\"(.*?)\" tvg-name=\"(.*?)\" group-title=\"(.*?)\",(.*)\\n(.*)', re.IGNORECASE).search(line)
-                items.append({'number':groups.group(1),'logo':groups.group(2),'name':groups.group(3),'groups':groups.group(4),'title':groups.group(5),'url':groups.group(6)})
-        try: xbmcvfs.delete(M3U_TEMP)
-        except: pass
+            line = line.strip()
+            if not line: continue
+            elif line.startswith('#EXTINF:'): attrs, title = parseEXTINF(line)
+            elif line.startswith('#'): continue
+            elif attrs is not None:
+                items.append({'number':attrs.get('tvg-chno',''),'logo':attrs.get('tvg-logo',''),'name':attrs.get('tvg-name',''),'groups':attrs.get('group-title',''),'title':title,'url':line})
+                attrs = None
         return sorted(items, key=lambda k: k['number'])
 
 
@@ -252,7 +358,7 @@ class Channels(object):
         litem = '#EXTINF:-1 tvg-chno="%s" tvg-id="%s" tvg-name="%s" tvg-logo="%s" group-title="%s" radio="%s",%s\n%s'
         logo  = (channel.get('logo','') or ICON)
         group = channel.get('groups','').split(';')
-        if BUILD_FAVS and 'Favorites' not in group: return False
+        if BUILD_FAVS and 'Favorites' not in group: return None
         group.append(ADDON_NAME)
         
         if DIRECT_URL:
@@ -268,35 +374,45 @@ class Channels(object):
             url = 'plugin://%s/?mode=9&name=%s&url=%s'%(ADDON_ID,urllib.parse.quote(self.cleanString(channel['name'])),urllib.parse.quote(channel['url']))
             
         radio = False
-        self.m3uList.append(litem%(channel['number'],'%s@%s'%(channel['number'],slugify(ADDON_NAME)),channel['name'],logo,';'.join(group),str(radio).lower(),channel['title'],url))
-        return True
+        return litem%(channel['number'],getChannelID(channel['number']),channel['name'],logo,';'.join(group),str(radio).lower(),channel['title'],url)
         
         
     def loadM3U(self):
-        self.poolList(self.buildM3U, self.getChannels(self.getM3U()))
+        self.channels = self.getM3U() #the list __init__ fetched while it is fresh, the service's hourly run revalidates it
+        self.m3uList.extend(self.executor.map(self.buildM3U, self.channels))
         return self.saveM3U(M3U_FILE)
         
 
     # @use_cache(1)
     def getGuidedata(self, version=ADDON_VERSION):
         log('getGuidedata')
-        return json.loads(self.openURL(GUIDE_URL))
+        with TIMER.span('parse'): return json.loads(self.openURL(GUIDE_URL))
+
+
+    def getGuideRows(self):
+        #the guide as GuideStore rows, airings keyed by utc air time.
+        for content in self.getGuidedata():
+            programmes = []
+            for program in content.get('Airings',[]):
+                try:    programmes.append((getEpoch(program['Raw']['startTime']), getEpoch(program['Raw']['endTime']), program))
+                except: log(lambda: 'getGuideRows, invalid airtime %s'%(program.get('Title','')))
+            yield content['Channel']['Number'], content['Channel'], programmes
 
 
     def loadXMLTV(self):
         log('loadXMLTV')
-        self.poolList(self.buildXMLTV, self.programmes)
+        for citem, pitems in self.executor.map(self.buildXMLTV, self.getGuidedata()):
+            self.xmltvList['channels'].append(citem)
+            self.xmltvList['programmes'].append(pitems)
         return self.saveXMLTV()
         
         
     def buildXMLTV(self, content):
         channel    = content['Channel']
         programmes = content['Airings']
-        if channel.get('Hidden',False): return False
-        elif BUILD_FAVS and not channel.get('Favorite',False): return False
-        self.addChannel(channel)
-        [self.addProgram(program) for program in  programmes]
-        return True
+        if channel.get('Hidden',False): return None
+        elif BUILD_FAVS and not channel.get('Favorite',False): return None
+        return self.addChannel(channel), [pitem for pitem in [self.addProgram(program) for program in programmes] if pitem]
         
 
     def getData(self):
@@ -309,11 +425,19 @@ class Channels(object):
                 
     
     def saveM3U(self, file):
-        fle = xbmcvfs.File(M3U_FILE, 'w')
+        if not self.m3uList: return False
         if not self.m3uList[0].startswith('#EXTM3U'):
             self.m3uList.insert(0,'#EXTM3U tvg-shift="" x-tvg-url="" x-tvg-id=""')
-        fle.write('\n'.join([item for item in self.m3uList]))
+        m3u       = '\n'.join([item for item in self.m3uList])
+        checksum  = hashlib.md5(m3u.encode('utf-8')).hexdigest()
+        cacheName = '%s.%s.saveM3U.%s'%(ADDON_ID,ADDON_VERSION,file)
+        if self.cache.get(cacheName) == checksum and xbmcvfs.exists(file):
+            log('saveM3U, unchanged')
+            return True
+        fle = xbmcvfs.File(file, 'w')
+        fle.write(m3u)
         fle.close()
+        self.cache.set(cacheName, checksum, expiration=datetime.timedelta(days=1))
         return True
         
 
@@ -326,12 +450,13 @@ class Channels(object):
                               generator_info_url  = data['generator-info-url'], 
                               generator_info_name = data['generator-info-name'])
                
+        log('save, saving to %s'%(XMLTV_FILE))
+        writer.open(XMLTV_FILE, pretty_print=True)
         channels = self.sortChannels(self.xmltvList['channels'])
         for channel in channels: writer.addChannel(channel)
         programmes = self.sortProgrammes(self.xmltvList['programmes'])
         for program in programmes: writer.addProgramme(program)
-        log('save, saving to %s'%(XMLTV_FILE))
-        writer.write(XMLTV_FILE, pretty_print=True)
+        writer.close()
         return True
         
         
@@ -341,67 +466,77 @@ class Channels(object):
         return channels
 
 
-    def sortProgrammes(self, programmes=None):
-        programmes.sort(key=lambda x:x['channel'])
-        programmes.sort(key=lambda x:x['start'])
-        log('sortProgrammes, programmes = %s'%(len(programmes)))
-        return programmes
+    def sortProgrammes(self, runs=None):
+        #runs are each channel's programmes, built in start order; merging them in channel order is a linear pass.
+        runs = [(run if all(prev.start <= item.start for prev, item in zip(run, run[1:])) else sorted(run, key=lambda x:x.start)) for run in runs if run]
+        runs.sort(key=lambda run:run[0].channel)
+        log('sortProgrammes, programmes = %s'%(sum([len(run) for run in runs])))
+        return heapq.merge(*runs, key=lambda x:x.start)
 
 
     def addChannel(self, channel):
-        citem    = ({'id'           : '%s@%s'%(channel['Number'],slugify(ADDON_NAME)),
+        citem    = ({'id'           : getChannelID(channel['Number']),
                      'display-name' : [(self.cleanString(channel['Name']), LANG)],
                      'icon'         : [{'src':channel.get('Image',ICON)}]})
-        log('addChannel = %s'%(citem))
-        self.xmltvList['channels'].append(citem)
-        return True
+        log(lambda: 'addChannel = %s'%(citem))
+        return citem
 
 
     def addProgram(self, program):
         try:
-            pitem = {'channel'     : '%s@%s'%(program['Channel'],slugify(ADDON_NAME)),
-                     'category'    : [(self.cleanString(genre),LANG) for genre in (program.get('Categories',['Undefined']) or ['Undefined'])],
-                     'title'       : [(self.cleanString(program['Title']), LANG)],
-                     'desc'        : [((self.cleanString(program.get('Summary','')) or xbmc.getLocalizedString(161)), LANG)],
-                     'stop'        : (strpTime(program['Raw']['endTime']).strftime(xmltv.date_format)),
-                     'start'       : (strpTime(program['Raw']['startTime']).strftime(xmltv.date_format)),
-                     'icon'        : [{'src': program.get('Image',FANART)}]}
-                          
-                          
+            length  = None
+            date    = None
+            rating  = None
+            system  = None
+            SElabel = None
             if int(program.get('Duration','') or  '0') > 0:
-                pitem['length']    = {'units': 'seconds', 'length': str(program['Duration'])}
-                
-            if program.get('EpisodeTitle',''):
-                pitem['sub-title'] = [(self.cleanString(program['EpisodeTitle']), LANG)]
+                length = str(program['Duration'])
                 
             if program.get('OriginalDate',''):
                 try:
-                    pitem['date'] = (strpTime(program['OriginalDate'], '%Y-%m-%d')).strftime('%Y%m%d')
+                    date = strfTime(program['OriginalDate'], '%Y-%m-%d', '%Y%m%d')
                 except: pass
                 
-            if program.get('Tags',None):
-                if 'New' in program.get('Tags',[]): pitem['new'] = '' #write blank tag, tag == True
             if program['Raw'].get('ratings',None):
                 rating = program['Raw'].get('ratings',[{}])[0].get('code','')
-                if rating.startswith('TV'): 
-                    pitem['rating'] = [{'system': 'VCHIP', 'value': rating}]
-                else:  
-                    pitem['rating'] = [{'system': 'MPAA', 'value': rating}]
+                if rating.startswith('TV'): system = 'VCHIP'
+                else:                       system = 'MPAA'
                 
             if program.get('EpisodeNumber',''): 
                 SElabel = 'S%sE%s'%(str(program.get("SeasonNumber",0)).zfill(2),str(program.get("EpisodeNumber",0)).zfill(2))
-                pitem['episode-num'] = [(SElabel, 'onscreen')]
 
-            log('addProgram = %s'%(pitem))
-            self.xmltvList['programmes'].append(pitem)
-            return True
+            pitem = xmltv.Programme(channel       = getChannelID(program['Channel']),
+                                    start         = strfTime(program['Raw']['startTime']),
+                                    stop          = strfTime(program['Raw']['endTime']),
+                                    title         = self.cleanString(program['Title']),
+                                    desc          = (self.cleanString(program.get('Summary','')) or xbmc.getLocalizedString(161)),
+                                    sub_title     = (self.cleanString(program['EpisodeTitle']) if program.get('EpisodeTitle','') else None),
+                                    category      = [self.cleanString(genre) for genre in (program.get('Categories',['Undefined']) or ['Undefined'])],
+                                    date          = date,
+                                    length        = length,
+                                    icon          = program.get('Image',FANART),
+                                    episode_num   = SElabel,
+                                    rating_system = system,
+                                    rating        = rating,
+                                    new           = 'New' in (program.get('Tags',None) or []), #write blank tag, tag == True
+                                    lang          = LANG)
+
+            log(lambda: 'addProgram = %s'%(pitem,))
+            return pitem
         except:
-            return False
+            return None
         
         
     def cleanString(self, text):
+        #keep tab, newline, carriage return and \x20-\x7f. most guide text is plain ascii already.
         if text is None: return ' '
-        return re.sub(u'[^\n\r\t\x20-\x7f]+',u'',text)
+        try: return CLEAN_CACHE[text]
+        except KeyError: pass
+        clean = (text if text.isascii() else text.encode('ascii','ignore').decode('ascii'))
+        if not clean.isprintable(): clean = clean.translate(CLEAN_TABLE)
+        if len(CLEAN_CACHE) >= CACHE_LIMIT: CLEAN_CACHE.clear()
+        CLEAN_CACHE[text] = clean
+        return clean
 
         
     def playVideo(self, name, url):
@@ -436,13 +571,13 @@ class Channels(object):
             liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
             liz.setArt({'thumb':icon,'logo':icon,'icon':icon})
             liz.setProperty('IsPlayable', 'true')
-        log('addLink, name = %s'%(name))
+        log(lambda: 'addLink, name = %s'%(name))
         u=self.sysARG[0]+"?url="+urllib.parse.quote(path)+"&name="+urllib.parse.quote(name)+"&mode="+str(mode)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,totalItems=total)
 
 
     def addDir(self, name, path, mode='',icon=ICON, liz=None):
-        log('addDir, name = %s'%(name))
+        log(lambda: 'addDir, name = %s'%(name))
         if liz is None:
             liz=xbmcgui.ListItem(name)
             liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
@@ -452,25 +587,6 @@ class Channels(object):
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,isFolder=True)
      
      
-    def poolList(self, method, items=None, args=None, chunk=25):
-        log("poolList")
-        results = []
-        if ENABLE_POOL:
-            pool = ThreadPool(CORES)
-            if args is not None: 
-                results = pool.map(method, zip(items,repeat(args)))
-            elif items: 
-                results = pool.map(method, items)#, chunksize=chunk)
-            pool.close()   
-            pool.join()
-        else:
-            if args is not None: 
-                results = [method((item, args)) for item in items]
-            elif items: 
-                results = [method(item) for item in items]
-        return filter(None, results)
-
-
     def mainMenu(self):
         log('mainMenu')
         for item in MENU: self.addDir(*item)
@@ -487,16 +603,24 @@ class Channels(object):
         
         
     def getLiveURL(self, chid, channels):
-        log('getLiveURL, chid = %s'%(chid))
+        log(lambda: 'getLiveURL, chid = %s'%(chid))
         for channel in channels:
             if channel['number'] == chid:
                 return channel['url']
         return ''
         
         
+    def addPlayItems(self, results):
+        for items in results:
+            for name, url, label, info, art in items:
+                self.addLink(name, url, '9', liz=self.buildItemListItem(label, url, info, art))
+                
+                
     def buildLive(self, favorites=False):
         log('buildLive')
-        self.poolList(self.buildPlayItem, self.programmes, ('live',favorites))
+        window   = self.guideStore.getWindow()
+        contents = [{'Channel':channel,'Airings':window.get(str(channel['Number']),[])} for channel in self.guideStore.getChannels()]
+        self.addPlayItems(self.executor.map(self.buildPlayItem, zip(contents, repeat(('live',favorites)))))
         
         
     def buildPlayItem(self, data):
@@ -505,6 +629,7 @@ class Channels(object):
         channel    = content['Channel']
         programmes = content['Airings']
         liveMatch  = False
+        items      = []
         if channel['Hidden'] == True: return
         elif favorites and not channel.get('Favorite',False): return
         tz  = (timezone()//100)*60*60
@@ -535,19 +660,20 @@ class Channels(object):
                 thumb = program.get('Image',icon)
                 info  = {'label':label,'title':label,'duration':program.get('Duration',0),'genre':program.get('Genres',[]),'plot':program.get('Summary',xbmc.getLocalizedString(161)),'aired':program.get('OriginalDate','')}
                 art   = {'icon':icon, 'thumb':thumb}
-                self.addLink(channel['Name'], url, '9', liz=self.buildItemListItem(label, url, info, art))
+                items.append((channel['Name'], url, label, info, art))
                 if liveMatch: break
             except: pass
+        return tuple(items)
             
             
     def buildRecordingItem(self, item):
         item['Airings'] = [item['Airing'].copy()]
         item['Channel'] = {'Hidden':False,'Number':0,'Name':'','Image':''}
-        self.buildPlayItem((item,'recordings'))
+        return self.buildPlayItem((item,('recordings',False)))
         
             
     def buildRecordings(self):
-        self.poolList(self.buildRecordingItem, json.loads(self.openURL(UPNEXT_URL)))
+        self.addPlayItems(self.executor.map(self.buildRecordingItem, json.loads(self.openURL(UPNEXT_URL))))
             
         
     def search(self, term=None):
@@ -561,22 +687,39 @@ class Channels(object):
     def buildLineup(self, chid=None):
         log('buildLineup, chid = %s'%(chid))
         if chid is None:
-            self.poolList(self.buildLineupItem, self.programmes)
+            for channel in self.guideStore.getChannels():
+                self.addDir('%s| %s'%(channel['Number'],channel['Name']), channel['Number'], '1', channel.get('Image',ICON), liz=None)
         else:
-            self.poolList(self.buildPlayItem, [program for program in self.programmes if program['Channel']['Number'] == chid], 'lineup')
-
-  
-    def buildLineupItem(self, content):
-        channel = content['Channel']
-        label = '%s| %s'%(channel['Number'],channel['Name'])
-        self.addDir(label, channel['Number'], '1', channel.get('Image',ICON), liz=None)
+            channel = self.guideStore.getChannel(chid)
+            if channel is None: return
+            content = {'Channel':channel,'Airings':self.guideStore.getProgrammes(chid, start=time.time())}
+            self.addPlayItems(self.executor.map(self.buildPlayItem, zip([content], repeat(('lineup',False)))))
         
         
     def buildService(self):
         log('buildService')
-        if self.loadM3U() and self.loadXMLTV():
-            self.chkSettings()
+        try:
+            if self.loadM3U() and self.loadXMLTV():
+                if not self.mergeGuides(): return True #another add-on owns the merged guide and the IPTV Simple paths
+                self.chkSettings()
+                return True
+        finally: self.executor.close()
+
+
+    def getGuideFiles(self):
+        #the m3u/xmltv pair IPTV Simple loads.
+        if MERGE_GUIDES: return MERGE_M3U, MERGE_XMLTV
+        return M3U_FILE, XMLTV_FILE
+
+
+    def mergeGuides(self):
+        #-> False when another merging add-on owns the merged pair, it picks up ours on its next refresh.
+        if not MERGE_GUIDES:
+            xmltv.register_provider(ADDON_ID)
             return True
+        if not xmltv.register_provider(ADDON_ID, M3U_FILE, XMLTV_FILE): return False
+        log('mergeGuides, merged = %s'%(xmltv.merge_guides(ADDON_ID, MERGE_M3U, MERGE_XMLTV, data=self.xmltvList['data'])))
+        return True
         
         
     def togglePVR(self, state='true'):
@@ -597,25 +740,27 @@ class Channels(object):
         if ENABLE_CONFIG:
             addon = self.getPVR()
             if addon is None: return
+            m3u, xml = self.getGuideFiles()
             check = [addon.getSetting('m3uRefreshMode')         == '1',
                      addon.getSetting('m3uRefreshIntervalMins') == '5',
                      addon.getSetting('logoFromEpg')            == '1',
                      addon.getSetting('m3uPathType')            == '0',
-                     addon.getSetting('m3uPath')                == M3U_FILE,
+                     addon.getSetting('m3uPath')                == m3u,
                      addon.getSetting('epgPathType')            == '0',
-                     addon.getSetting('epgPath')                == XMLTV_FILE]
+                     addon.getSetting('epgPath')                == xml]
             if False in check: self.configurePVR()
         
         
     def configurePVR(self):
         addon = self.getPVR()
+        m3u, xml = self.getGuideFiles()
         addon.setSetting('m3uRefreshMode'        , '1')
         addon.setSetting('m3uRefreshIntervalMins', '5')
         addon.setSetting('logoFromEpg'           , '1')
         addon.setSetting('m3uPathType'           , '0')
-        addon.setSetting('m3uPath'               , M3U_FILE)
+        addon.setSetting('m3uPath'               , m3u)
         addon.setSetting('epgPathType'           , '0')
-        addon.setSetting('epgPath'               , XMLTV_FILE)
+        addon.setSetting('epgPath'               , xml)
         
         
     def getParams(self):
@@ -632,20 +777,27 @@ class Channels(object):
         except: mode = None
         log("Mode: %s, Name: %s, URL : %s"%(mode,name,url))
 
-        if mode==None:
-            if getPTVL(): 
-                return notificationDialog(LANGUAGE(30019))
-            self.mainMenu()
-        elif mode == 0:  self.buildLive()
-        elif mode == 1:  self.buildLive(favorites=True)
-        elif mode == 2:  self.buildLineup(url)
-        elif mode == 3:  self.buildRecordings()
-        elif mode == 8:  self.search(name)
-        elif mode == 9:  self.playVideo(name, url)
-        
-        xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=DISC_CACHE)
\ No newline at end of file
+        if mode == 99: return xbmcgui.Dialog().textviewer(ADDON_NAME, TIMER.summary())
+        TIMER.begin(mode)
+        try:
+            if mode==None:
+                if getPTVL(): 
+                    return notificationDialog(LANGUAGE(30019))
+                self.mainMenu()
+            elif mode == 0:  self.buildLive()
+            elif mode == 1:  self.buildLive(favorites=True)
+            elif mode == 2:  self.buildLineup(url)
+            elif mode == 3:  self.buildRecordings()
+            elif mode == 8:  self.search(name)
+            elif mode == 9:  self.playVideo(name, url)
+
+            xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
+            with TIMER.span('directory'): xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=DISC_CACHE)
+        finally:
+            self.executor.close()
+            TIMER.end()
+            self.guideStore.close()
\ No newline at end of file
@@ -0,0 +1,164 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of Channels DVR.
+#
+# Channels DVR is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Channels DVR is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Channels DVR.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import os, time, datetime, json, sqlite3
+
+from kodi_six import xbmc, xbmcvfs
+
+SCHEMA  = 1 #bump to drop and rebuild existing stores
+TIMEOUT = 30 #seconds to wait on a store locked by another instance
+TABLES  = ['CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+           'CREATE TABLE IF NOT EXISTS channels (chid TEXT PRIMARY KEY, position INTEGER, data TEXT)',
+           'CREATE TABLE IF NOT EXISTS programmes (chid TEXT, start REAL, stop REAL, data TEXT)',
+           'CREATE INDEX IF NOT EXISTS programmes_channel ON programmes (chid, start)',
+           'CREATE INDEX IF NOT EXISTS programmes_time ON programmes (start, stop)']
+
+def translatePath(path):
+    try:    return xbmcvfs.translatePath(path)
+    except AttributeError: return xbmc.translatePath(path)
+
+class GuideStore(object):
+    """
+    A SQLite copy of the guide, indexed by channel and air time, so a
+    listing reads only the rows it renders instead of reparsing the whole
+    guide payload.
+
+    'fetch' returns the guide as (chid, channel, programmes) tuples, where
+    programmes is a list of (start, stop, programme) with utc epoch
+    seconds. It is called again once the store is older than 'life' or was
+    filled under a different 'name' (ie. another region).
+    """
+    def __init__(self, path, fetch, name='', life=datetime.timedelta(hours=1), log=None):
+        self.path    = translatePath(path)
+        self.fetch   = fetch
+        self.name    = str(name)
+        self.life    = life
+        self.log     = log
+        self.db      = None
+        self.expires = 0
+
+
+    def connect(self):
+        if self.db is None:
+            folder = os.path.dirname(self.path)
+            if folder and not xbmcvfs.exists(os.path.join(folder,'')): xbmcvfs.mkdirs(folder)
+            self.db = sqlite3.connect(self.path, timeout=TIMEOUT)
+            if self.getMeta('schema') != str(SCHEMA):
+                with self.db:
+                    for table in ('meta','channels','programmes'): self.db.execute('DROP TABLE IF EXISTS %s'%(table))
+                    for statement in TABLES: self.db.execute(statement)
+                    self.setMeta('schema', SCHEMA)
+        return self.db
+
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+    def getMeta(self, key):
+        try:
+            row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            if row: return row[0]
+        except sqlite3.Error: pass
+        return None
+
+
+    def setMeta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+    def query(self, statement, args=()):
+        #refresh once the store has expired, then read.
+        db = self.connect()
+        if time.time() >= self.expires:
+            try:    stamp = float(self.getMeta('stamp') or 0)
+            except: stamp = 0
+            if self.getMeta('name') != self.name or time.time() - stamp >= self.life.total_seconds():
+                stamp = self.load()
+            self.expires = stamp + self.life.total_seconds()
+        return db.execute(statement, args).fetchall()
+
+
+    def load(self):
+        stamp    = time.time()
+        channels = []
+        programs = []
+        for position, (chid, channel, programmes) in enumerate(self.fetch() or []):
+            chid = str(chid)
+            channels.append((chid, position, json.dumps(channel)))
+            programs.extend([(chid, start, stop, json.dumps(programme)) for start, stop, programme in programmes])
+        if self.log: self.log('GuideStore, load %s channels, %s programmes'%(len(channels),len(programs)))
+        if not channels: return stamp #failed fetch, keep serving the last guide and retry on the next instance
+        with self.db:
+            self.db.execute('DELETE FROM channels')
+            self.db.execute('DELETE FROM programmes')
+            self.db.executemany('INSERT OR REPLACE INTO channels (chid, position, data) VALUES (?, ?, ?)', channels)
+            self.db.executemany('INSERT INTO programmes (chid, start, stop, data) VALUES (?, ?, ?, ?)', programs)
+            self.setMeta('name' , self.name)
+            self.setMeta('stamp', stamp)
+        return stamp
+
+
+    def getChannels(self):
+        """
+        getChannels() -> list
+
+        Every channel, in guide order.
+        """
+        return [json.loads(row[0]) for row in self.query('SELECT data FROM channels ORDER BY position')]
+
+
+    def getChannel(self, chid):
+        """
+        getChannel(chid) -> dict or None
+        """
+        rows = self.query('SELECT data FROM channels WHERE chid = ?', (str(chid),))
+        if rows: return json.loads(rows[0][0])
+        return None
+
+
+    def getProgrammes(self, chid, start=None, stop=None):
+        """
+        getProgrammes(chid, start=None, stop=None) -> list
+
+        The lineup for channel 'chid', by air time. With 'start' only
+        programmes ending after it are returned, with 'stop' only those
+        starting before it.
+        """
+        rows = self.query('SELECT data FROM programmes WHERE chid = ? AND stop > ? AND start < ? ORDER BY start',
+                          (str(chid), (start or 0), (stop or float('inf'))))
+        return [json.loads(row[0]) for row in rows]
+
+
+    def getWindow(self, start=None, stop=None):
+        """
+        getWindow(start=None, stop=None) -> dict
+
+        Programmes airing between 'start' (default now) and 'stop' (default
+        'start'), by air time and keyed by chid. getWindow() is what's on
+        now, getWindow(stop=time.time() + hours * 3600) the next few hours.
+        """
+        if start is None: start = time.time()
+        if stop  is None: stop  = start
+        window = {}
+        rows   = self.query('SELECT chid, data FROM programmes WHERE start <= ? AND stop > ? ORDER BY start', (stop, start))
+        for chid, data in rows: window.setdefault(chid,[]).append(json.loads(data))
+        return window
@@ -42,8 +42,50 @@ VERSION = "1.4.4"
 date_format = '%Y%m%d%H%M%S %Z'
 date_format_notz = '%Y%m%d%H%M%S'
 
-from xml.etree.ElementTree import ElementTree, Element, SubElement, tostring
-from kodi_six              import xbmcvfs
+# Number of serialized elements buffered before a streaming Writer flushes
+stream_buffer = 250
+
+import calendar, heapq, json
+
+from collections          import namedtuple
+from xml.etree.ElementTree import ElementTree, Element, SubElement, iterparse, tostring
+from xml.sax.saxutils      import quoteattr
+from kodi_six              import xbmc, xbmcgui, xbmcvfs
+
+try:    from sys import intern
+except ImportError: pass #python 2 builtin
+
+
+def _intern(text):
+    try: return intern(text)
+    except TypeError: return text
+
+
+class Programme(namedtuple('Programme', ('channel', 'start', 'stop', 'title', 'desc',
+                                         'sub_title', 'category', 'date', 'length', 'icon',
+                                         'episode_num', 'rating_system', 'rating', 'new',
+                                         'catchup_id', 'lang'))):
+    """
+    A compact, immutable XMLTV 'programme' for guide builders
+
+    Holds the subset of XMLTV used by the live TV plugins as flat fields
+    instead of the nested dict read_programmes() returns. Text fields share
+    a single 'lang', 'category' is a tuple of strings, 'length' is in
+    seconds, 'icon' is a src URL and 'episode_num' is an onscreen label.
+    Channel ids and language codes are interned, and Writer.addProgramme()
+    accepts a Programme as well as a dict.
+    """
+    __slots__ = ()
+
+    def __new__(cls, channel, start, stop=None, title=None, desc=None,
+                sub_title=None, category=(), date=None, length=None, icon=None,
+                episode_num=None, rating_system=None, rating=None, new=False,
+                catchup_id=None, lang=None):
+        return super(Programme, cls).__new__(cls, _intern(channel), start, stop, title, desc,
+                                             sub_title, tuple(category), date, length, icon,
+                                             episode_num, rating_system, rating, new,
+                                             catchup_id, _intern(lang) if lang else lang)
+
 
 def set_attrs(d, elem, attrs):
     """
@@ -133,10 +175,9 @@ def read_channels(fp=None, tree=None):
     Return a list of channel dictionaries from file object 'fp' or the
     ElementTree 'tree'
     """
-    channels = []
     if fp:
-        et = ElementTree()
-        tree = et.parse(fp)
+        return list(iter_channels(fp))
+    channels = []
     for elem in tree.findall('channel'):
         channel = elem_to_channel(elem) 
         try:
@@ -156,10 +197,11 @@ def elem_to_programme(elem):
     d = {'start': elem.get('start'),
          'stop': elem.get('stop'),
          'channel': elem.get('channel'),
+         'catchup-id': elem.get('catchup-id'),
          'title': [],
          'icon': []}
 
-    set_attrs(d, elem, ('stop', 'pdc-start', 'vps-start', 'showview',
+    set_attrs(d, elem, ('catchup-id', 'stop', 'pdc-start', 'vps-start', 'showview',
                         'videoplus', 'clumpidx'))
 
     append_text(d, 'title', elem)
@@ -273,8 +315,7 @@ def read_programmes(fp=None, tree=None):
     ElementTree 'tree'
     """
     if fp:
-        et = ElementTree()
-        tree = et.parse(fp)
+        return list(iter_programmes(fp))
     return [elem_to_programme(elem) for elem in tree.findall('programme')]
 
 
@@ -286,8 +327,9 @@ def read_data(fp=None, tree=None):
     'tree'
     """
     if fp:
-        et = ElementTree()
-        tree = et.parse(fp)
+        # the attributes are on the root, stop after its start tag
+        for event, tree in iterparse(fp, events=('start',)):
+            break
 
     d = {}
     set_attrs(d, tree, ('date', 'source-info-url', 'source-info-name',
@@ -296,6 +338,246 @@ def read_data(fp=None, tree=None):
     return d
 
 
+def _iter_top(fp, tags, until=None):
+    """
+    Yield each top level element of 'fp' whose tag is in 'tags', stopping
+    at the first 'until' element. Elements are cleared from the root once
+    the caller moves on to the next one.
+    """
+    depth = 0
+    root = None
+    for event, elem in iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            if depth == 2 and elem.tag == until:
+                return
+            continue
+        depth -= 1
+        if depth == 1:
+            if elem.tag in tags:
+                yield elem
+            root.clear()
+
+def _timestamp(value):
+    """
+    _timestamp(value) -> str or None
+
+    The 'YYYYmmddHHMMSS' part of an XMLTV time or of a datetime
+    """
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime(date_format_notz)
+    return str(value)[:14]
+
+def iter_channels(fp):
+    """
+    iter_channels(fp) -> iterator
+
+    Yield channel dictionaries from the file object or filename 'fp' one at
+    a time, without building the whole tree
+    """
+    # the DTD puts every channel before the first programme
+    for elem in _iter_top(fp, ('channel',), until='programme'):
+        channel = elem_to_channel(elem)
+        try:
+            channel['icon'] = [{'src':elem.findall('icon')[0].get('src')}]
+        except:
+            channel['icon'] = ''  #temp fix
+        yield channel
+
+def iter_programmes(fp, start=None, stop=None, channels=None):
+    """
+    iter_programmes(fp, start=None, stop=None, channels=None) -> iterator
+
+    Yield programme dictionaries from the file object or filename 'fp' one
+    at a time, without building the whole tree. Only programmes airing
+    between 'start' and 'stop' (datetimes or XMLTV times, compared as the
+    file's own wall clock) and, if given, on one of 'channels' are
+    converted; the rest are skipped.
+    """
+    start = _timestamp(start)
+    stop = _timestamp(stop)
+    for elem in _iter_top(fp, ('programme',)):
+        if channels is not None and elem.get('channel') not in channels:
+            continue
+        pstart = _timestamp(elem.get('start'))
+        if stop is not None and pstart is not None and pstart > stop:
+            continue
+        if start is not None and (_timestamp(elem.get('stop')) or pstart or start) <= start:
+            continue
+        yield elem_to_programme(elem)
+
+def _epoch(value):
+    """
+    _epoch(value) -> int or None
+
+    UTC seconds of an XMLTV time, honouring a '+HHMM' offset if present
+    """
+    if not value:
+        return None
+    try:
+        seconds = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                                   int(value[8:10] or 0), int(value[10:12] or 0),
+                                   int(value[12:14] or 0), 0, 0, 0))
+    except ValueError:
+        return None
+    offset = value[14:].strip()
+    if len(offset) == 5 and offset[0] in '+-' and offset[1:].isdigit():
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        seconds += -minutes * 60 if offset[0] == '+' else minutes * 60
+    return seconds
+
+def merge_programmes(*streams):
+    """
+    merge_programmes(*streams) -> iterator
+
+    K-way merge of programme dictionary streams, each already in start
+    order as Writer saves them, into one deduplicated stream. 'streams' are
+    in priority order: when two programmes on a channel overlap, the one
+    from the earlier stream keeps the slot and the other is dropped, or cut
+    short if it starts first. Only the latest programme of each channel is
+    held back, so memory grows with the channel count, not the guide.
+    Each channel's programmes come out in start order.
+    """
+    def keyed(index, stream):
+        for seq, programme in enumerate(stream):
+            start = _epoch(programme.get('start'))
+            if start is None:
+                continue
+            stop = _epoch(programme.get('stop')) or start
+            yield start, index, seq, stop, programme
+
+    pending = {}
+    for item in heapq.merge(*[keyed(index, stream) for index, stream in enumerate(streams)]):
+        start, index, seq, stop, programme = item
+        channel = programme.get('channel')
+        last = pending.get(channel)
+        if last is not None:
+            lstart, lindex, lseq, lstop, lprogramme = last
+            if start >= lstop:
+                yield lprogramme
+            elif index < lindex:
+                if start > lstart:
+                    lprogramme['stop'] = programme['start']
+                    yield lprogramme
+            else:
+                continue
+        pending[channel] = item
+    for item in pending.values():
+        yield item[4]
+
+def merge(sources, file, pretty_print=False, data=None):
+    """
+    merge(sources, file, pretty_print=False, data=None) -> int
+
+    Merge the XMLTV files 'sources', in priority order, into one guide
+    written to 'file'. Channels are kept once, from the first source that
+    lists them, and programmes are combined by merge_programmes(). 'data'
+    holds the 'tv' attributes as read_data() returns them. Returns the
+    number of programmes written.
+    """
+    data = data or {}
+    writer = Writer(date=data.get('date'),
+                    source_info_url=data.get('source-info-url'),
+                    source_info_name=data.get('source-info-name'),
+                    generator_info_url=data.get('generator-info-url'),
+                    generator_info_name=data.get('generator-info-name'))
+    writer.open(file, pretty_print=pretty_print)
+    ids = set()
+    for source in sources:
+        for channel in iter_channels(source):
+            if channel['id'] in ids:
+                continue
+            ids.add(channel['id'])
+            writer.addChannel(channel)
+    count = 0
+    for programme in merge_programmes(*[iter_programmes(source) for source in sources]):
+        writer.addProgramme(programme)
+        count += 1
+    writer.close()
+    return count
+
+providers_property = 'xmltv.providers' # home window property listing the merged add-ons
+
+def _translate(path):
+    try: return xbmcvfs.translatePath(path)
+    except AttributeError: return xbmc.translatePath(path)
+
+def _replace(tmp, file):
+    # rename over the old file so IPTV Simple never reads a partial guide
+    if xbmcvfs.rename(tmp, file):
+        return True
+    xbmcvfs.delete(file)
+    return xbmcvfs.rename(tmp, file)
+
+def get_providers():
+    """
+    get_providers() -> list
+
+    The add-ons registered by register_provider(), in registration order,
+    as {'id', 'm3u', 'xmltv'} dictionaries.
+    """
+    try:
+        return json.loads(xbmcgui.Window(10000).getProperty(providers_property) or '[]')
+    except ValueError:
+        return []
+
+def register_provider(addon_id, m3u=None, xmltv=None):
+    """
+    register_provider(addon_id, m3u=None, xmltv=None) -> bool
+
+    Add the m3u/xmltv pair of add-on 'addon_id' to the guides
+    merge_guides() combines, or remove it when no pair is given. The first
+    registered add-on that is still enabled owns the merged pair and the
+    IPTV Simple paths; returns whether that is 'addon_id'. The others only
+    feed the owner's next merge.
+    """
+    providers = get_providers()
+    ids = [provider['id'] for provider in providers]
+    entry = {'id': addon_id, 'm3u': m3u, 'xmltv': xmltv}
+    if addon_id in ids:
+        if m3u and xmltv:
+            providers[ids.index(addon_id)] = entry
+        else:
+            del providers[ids.index(addon_id)]
+    elif m3u and xmltv:
+        providers.append(entry)
+    xbmcgui.Window(10000).setProperty(providers_property, json.dumps(providers))
+    owners = [provider['id'] for provider in providers
+              if provider['id'] == addon_id or xbmc.getCondVisibility('System.AddonIsEnabled(%s)' % provider['id'])]
+    return bool(owners) and owners[0] == addon_id
+
+def merge_guides(addon_id, m3u, xmltv, pretty_print=True, data=None):
+    """
+    merge_guides(addon_id, m3u, xmltv, pretty_print=True, data=None) -> bool
+
+    Combine the pairs of every registered provider, 'addon_id' first so it
+    keeps overlapping slots, into the m3u playlist 'm3u' and the guide
+    'xmltv'. Both are written to a '.tmp' file and renamed into place.
+    """
+    providers = get_providers()
+    providers.sort(key=lambda provider: provider['id'] != addon_id)
+    sources = [(provider['m3u'], provider['xmltv']) for provider in providers
+               if xbmcvfs.exists(provider['m3u']) and xbmcvfs.exists(provider['xmltv'])]
+    if not sources:
+        return False
+    lines = ['#EXTM3U tvg-shift="" x-tvg-url="" x-tvg-id=""']
+    for source, guide in sources:
+        fle = xbmcvfs.File(source)
+        lines.extend([line for line in fle.read().splitlines() if line and not line.startswith('#EXTM3U')])
+        fle.close()
+    fle = xbmcvfs.File('%s.tmp' % m3u, 'w')
+    fle.write('\n'.join(lines))
+    fle.close()
+    if not _replace('%s.tmp' % m3u, m3u):
+        return False
+    merge([_translate(guide) for source, guide in sources], _translate('%s.tmp' % xmltv), pretty_print=pretty_print, data=data)
+    return _replace('%s.tmp' % xmltv, xmltv)
+
+
 def indent(elem, level=0):
     """
     Indent XML for pretty printing
@@ -359,6 +641,69 @@ class Writer:
             if self.data[attr]:
                 self.root.set(attr, self.data[attr])
 
+        # streaming state, see open()
+        self.fle = None
+        self.pretty_print = False
+        self.buffer = []
+
+    def open(self, file, pretty_print=False):
+        """
+        open(file, pretty_print=False) -> None
+
+        Switch the writer to streaming mode. The XML declaration and the
+        opening 'tv' tag are written to 'file' immediately; every channel or
+        programme added afterwards is serialized and written out as soon as
+        it is added instead of being kept in the tree. Call close() (or
+        write()) to finish the document.
+        """
+        self.pretty_print = pretty_print
+        self.buffer = []
+        self.fle = xbmcvfs.File(file, "wb")
+        attrs = ''.join([' %s=%s' % (attr, quoteattr(self.root.get(attr)))
+                         for attr in self.data if self.root.get(attr)])
+        self.fle.write('<?xml version="1.0" encoding="%s"?>\n<tv%s>' % (self.encoding, attrs))
+
+    def append(self, elem):
+        """
+        append(elem) -> None
+
+        Add a top level 'channel' or 'programme' element. In streaming mode
+        the element is serialized right away and discarded.
+        """
+        if self.fle is None:
+            self.root.append(elem)
+            return
+        if self.pretty_print:
+            indent(elem, 1)
+            elem.tail = None
+            self.buffer.append('\n  ')
+        self.buffer.append(tostring(elem, encoding='utf-8', method='xml').decode('utf-8'))
+        if len(self.buffer) >= stream_buffer:
+            self.flush()
+
+    def flush(self):
+        """
+        flush() -> None
+
+        Write any buffered elements of a streaming writer to its file
+        """
+        if self.fle is not None and self.buffer:
+            self.fle.write(''.join(self.buffer))
+            self.buffer = []
+
+    def close(self):
+        """
+        close() -> None
+
+        Close the 'tv' tag and the file of a streaming writer
+        """
+        if self.fle is None:
+            return
+        self.flush()
+        self.fle.write('\n</tv>\n' if self.pretty_print else '</tv>')
+        self.fle.close()
+        self.fle = None
+
     def setattr(self, node, attr, value):
         """
         setattr(node, attr, value) -> None
@@ -431,9 +776,12 @@ class Writer:
 
         Arguments:
 
-          'programme' -- A dict representing XMLTV data
+          'programme' -- A dict representing XMLTV data, or a Programme
         """
-        p = SubElement(self.root, 'programme')
+        if isinstance(programme, Programme):
+            return self.addRecord(programme)
+
+        p = Element('programme')
 
         # programme attributes
         for attr in ('start', 'channel'):
@@ -442,8 +790,8 @@ class Writer:
             else:
                 raise ValueError("'programme' must contain '%s' attribute" % attr)
 
-        for attr in ('stop', 'pdc-start', 'vps-start', 'showview', 'videoplus', 'clumpidx'):
-            if attr in programme:
+        for attr in ('catchup-id', 'stop', 'pdc-start', 'vps-start', 'showview', 'videoplus', 'clumpidx'):
+            if programme.get(attr) is not None:
                 self.setattr(p, attr, programme[attr])
 
         for title in programme['title']:
@@ -524,11 +872,11 @@ class Writer:
                 s = SubElement(a, 'stereo')
                 self.settext(s, programme['audio']['stereo'], with_lang=False)
             if 'present' in programme['audio']:
-                p = SubElement(a, 'present')
+                ap = SubElement(a, 'present')
                 if programme['audio']['present']:
-                    self.settext(p, 'yes', with_lang=False)
+                    self.settext(ap, 'yes', with_lang=False)
                 else:
-                    self.settext(p, 'no', with_lang=False)
+                    self.settext(ap, 'no', with_lang=False)
 
         # Previously shown
         if 'previously-shown' in programme:
@@ -543,7 +891,7 @@ class Writer:
 
         # New
         if 'new' in programme:
-            n = SubElement(p, 'new')
+            SubElement(p, 'new')
 
         # Subtitles
         if 'subtitles' in programme:
@@ -587,7 +935,55 @@ class Writer:
                 v = SubElement(r, 'value')
                 self.settext(v, review['value'], with_lang=False)
 
-        
+        self.append(p)
+
+
+    def addRecord(self, programme):
+        """
+        Add a single XMLTV 'programme' from a Programme record, without the
+        key lookups addProgramme() does for a dict
+        """
+        lang = programme.lang
+        p = Element('programme', start=programme.start, channel=programme.channel)
+        if programme.stop: p.set('stop', programme.stop)
+
+        t = SubElement(p, 'title')
+        t.text = programme.title or ''
+        if lang: t.set('lang', lang)
+        for element, text in (('sub-title', programme.sub_title), ('desc', programme.desc)):
+            if text is not None:
+                e = SubElement(p, element)
+                e.text = text
+                if lang: e.set('lang', lang)
+
+        if programme.date is not None:
+            SubElement(p, 'date').text = programme.date
+
+        for category in programme.category:
+            c = SubElement(p, 'category')
+            c.text = category or ''
+            if lang: c.set('lang', lang)
+
+        if programme.length is not None:
+            SubElement(p, 'length', units='seconds').text = programme.length
+
+        if programme.icon:
+            SubElement(p, 'icon', src=programme.icon)
+
+        if programme.episode_num is not None:
+            SubElement(p, 'episode-num', system='onscreen').text = programme.episode_num
+
+        if programme.new:
+            SubElement(p, 'new')
+
+        if programme.rating is not None:
+            r = SubElement(p, 'rating')
+            if programme.rating_system: r.set('system', programme.rating_system)
+            SubElement(r, 'value').text = programme.rating
+
+        self.append(p)
+
+
     def addChannel(self, channel):
         """
         add a single XMLTV 'channel'
@@ -596,7 +992,7 @@ class Writer:
 
           'channel' -- A dict representing XMLTV data
         """
-        c = SubElement(self.root, 'channel')
+        c = Element('channel')
         self.setattr(c, 'id', channel['id'])
         
         # Display Name
@@ -613,6 +1009,8 @@ class Writer:
             for url in channel['url']:
                 u = SubElement(c, 'url')
                 self.settext(u, url, with_lang=False)
+
+        self.append(c)
         
         
     def write(self, file, pretty_print=False):
@@ -622,6 +1020,8 @@ class Writer:
         Write XML to filename of file object in 'file'. If pretty_print is
         True, the XML will contain whitespace to make it human-readable.
         """
+        if self.fle is not None:
+            return self.close()
         if pretty_print:
             indent(self.root)
         et = ElementTree(self.root).getroot()
@@ -24,13 +24,11 @@ import xbmc, xbmcgui, xbmcplugin, xbmcaddon, xbmcvfs
 
 from six.moves import urllib
 from simplecache import SimpleCache, use_cache
+from resources.lib.artcache import ArtCache
+from resources.lib.executor import Executor, CORES
+from resources.lib.guidestore import GuideStore
+from resources.lib.timings import Timer
 
-try:
-    from multiprocessing import cpu_count 
-    from multiprocessing.pool import ThreadPool 
-    ENABLE_POOL = True
-except: ENABLE_POOL = False
-        
 try:
   basestring #py2
 except NameError: #py3
@@ -54,11 +52,14 @@ CONTENT_TYPE  = 'episodes'
 USER_EMAIL    = REAL_SETTINGS.getSetting('User_Email')
 PASSWORD      = REAL_SETTINGS.getSetting('User_Password')
 DEBUG         = REAL_SETTINGS.getSetting('Enable_Debugging') == 'true'
+ENABLE_TIMER  = REAL_SETTINGS.getSetting('Enable_Timings') == 'true'
 TOKEN         = REAL_SETTINGS.getSetting('User_Token')
 FREEREFRESH   = int(REAL_SETTINGS.getSetting('Free_RefreshRate'))
 BASE_URL      = 'https://www.locast.org'
 BASE_API      = 'https://api.locastnet.org/api'
 GEO_URL       = 'http://ip-api.com/json'
+GUIDE_DB      = os.path.join(SETTINGS_LOC,'guide.db')
+ART_LOC       = os.path.join(SETTINGS_LOC,'art')
 
 MAIN_MENU     = [(LANGUAGE(30003), '' , 3),
                  (LANGUAGE(30004), '' , 4),
@@ -67,6 +68,7 @@ SCHEDULER = sched.scheduler(time.time, time.sleep)
 
 def log(msg, level=xbmc.LOGDEBUG):
     if DEBUG == False and level != xbmc.LOGERROR: return
+    if callable(msg): msg = msg()
     if level == xbmc.LOGERROR: msg += ' ,' + traceback.format_exc()
     xbmc.log('%s-%s-%s'%(ADDON_ID,ADDON_VERSION,msg), level)
     
@@ -111,6 +113,7 @@ def toBool(str):
         return str
 
 
+TIMER = Timer(ADDON_ID, ENABLE_TIMER, log)
 socket.setdefaulttimeout(TIMEOUT) 
 class Locast(object):
     def __init__(self, sysARG):
@@ -119,6 +122,9 @@ class Locast(object):
         self.cacheToDisc = True
         self.token   = (TOKEN or None)
         self.cache   = SimpleCache()
+        self.executor = Executor(CORES, log)
+        self.art      = ArtCache(ART_LOC, log=log)
+        self.guideStore = None
         self.lastDMA = 0
         self.now     = datetime.datetime.now()
         self.lat, self.lon = self.setRegion()
@@ -126,14 +132,15 @@ class Locast(object):
         if self.login(USER_EMAIL, PASSWORD) == False: sys.exit()  
 
 
+    @TIMER.timed('fetch')
     def getURL(self, url, param={}, header={}, life=datetime.timedelta(minutes=15)):
-        log('getURL, url = %s, header = %s'%(url, header))
+        log(lambda: 'getURL, url = %s, header = %s'%(url, header))
         cacheresponse = self.cache.get(ADDON_NAME + '.getURL, url = %s.%s.%s'%(url,param,header))
         if DEBUG: cacheresponse = None
         if not cacheresponse:
             try:
                 req = requests.get(url, param, headers=header)
-                cacheresponse = req.json()
+                with TIMER.span('parse'): cacheresponse = req.json()
                 req.close()
                 self.cache.set(ADDON_NAME + '.getURL, url = %s.%s.%s'%(url,param,header), json.dumps(cacheresponse), expiration=life)
                 return cacheresponse
@@ -141,17 +148,19 @@ class Locast(object):
                 log("getURL, Failed! %s"%(e), xbmc.LOGERROR)
                 notificationDialog(LANGUAGE(30001))
                 return {}
-        else: return json.loads(cacheresponse)
+        else:
+            with TIMER.span('parse'): return json.loads(cacheresponse)
 
 
+    @TIMER.timed('fetch')
     def postURL(self, url, param={}, header={}, life=datetime.timedelta(minutes=15)):
-        log('postURL, url = %s, header = %s'%(url, header))
+        log(lambda: 'postURL, url = %s, header = %s'%(url, header))
         cacheresponse = self.cache.get(ADDON_NAME + '.postURL, url = %s.%s.%s'%(url,param,header))
         if DEBUG: cacheresponse = None
         if not cacheresponse:
             try:#post
                 req = requests.post(url, param, headers=header)
-                cacheresponse = req.json()
+                with TIMER.span('parse'): cacheresponse = req.json()
                 req.close()
                 self.cache.set(ADDON_NAME + '.postURL, url = %s.%s.%s'%(url,param,header), json.dumps(cacheresponse), expiration=life)
                 return cacheresponse
@@ -159,7 +168,8 @@ class Locast(object):
                 log("postURL, Failed! %s"%(e), xbmc.LOGERROR)
                 notificationDialog(LANGUAGE(30001))
                 return {}
-        else: return json.loads(cacheresponse)
+        else:
+            with TIMER.span('parse'): return json.loads(cacheresponse)
             
             
     def buildHeader(self):
@@ -224,6 +234,25 @@ class Locast(object):
         return self.getURL(BASE_API + '/watch/epg/%s'%(city), param={'start_time':urllib.parse.quote(now)}, header=self.buildHeader(), life=datetime.timedelta(minutes=45))
         
         
+    def getGuideStore(self, city):
+        if self.guideStore is None or self.guideStore.name != str(city):
+            if self.guideStore is not None: self.guideStore.close()
+            self.guideStore = GuideStore(GUIDE_DB, lambda: self.getGuideRows(city), city, datetime.timedelta(minutes=45), log)
+        return self.guideStore
+
+
+    def getGuideRows(self, city):
+        #the epg as GuideStore rows, listings keyed by utc air time.
+        for station in self.getEPG(city):
+            listings = []
+            for listing in station.get('listings',[]):
+                try:
+                    starttime = int(str(listing['startTime'])[:-3])
+                    listings.append((starttime, starttime + listing.get('duration',0), listing))
+                except: continue
+            yield station['id'], dict([(key, value) for key, value in station.items() if key != 'listings']), listings
+
+
     def getCity(self):
         log("getCity")
         '''{u'active': True, u'DMA': u'501', u'small_url': u'https://s3.us-east-2.amazonaws.com/static.locastnet.org/cities/new-york.jpg', u'large_url': u'https://s3.us-east-2.amazonaws.com/static.locastnet.org/cities/background/new-york.jpg', u'name': u'New York'}'''
@@ -251,12 +280,13 @@ class Locast(object):
 
     def getStations(self, name, city, opt=None):
         log("getStations, name = %s, city = %s, opt = %s"%(name, city, opt))
-        stations = self.getEPG(city)
+        store    = self.getGuideStore(city)
+        stations = store.getChannels()
+        if opt == 'Live': window = store.getWindow()
         for station in stations:
             if station['active'] == False: continue
             path     = str(station['id'])
             thumb    = (station.get('logoUrl','') or station.get('logo226Url','') or ICON)
-            listings = station['listings']
             label    = (station.get('affiliateName','') or station.get('affiliate','') or station.get('callSign','') or station.get('name',''))
             stnum    = re.sub('[^\d\.]+','', label)
             if stnum:
@@ -265,10 +295,10 @@ class Locast(object):
             else: stlabel = label
             if opt == 'Live':
                 self.cacheToDisc = False
-                self.buildListings(listings, label, thumb, path, opt)
+                self.buildListings(window.get(path,[]), label, thumb, path, opt)
             elif opt == 'Lineup' and (name.lower() == stlabel.lower()):
                 self.cacheToDisc = False
-                self.buildListings(listings, label, thumb, path, opt)
+                self.buildListings(store.getProgrammes(path, start=time.time()), label, thumb, path, opt)
             elif opt == 'Lineups': 
                 chnum  = re.sub('[^\d\.]+','', label)
                 if chnum:
@@ -284,7 +314,7 @@ class Locast(object):
             
             
     def buildListings(self, listings, chname, chlogo, path, opt='uEPG'):
-        log('buildListings, chname = %s, opt = %s'%(chname,opt))
+        log(lambda: 'buildListings, chname = %s, opt = %s'%(chname,opt))
         now = datetime.datetime.now()
         for listing in listings:
             try: starttime  = datetime.datetime.fromtimestamp(int(str(listing['startTime'])[:-3]))
@@ -336,7 +366,7 @@ class Locast(object):
     def uEPG(self):
         log('uEPG')
         stations = self.getEPG(self.getRegion())
-        return urllib.parse.quote(json.dumps(list(self.poolList(self.buildStation, stations))))
+        return urllib.parse.quote(json.dumps(self.executor.map(self.buildStation, stations)))
 
 
     def buildStation(self, station):
@@ -373,18 +403,6 @@ class Locast(object):
         return newChannel
         
         
-    def poolList(self, method, items):
-        results = []
-        if ENABLE_POOL:
-            pool = ThreadPool(cpu_count())
-            results = pool.imap_unordered(method, items, chunksize=25)
-            pool.close()
-            pool.join()
-        else: results = [method(item) for item in items]
-        results = filter(None, results)
-        return results
-        
-        
     def resolveURL(self, id):
         log("resolveURL, id = %s"%(id))
         '''{u'dma': 501, u'streamUrl': u'https://acdn.locastnet.org/variant/E27GYubZwfUs.m3u8', u'name': u'WNBCDT2', u'sequence': 50, u'stationId': u'44936', u'callSign': u'4.2 COZITV', u'logo226Url': u'https://fans.tmsimg.com/assets/s78851_h3_aa.png', u'logoUrl': u'https://fans.tmsimg.com/assets/s78851_h3_aa.png', u'active': True, u'id': 1574529688491L}''' 
@@ -404,13 +422,13 @@ class Locast(object):
            
     def addLink(self, name, u, mode, infoList=False, infoArt=False, infoVideo=False, infoAudio=False, total=0):
         name = name.encode("utf-8")
-        log('addLink, name = %s'%name)
+        log(lambda: 'addLink, name = %s'%name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'True')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
         else: liz.setInfo(type="Video", infoLabels=infoList)
         if infoArt == False: liz.setArt({'thumb':ICON,'fanart':FANART})
-        else: liz.setArt(infoArt)
+        else: liz.setArt(self.art.getArt(infoArt))
         if infoVideo is not False: liz.addStreamInfo('video', infoVideo)
         if infoAudio is not False: liz.addStreamInfo('audio', infoAudio)
         u=self.sysARG[0]+"?url="+urllib.parse.quote(u)+"&mode="+str(mode)+"&name="+urllib.parse.quote(name)
@@ -420,13 +438,13 @@ class Locast(object):
 
     def addDir(self, name, u, mode, infoList=False, infoArt=False):
         name = name.encode("utf-8")
-        log('addDir, name = %s'%name)
+        log(lambda: 'addDir, name = %s'%name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'False')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
         else: liz.setInfo(type="Video", infoLabels=infoList)
         if infoArt == False: liz.setArt({'thumb':ICON,'fanart':FANART})
-        else: liz.setArt(infoArt)
+        else: liz.setArt(self.art.getArt(infoArt))
         u=self.sysARG[0]+"?url="+urllib.parse.quote(u)+"&mode="+str(mode)+"&name="+urllib.parse.quote(name)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,isFolder=True)
      
@@ -447,37 +465,45 @@ class Locast(object):
         log("URL : %s"%(url))
         log("Name: %s"%(name))
 
-        if mode==None:  self.buildMenu(self.getRegion())
-        elif mode == 1: self.getStations(name, url)
-        elif mode == 3: self.getStations(name, url, 'Live')
-        elif mode == 4: self.getStations(name, url, 'Lineups')
-        elif mode == 5: self.getStations(name, url, 'Lineup')
-        elif mode == 20: xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s)"%(self.uEPG(),urllib.parse.quote(self.sysARG[0]+"?mode=20"),"7200"))
-
-        elif mode == 9: 
-            self.playLive(name, url)
-            isPremiumUser = toBool(REAL_SETTINGS.getSetting('User_Donate'))
-            if not isPremiumUser:
-                log('Free Player Created, name=%s id=%s'%(name,url))
-                self.player = MyPlayer()
-                self.player.setID(int(url))
-                self._event = SCHEDULER.enter(FREEREFRESH,1, self.refreshStream, (name, int(url),))
-                t = threading.Thread( target = SCHEDULER.run )
-                t.start()
-
-                while(not xbmc.abortRequested and not self.player.isStopped()):
-                    xbmc.sleep(1000)
-
-                for event in SCHEDULER.queue:
-                    SCHEDULER.cancel(event)
-                log('Free Player Terminated, name=%s id=%s'%(name,url))
-
-        xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=self.cacheToDisc)
+        if mode == 99: return xbmcgui.Dialog().textviewer(ADDON_NAME, TIMER.summary())
+        TIMER.begin(mode)
+        try:
+            if mode==None:  self.buildMenu(self.getRegion())
+            elif mode == 1: self.getStations(name, url)
+            elif mode == 3: self.getStations(name, url, 'Live')
+            elif mode == 4: self.getStations(name, url, 'Lineups')
+            elif mode == 5: self.getStations(name, url, 'Lineup')
+            elif mode == 20: xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s)"%(self.uEPG(),urllib.parse.quote(self.sysARG[0]+"?mode=20"),"7200"))
+
+            elif mode == 9: 
+                self.playLive(name, url)
+                isPremiumUser = toBool(REAL_SETTINGS.getSetting('User_Donate'))
+                if not isPremiumUser:
+                    log('Free Player Created, name=%s id=%s'%(name,url))
+                    self.player = MyPlayer()
+                    self.player.setID(int(url))
+                    self._event = SCHEDULER.enter(FREEREFRESH,1, self.refreshStream, (name, int(url),))
+                    t = threading.Thread( target = SCHEDULER.run )
+                    t.start()
+
+                    while(not xbmc.abortRequested and not self.player.isStopped()):
+                        xbmc.sleep(1000)
+
+                    for event in SCHEDULER.queue:
+                        SCHEDULER.cancel(event)
+                    log('Free Player Terminated, name=%s id=%s'%(name,url))
+
+            xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
+            with TIMER.span('directory'): xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=self.cacheToDisc)
+        finally:
+            self.executor.close()
+            if self.guideStore is not None: self.guideStore.close()
+            TIMER.end()
+            self.art.close()
         
         
     def refreshStream(self, name, id):
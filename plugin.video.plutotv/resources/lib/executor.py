@@ -0,0 +1,74 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of PlutoTV.
+#
+# PlutoTV is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PlutoTV is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PlutoTV.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+from kodi_six import xbmc
+
+try:
+    from multiprocessing import cpu_count
+    from multiprocessing.pool import ThreadPool
+    ENABLE_POOL = True
+    CORES = cpu_count()
+except:
+    ENABLE_POOL = False
+    CORES = 1
+
+class Executor(object):
+    """
+    A reusable thread pool. Tasks must not touch shared state or the Kodi
+    UI; each returns a result which map() hands back to the calling thread
+    for merging.
+    """
+    def __init__(self, workers=CORES, log=None):
+        self.workers = max(1, workers)
+        self.log     = log
+        self.pool    = None
+
+
+    def getPool(self):
+        if self.pool is None and ENABLE_POOL and self.workers > 1:
+            self.pool = ThreadPool(self.workers)
+        return self.pool
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+    def call(self, method, item):
+        try: return method(item)
+        except Exception as e:
+            if self.log: self.log('Executor, %s failed! %s'%(getattr(method,'__name__',method),e), xbmc.LOGERROR)
+
+
+    def map(self, method, items):
+        """
+        map(method, items) -> list
+
+        Run 'method' over 'items' and return, in the order of 'items',
+        every result that is not None. A task that raises is logged and
+        left out.
+        """
+        items = list(items)
+        pool  = self.getPool()
+        if pool is None or len(items) < 2: results = [self.call(method, item) for item in items]
+        else: results = pool.map(lambda item: self.call(method, item), items)
+        return [result for result in results if result is not None]
\ No newline at end of file
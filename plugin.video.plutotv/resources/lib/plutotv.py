@@ -17,21 +17,20 @@
 # along with PlutoTV.  If not, see <http://www.gnu.org/licenses/>.
 
 # -*- coding: utf-8 -*-
-import os, sys, time, _strptime, datetime, re, traceback, uuid
-import json, collections, inputstreamhelper, requests
+import os, sys, time, _strptime, datetime, calendar, re, traceback, uuid, threading
+import json, collections, hashlib, heapq, inputstreamhelper, requests
 
 from itertools     import repeat, cycle, chain, zip_longest
 from resources.lib import xmltv
+from resources.lib.artcache import ArtCache
+from resources.lib.executor import Executor
+from resources.lib.guidestore import GuideStore
+from resources.lib.timings import Timer
 from simplecache   import SimpleCache, use_cache
 from six.moves     import urllib
 from kodi_six      import xbmc, xbmcaddon, xbmcplugin, xbmcgui, xbmcvfs, py2_encode, py2_decode
 
-try:
-    from multiprocessing import cpu_count 
-    from multiprocessing.pool import ThreadPool 
-    ENABLE_POOL = True
-    CORES = cpu_count()
-except: ENABLE_POOL = False
+from requests.adapters import HTTPAdapter
 
 PY2 = sys.version_info[0] == 2
 PY3 = sys.version_info[0] == 3
@@ -55,18 +54,33 @@ MONITOR       = xbmc.Monitor()
 LOGO          = os.path.join('special://home/addons/%s/'%(ADDON_ID),'resources','images','logo.png')
 LANG          = 'en' #todo
 TIMEOUT       = 30
+HTTP_WORKERS  = 4 #concurrent requests, each worker keeps its own session
+GUIDE_CHUNK   = 1 #hours per guide request
 CONTENT_TYPE  = 'episodes'
 DISC_CACHE    = False
 MY_MONITOR    = xbmc.Monitor()
 DTFORMAT      = '%Y%m%d%H%M%S'
+TIME_CACHE    = {} #parsed and formatted guide timestamps
+CACHE_LIMIT   = 20000 #entries before TIME_CACHE or CLEAN_CACHE is dropped
+CLEAN_CACHE   = {} #cleaned titles and descriptions, they repeat across the guide days
+CLEAN_TABLE   = dict.fromkeys([idx for idx in range(32) if chr(idx) not in '\n\r\t']) #control characters cleanString drops
+ISO_FORMATS   = ('%Y-%m-%dT%H:%M:%S.%fZ','%Y-%m-%dT%H:%M:00.000Z','%Y-%m-%dT%H:%MZ','%Y-%m-%dT%H:%M:%SZ','%Y-%m-%d')
 PVR_CLIENT    = 'pvr.iptvsimple'
 DEBUG         = REAL_SETTINGS.getSettingBool('Enable_Debugging')
+ENABLE_TIMER  = REAL_SETTINGS.getSettingBool('Enable_Timings')
 USER_PATH     = REAL_SETTINGS.getSetting('User_Folder')
 DIRECT_URL    = REAL_SETTINGS.getSettingBool('Direct_URL')
 ENABLE_CONFIG = REAL_SETTINGS.getSettingBool('Enable_Config')
 USE_COLOR     = REAL_SETTINGS.getSettingBool('Use_Color_Logos')
+MERGE_GUIDES  = REAL_SETTINGS.getSettingBool('Merge_Guides')
+GUIDE_HOURS   = int(REAL_SETTINGS.getSetting('Guide_Hours') or 4)
 M3U_FILE      = os.path.join(USER_PATH,'plutotv.m3u')
 XMLTV_FILE    = os.path.join(USER_PATH,'plutotv.xml')
+MERGE_M3U     = os.path.join(USER_PATH,'livetv.m3u')
+MERGE_XMLTV   = os.path.join(USER_PATH,'livetv.xml')
+GUIDE_STATE   = os.path.join(SETTINGS_LOC,'guide.json')
+GUIDE_DB      = os.path.join(SETTINGS_LOC,'guide.db')
+ART_LOC       = os.path.join(SETTINGS_LOC,'art')
 GUIDE_URL     = 'https://service-channels.clusters.pluto.tv/v1/guide?start=%s&stop=%s&%s'
 BASE_API      = 'https://api.pluto.tv'
 BASE_LINEUP   = BASE_API + '/v2/channels.json?%s'
@@ -127,9 +141,50 @@ def notificationProgress(message, header=ADDON_NAME, time=4):
         dia = ProgressBGDialog((((i + 1) * 100)//time),control=dia,header=header)
     return ProgressBGDialog(100,control=dia)
     
+def parseISO(datestring):
+    #slice 'YYYY-MM-DD[THH:MM[:SS[.fff]]][Z]' directly, strptime is far slower and not thread safe.
+    fields = [int(datestring[0:4]), int(datestring[5:7]), int(datestring[8:10])]
+    if datestring[4:5] != '-' or datestring[7:8] != '-': raise ValueError(datestring)
+    tail = datestring[10:]
+    if tail and tail != 'Z':
+        if tail[0] != 'T' or tail[3:4] != ':': raise ValueError(datestring)
+        fields.extend([int(tail[1:3]), int(tail[4:6])])
+        tail = tail[6:]
+        if tail[:1] == ':':
+            fields.append(int(tail[1:3]))
+            tail = tail[3:]
+            if tail[:1] == '.':
+                frac = tail[1:].rstrip('Z')
+                fields.append(int(frac[:6].ljust(6,'0')))
+                tail = tail[len(frac)+1:]
+        if tail not in ('','Z'): raise ValueError(datestring)
+    return datetime.datetime(*fields)
+
 def strpTime(datestring, format='%Y-%m-%dT%H:%M:%S.%fZ'):
-    try: return datetime.datetime.strptime(datestring, format)
-    except TypeError: return datetime.datetime.fromtimestamp(time.mktime(time.strptime(datestring, format)))
+    key = (datestring, format)
+    try: return TIME_CACHE[key]
+    except (KeyError, TypeError): pass
+    try:
+        if format not in ISO_FORMATS: raise ValueError(format)
+        value = parseISO(datestring)
+    except (ValueError, TypeError):
+        try: value = datetime.datetime.strptime(datestring, format)
+        except TypeError: value = datetime.datetime.fromtimestamp(time.mktime(time.strptime(datestring, format)))
+    if len(TIME_CACHE) >= CACHE_LIMIT: TIME_CACHE.clear()
+    TIME_CACHE[key] = value
+    return value
+
+def strfTime(datestring, format='%Y-%m-%dT%H:%M:%S.%fZ', outformat=xmltv.date_format):
+    #guide timeline boundaries repeat across channels, memoize the formatted string as well.
+    key = (datestring, format, outformat)
+    try: return TIME_CACHE[key]
+    except (KeyError, TypeError): pass
+    value = strpTime(datestring, format).strftime(outformat)
+    TIME_CACHE[key] = value
+    return value
+
+def getEpoch(datestring, format='%Y-%m-%dT%H:%M:%S.%fZ'):
+    return calendar.timegm(strpTime(datestring, format).timetuple())
 
 def timezone():
     if time.localtime(time.time()).tm_isdst and time.daylight: return time.altzone / -(60*60) * 100
@@ -140,9 +195,9 @@ def getLocalTime():
     return time.time() + offset.total_seconds()
         
 def log(msg, level=xbmc.LOGDEBUG):
-    try:   msg = str(msg)
-    except Exception as e: 'log str failed! %s'%(str(e))
     if not DEBUG and level != xbmc.LOGERROR: return
+    try:   msg = str(msg() if callable(msg) else msg)
+    except Exception as e: 'log str failed! %s'%(str(e))
     try:   xbmc.log('%s-%s-%s'%(ADDON_ID,ADDON_VERSION,msg),level)
     except Exception as e: 'log failed! %s'%(e)
      
@@ -153,6 +208,30 @@ def slugify(text):
     text = u'_'.join(re.split(r'\s+', text))
     return text
 
+ID_NAMESPACE = slugify(ADDON_NAME) #channel ids are '<number>@<namespace>' in both the m3u and the xmltv
+CHANNEL_IDS  = {}
+def getChannelID(number):
+    #one interned id per channel, shared by its m3u line, its xmltv channel and every programme on it.
+    try: return CHANNEL_IDS[number]
+    except KeyError:
+        chid = CHANNEL_IDS[number] = sys.intern('%s@%s'%(number,ID_NAMESPACE))
+        return chid
+
+SESSIONS = threading.local()
+def getSession():
+    #one keep-alive session per thread, a requests.Session is not safe to share between the executor's workers.
+    session = getattr(SESSIONS, 'session', None)
+    if session is None:
+        session = SESSIONS.session = requests.Session()
+        adapter = HTTPAdapter(max_retries=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Accept-Encoding':'gzip, deflate','Connection':'keep-alive'})
+    return session
+
+def getFingerprint(item):
+    return hashlib.md5(json.dumps(item, sort_keys=True).encode('utf-8')).hexdigest()
+
 def getFavorites():
     return json.loads((REAL_SETTINGS.getSetting('favorites') or '{"favorites":[]}')).get('favorites',[])
      
@@ -173,6 +252,7 @@ def delFavorite(chname, chnumber):
         REAL_SETTINGS.setSetting('favorites',json.dumps({"favorites":favorites}))
         notificationDialog(LANGUAGE(30037)%(chname))
      
+TIMER = Timer(ADDON_ID, ENABLE_TIMER, log)
 class Service(object):
     def __init__(self, sysARG=sys.argv):
         self.running   = False
@@ -214,23 +294,32 @@ class PlutoTV(object):
         self.myMonitor = MONITOR
         self.sysARG    = sysARG
         self.cache     = SimpleCache()
+        self.executor  = Executor(HTTP_WORKERS, log)
+        self.art       = ArtCache(ART_LOC, log=log)
         self.m3uList   = []
         self.xmltvList = {'data'       : self.getData(),
                           'channels'   : [],
                           'programmes' : []}
+        self.guideState  = None
+        self.guideBlocks = {}
+        self.guideStore  = GuideStore(GUIDE_DB, self.getGuideRows, log=log)
                           
             
     def reset(self):
+        self.executor.close()
+        self.art.close()
+        self.guideStore.close()
         self.__init__()
         
             
+    @TIMER.timed('fetch')
     def getURL(self, url, param={}, header={'User-agent': 'Mozilla/5.0 (Windows NT 6.2; rv:24.0) Gecko/20100101 Firefox/24.0'}, life=datetime.timedelta(minutes=15)):
-        log('getURL, url = %s, header = %s'%(url, header))
+        log(lambda: 'getURL, url = %s, header = %s'%(url, header))
         cacheresponse = self.cache.get('%s.getURL, url = %s.%s.%s'%(ADDON_NAME,url,param,header))
         if not cacheresponse:
             try:
-                req = requests.get(url, param, headers=header)
-                cacheresponse = req.json()
+                req = getSession().get(url, params=param, headers=header, timeout=TIMEOUT)
+                with TIMER.span('parse'): cacheresponse = req.json()
                 req.close()
             except Exception as e: 
                 log("getURL, Failed! %s"%(e), xbmc.LOGERROR)
@@ -241,7 +330,7 @@ class PlutoTV(object):
             except: pass
             return cacheresponse
         else: 
-            return json.loads(cacheresponse)
+            with TIMER.span('parse'): return json.loads(cacheresponse)
 
       
     def buildHeader(self):
@@ -277,10 +366,64 @@ class PlutoTV(object):
         
 
     def getGuidedata(self, full=False):
+        if full: return self.getGuideChunks(datetime.datetime.fromtimestamp(getLocalTime()))
         start = (datetime.datetime.fromtimestamp(getLocalTime()).strftime('%Y-%m-%dT%H:00:00Z'))
-        stop  = (datetime.datetime.fromtimestamp(getLocalTime()) + datetime.timedelta(hours=4)).strftime('%Y-%m-%dT%H:00:00Z')
-        if full: return self.getURL(GUIDE_URL %(start,stop,LANGUAGE(30022)%(getUUID())), life=datetime.timedelta(hours=1))
-        else: return sorted((self.getURL(BASE_GUIDE %(start,stop,LANGUAGE(30022)%(getUUID())), life=datetime.timedelta(hours=1))), key=lambda i: i['number'])
+        stop  = (datetime.datetime.fromtimestamp(getLocalTime()) + datetime.timedelta(hours=GUIDE_HOURS)).strftime('%Y-%m-%dT%H:00:00Z')
+        return sorted((self.getURL(BASE_GUIDE %(start,stop,LANGUAGE(30022)%(getUUID())), life=datetime.timedelta(hours=1))), key=lambda i: i['number'])
+
+
+    def getGuideSection(self, name, opt=None):
+        #load only the channels and time window the listing renders.
+        if name == 'lineup':
+            channel = self.guideStore.getChannel(opt)
+            if channel is None: return []
+            return [dict(channel, timelines=self.guideStore.getProgrammes(opt, start=time.time()))]
+        elif name == 'channels': 
+            return self.guideStore.getChannels()
+        elif name.startswith('live'):
+            window = self.guideStore.getWindow()
+            return [dict(channel, timelines=window.get(channel.get('_id',''),[])) for channel in self.guideStore.getChannels()]
+        return self.getGuidedata()
+
+
+    def getGuideRows(self):
+        #the guide as GuideStore rows, programmes keyed by utc air time.
+        for channel in self.getGuidedata():
+            programmes = []
+            for program in channel.get('timelines',[]):
+                try:    programmes.append((getEpoch(program['start']), getEpoch(program['stop']), program))
+                except: log(lambda: 'getGuideRows, invalid airtime %s'%(program.get('_id','')))
+            yield channel.get('_id',''), dict([(key, value) for key, value in channel.items() if key != 'timelines']), programmes
+
+
+    def getGuideChunk(self, window):
+        start, stop = window
+        return self.getURL(GUIDE_URL %(start.strftime('%Y-%m-%dT%H:00:00Z'),stop.strftime('%Y-%m-%dT%H:00:00Z'),LANGUAGE(30022)%(getUUID())), life=datetime.timedelta(hours=1))
+
+
+    def getGuideChunks(self, now, hours=GUIDE_HOURS, chunk=GUIDE_CHUNK):
+        #fetch the guide in hour windows concurrently; windows already fetched by the last refresh come from cache.
+        log('getGuideChunks, hours = %s, chunk = %s'%(hours,chunk))
+        windows  = [(now + datetime.timedelta(hours=hour), now + datetime.timedelta(hours=min(hour + chunk, hours))) for hour in range(0, hours, chunk)]
+        guide    = {}
+        channels = collections.OrderedDict()
+        seen     = {}
+        for data in self.executor.map(self.getGuideChunk, windows):
+            for key, value in data.items():
+                if key != 'channels': guide.setdefault(key, value)
+            for channel in data.get('channels',[]):
+                chid = channel.get('_id','') or channel.get('number','')
+                if chid not in channels:
+                    channels[chid] = channel.copy()
+                    channels[chid]['timelines'] = []
+                    seen[chid] = set()
+                #programmes that straddle a window boundary are returned by both windows.
+                for program in channel.get('timelines',[]):
+                    if program.get('start','') in seen[chid]: continue
+                    seen[chid].add(program.get('start',''))
+                    channels[chid]['timelines'].append(program)
+        guide['channels'] = list(channels.values())
+        return guide
 
         
     def getCategories(self):
@@ -305,10 +448,9 @@ class PlutoTV(object):
         
     def buildGuide(self, data):
         channel, name, opt = data
-        log('buildGuide, name=%s,opt=%s'%(name, opt))
+        log(lambda: 'buildGuide, name=%s,opt=%s'%(name, opt))
         urls      = []
-        guidedata = []
-        newChannel= {}
+        listing   = []
         mtype     = 'video'
         chid      = channel.get('_id','')
         chname    = channel.get('name','')
@@ -359,7 +501,7 @@ class PlutoTV(object):
                     label = 'Season %s'%(season['number'])
                     infoLabels = {"mediatype":mtype,"label":label,"label2":label,"title":chname,"plot":chplot, "code":chid, "genre":[chcat]}
                     infoArt    = {"thumb":vodlogo,"poster":vodlogo,"fanart":vodfanart,"icon":vodlogo,"logo":vodlogo,"clearart":chthumb}
-                    self.addDir(label, chid, 5, infoLabels, infoArt)
+                    listing.append((True, (label, chid, 5, infoLabels, infoArt)))
             else:
                 if name == 'ondemand': 
                     mode  = 3
@@ -369,12 +511,8 @@ class PlutoTV(object):
                     label = '%s| %s'%(chnum,chname)
                 infoLabels = {"mediatype":mtype,"label":label,"label2":label,"title":label,"plot":chplot, "code":chid, "genre":[chcat]}
                 infoArt    = {"thumb":chthumb,"poster":chthumb,"fanart":chfanart,"icon":chlogo,"logo":chlogo,"clearart":chthumb}
-                self.addDir(label, chid, mode, infoLabels, infoArt)
+                listing.append((True, (label, chid, mode, infoLabels, infoArt)))
         else:
-            newChannel['channelname']   = chname
-            newChannel['channelnumber'] = chnum
-            newChannel['channellogo']   = chlogo
-            newChannel['isfavorite']    = favorite
             urls = channel.get('stitched',{}).get('urls',[])
             if not timelines:
                 name = 'ondemand'
@@ -487,37 +625,32 @@ class PlutoTV(object):
                         urls  = 'NEXT_SHOW'
                     epname = label
 
-                tmpdata = {"mediatype":mtype,"label":label,"title":label,'duration':epdur,'plot':epplot,'genre':[epgenre],'season':epseason,'episode':epnumber}
-                tmpdata['starttime'] = time.mktime((start).timetuple())
-                tmpdata['url'] = self.sysARG[0]+'?mode=9&name=%s&url=%s'%(title,urls)
-                tmpdata['art'] = {"thumb":thumb,"poster":epposter,"fanart":epfanart,"icon":chlogo,"logo":chlogo,"clearart":chthumb}
-                guidedata.append(tmpdata)
-                
                 if name == 'ondemand' and type == "series":
                     mtype = 'season'
                     infoLabels = {"mediatype":mtype,"label":label,"label2":label,"title":label,"plot":epplot, "code":chid, "genre":[epgenre]}
                     infoArt    = {"thumb":epthumb,"poster":epposter,"fanart":epfanart,"icon":chlogo,"logo":chlogo,"clearart":chthumb}
-                    self.addDir(label, epid, 4, infoLabels, infoArt)
+                    listing.append((True, (label, epid, 4, infoLabels, infoArt)))
                 elif name != 'guide':
                     infoLabels = {"favorite":favorite,"chnum":chnum,"chname":chname,"mediatype":mtype,"label":label,"label2":label,"tvshowtitle":tvtitle,"title":epname,"plot":epplot, "code":epid, "genre":[epgenre], "duration":epdur,'season':epseason,'episode':epnumber}
                     infoArt    = {"thumb":thumb,"poster":epposter,"fanart":epfanart,"icon":chlogo,"logo":chlogo,"clearart":chthumb}
-                    self.addLink(title, urls, 9, infoLabels, infoArt)
+                    listing.append((False, (title, urls, 9, infoLabels, infoArt)))
                     
             CONTENT_TYPE = '%ss'%mtype
-            if len(guidedata) > 0:
-                newChannel['guidedata'] = guidedata
-                return newChannel
+        return tuple(listing)
         
 
     def browseGuide(self, name, opt=None, data=None):
         log('browseGuide, name=%s, opt=%s'%(name,opt))
         self.chnums = []
-        if data is None: data = self.getGuidedata()
         if opt == 'categories': 
             opt  = name
             name = 'categories'
-            data = self.getGuidedata(full=True).get('categories',[])
-        self.poolList(self.buildGuide, zip(data,repeat(name.lower()),repeat(opt)))
+            data = self.guideStore.getChannels()
+        if data is None: data = self.getGuideSection(name.lower(), opt)
+        for listing in self.executor.map(self.buildGuide, zip(data,repeat(name.lower()),repeat(opt))):
+            for isFolder, item in listing:
+                if isFolder: self.addDir(*item)
+                else:        self.addLink(*item)
              
              
     def browseLineup(self, name, opt=None):
@@ -595,7 +728,7 @@ class PlutoTV(object):
 
            
     def addLink(self, name, u, mode, infoList=False, infoArt=False, total=0):
-        log('addLink, name = %s'%name)
+        log(lambda: 'addLink, name = %s'%name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'true') 
         
@@ -608,19 +741,19 @@ class PlutoTV(object):
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
         else: liz.setInfo(type="Video", infoLabels=infoList)
         if infoArt == False: liz.setArt({'thumb':ICON,'fanart':FANART})
-        else: liz.setArt(infoArt)
+        else: liz.setArt(self.art.getArt(infoArt))
         u=self.sysARG[0]+"?url="+urllib.parse.quote(u)+"&mode="+str(mode)+"&name="+urllib.parse.quote(name)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,totalItems=total)
 
 
     def addDir(self, name, u, mode, infoList=False, infoArt=False):
-        log('addDir, name = %s'%name)
+        log(lambda: 'addDir, name = %s'%name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'false')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name} )
         else: liz.setInfo(type="Video", infoLabels=infoList)
         if infoArt == False: liz.setArt({'thumb':ICON,'fanart':FANART})
-        else: liz.setArt(infoArt)
+        else: liz.setArt(self.art.getArt(infoArt))
         u=self.sysARG[0]+"?url="+urllib.parse.quote(u)+"&mode="+str(mode)+"&name="+urllib.parse.quote(name)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,isFolder=True)
 
@@ -634,15 +767,54 @@ class PlutoTV(object):
                 'source-info-url'     : self.cleanString(ADDON_ID)}
 
 
+    def loadState(self):
+        log('loadState')
+        try:
+            fle   = xbmcvfs.File(GUIDE_STATE)
+            state = json.loads(fle.read())
+            fle.close()
+            if state.get('version','') == ADDON_VERSION: return state
+        except Exception as e: log('loadState, no previous guide state %s'%(e))
+        return {'version':ADDON_VERSION,'files':{},'channels':{}}
+
+
+    def saveState(self):
+        log('saveState')
+        if self.guideState is None: return False
+        self.guideState['channels'] = self.guideBlocks
+        if not xbmcvfs.exists(SETTINGS_LOC): xbmcvfs.mkdirs(SETTINGS_LOC)
+        return self.saveFile(GUIDE_STATE, json.dumps(self.guideState))
+
+
+    def saveFile(self, file, data):
+        tmp = '%s.tmp'%(file)
+        fle = xbmcvfs.File(tmp, 'w')
+        fle.write(data)
+        fle.close()
+        return self.replaceFile(tmp, file)
+
+
+    def replaceFile(self, tmp, file):
+        #rename over the old file so IPTV Simple never reads a partial guide.
+        if xbmcvfs.rename(tmp, file): return True
+        xbmcvfs.delete(file)
+        return xbmcvfs.rename(tmp, file)
+
+
     def save(self, reset=True):
         log('save')
+        if self.guideState is None: self.guideState = self.loadState()
+        files = self.guideState['files']
         if len(self.m3uList) > 0:
-            log('save, saving m3u to %s'%(M3U_FILE))
-            fle = xbmcvfs.File(M3U_FILE, 'w')
             if not self.m3uList[0].startswith('#EXTM3U'):
                 self.m3uList.insert(0,'#EXTM3U tvg-shift="" x-tvg-url="" x-tvg-id=""')
-            fle.write('\n'.join([item for item in self.m3uList]))
-            fle.close()
+            m3u = '\n'.join([item for item in self.m3uList])
+            checksum = getFingerprint(m3u)
+            if checksum == files.get('m3u') and xbmcvfs.exists(M3U_FILE):
+                log('save, m3u unchanged')
+            else:
+                log('save, saving m3u to %s'%(M3U_FILE))
+                if self.saveFile(M3U_FILE, m3u): files['m3u'] = checksum
         
         data   = self.xmltvList['data']
         writer = xmltv.Writer(encoding=xmltv.locale, date=data['date'],
@@ -652,12 +824,18 @@ class PlutoTV(object):
                               generator_info_name = data['generator-info-name'])
                
         channels = self.sortChannels(self.xmltvList['channels'])
-        if len(channels) > 0:
+        checksum = getFingerprint(sorted([block['fingerprint'] for block in self.guideBlocks.values()]))
+        if checksum == files.get('xmltv') and xbmcvfs.exists(XMLTV_FILE):
+            log('save, xmltv unchanged')
+        elif len(channels) > 0:
+            log('save, saving xmltv to %s'%(XMLTV_FILE))
+            writer.open('%s.tmp'%(XMLTV_FILE), pretty_print=True)
             for channel in channels: writer.addChannel(channel)
             programmes = self.sortProgrammes(self.xmltvList['programmes'])
             for program in programmes: writer.addProgramme(program)
-            log('save, saving xmltv to %s'%(XMLTV_FILE))
-            writer.write(XMLTV_FILE, pretty_print=True)
+            writer.close()
+            if self.replaceFile('%s.tmp'%(XMLTV_FILE), XMLTV_FILE): files['xmltv'] = checksum
+        self.saveState()
         return True
         
         
@@ -667,25 +845,46 @@ class PlutoTV(object):
         return channels
 
 
-    def sortProgrammes(self, programmes=None):
-        programmes.sort(key=lambda x:x['channel'])
-        programmes.sort(key=lambda x:x['start'])
-        log('sortProgrammes, programmes = %s'%(len(programmes)))
-        return programmes
+    def sortProgrammes(self, runs=None):
+        #runs are each channel's programmes, built in start order; merging them in channel order is a linear pass.
+        runs = [(run if all(prev.start <= item.start for prev, item in zip(run, run[1:])) else sorted(run, key=lambda x:x.start)) for run in runs if run]
+        runs.sort(key=lambda run:run[0].channel)
+        log('sortProgrammes, programmes = %s'%(sum([len(run) for run in runs])))
+        return heapq.merge(*runs, key=lambda x:x.start)
 
 
     def buildService(self):
         log('buildService')
         self.reset()
+        self.guideState = self.loadState()
         channels = self.getChannels()
-        [self.buildM3U(channel) for channel in channels]
+        self.m3uList.extend([line for line in [self.buildM3U(channel) for channel in channels] if line])
         guidedata = self.getGuidedata(full=True).get('channels',[])
-        # if self.poolList(self.buildXMLTV, guidedata):
-        for data in guidedata:
-            self.buildXMLTV(data)
+        for key, block in self.executor.map(self.buildXMLTV, guidedata):
+            self.guideBlocks[key] = block
+            self.xmltvList['channels'].append(block['channel'])
+            self.xmltvList['programmes'].append([pitem for pfingerprint, pitem in block['programmes']])
         self.save()
+        self.executor.close()
+        if not self.mergeGuides(): return True #another add-on owns the merged guide and the IPTV Simple paths
         self.chkSettings()
         return True
+
+
+    def getGuideFiles(self):
+        #the m3u/xmltv pair IPTV Simple loads.
+        if MERGE_GUIDES: return MERGE_M3U, MERGE_XMLTV
+        return M3U_FILE, XMLTV_FILE
+
+
+    def mergeGuides(self):
+        #-> False when another merging add-on owns the merged pair, it picks up ours on its next refresh.
+        if not MERGE_GUIDES:
+            xmltv.register_provider(ADDON_ID)
+            return True
+        if not xmltv.register_provider(ADDON_ID, M3U_FILE, XMLTV_FILE): return False
+        log('mergeGuides, merged = %s'%(xmltv.merge_guides(ADDON_ID, MERGE_M3U, MERGE_XMLTV, data=self.xmltvList['data'])))
+        return True
         
         
     def getPVR(self):
@@ -702,27 +901,29 @@ class PlutoTV(object):
         if ENABLE_CONFIG:
             addon = self.getPVR()
             if addon is None: return
+            m3u, xml = self.getGuideFiles()
             check = [addon.getSetting('catchupEnabled')         == 'true',
                      addon.getSetting('m3uRefreshMode')         == '1',
                      addon.getSetting('m3uRefreshIntervalMins') == '5',
                      addon.getSetting('logoFromEpg')            == '1',
                      addon.getSetting('m3uPathType')            == '0',
-                     addon.getSetting('m3uPath')                == M3U_FILE,
+                     addon.getSetting('m3uPath')                == m3u,
                      addon.getSetting('epgPathType')            == '0',
-                     addon.getSetting('epgPath')                == XMLTV_FILE]
+                     addon.getSetting('epgPath')                == xml]
             if False in check: self.configurePVR()
         
         
     def configurePVR(self):
         addon = self.getPVR()
+        m3u, xml = self.getGuideFiles()
         addon.setSetting('catchupEnabled'        , 'true')
         addon.setSetting('m3uRefreshMode'        , '1')
         addon.setSetting('m3uRefreshIntervalMins', '5')
         addon.setSetting('logoFromEpg'           , '1')
         addon.setSetting('m3uPathType'           , '0')
-        addon.setSetting('m3uPath'               , M3U_FILE)
+        addon.setSetting('m3uPath'               , m3u)
         addon.setSetting('epgPathType'           , '0')
-        addon.setSetting('epgPath'               , XMLTV_FILE)
+        addon.setSetting('epgPath'               , xml)
         
         
     def buildM3U(self, channel):
@@ -755,88 +956,97 @@ class PlutoTV(object):
         else:
             urls = 'plugin://%s/?mode=9&name=%s&url=%s'%(ADDON_ID,urllib.parse.quote(self.cleanString(channel['name'])),urllib.parse.quote(urls))
             
-        self.m3uList.append(litem%(channel['number'],'%s@%s'%(channel['number'],slugify(ADDON_NAME)),channel['name'],logo,';'.join(list(set(group))),str(radio).lower(),vod,channel['name'],urls))
-        return True
+        return litem%(channel['number'],getChannelID(channel['number']),channel['name'],logo,';'.join(sorted(set(group))),str(radio).lower(),vod,channel['name'],urls)
         
         
     def buildXMLTV(self, channel):
-        self.addChannel(channel)
-        for program in  channel.get('timelines',[]): 
-            self.addProgram(channel, program)
-        return True
+        #reuse the previous run's xmltv items for channels whose metadata and timeline did not change.
+        key         = channel.get('_id','') or str(channel['number'])
+        fingerprint = getFingerprint(channel)
+        block       = self.guideState['channels'].get(key,{})
+        cached      = dict([(pfingerprint, self.loadProgram(pitem)) for pfingerprint, pitem in block.get('programmes',[])])
+        if block.get('fingerprint','') == fingerprint and all(cached.values()):
+            log('buildXMLTV, reusing %s'%(key))
+            return key, dict(block, programmes=[(pfingerprint, cached[pfingerprint]) for pfingerprint, pitem in block['programmes']])
+            
+        programmes = []
+        for program in channel.get('timelines',[]): 
+            pfingerprint = getFingerprint([channel['number'], program])
+            pitem = cached.get(pfingerprint) or self.addProgram(channel, program)
+            programmes.append((pfingerprint, pitem))
+        return key, {'fingerprint':fingerprint,'channel':self.addChannel(channel),'programmes':programmes}
         
         
+    def loadProgram(self, pitem):
+        #programme records round trip through guide.json as plain lists.
+        if not isinstance(pitem, list): return None
+        try: return xmltv.Programme(*pitem)
+        except TypeError: return None
+
+
     def addChannel(self, channel):
         logo  = [logo.get('url',ICON) for logo in channel.get('images',[]) if logo.get('type','') == 'logo'][0]
-        citem = ({'id'           : '%s@%s'%(channel['number'],slugify(ADDON_NAME)),
+        citem = ({'id'           : getChannelID(channel['number']),
                   'display-name' : [(self.cleanString(channel['name']), LANG)],
                   'icon'         : [{'src':logo}]})
-        log('addChannel = %s'%(citem))
-        self.xmltvList['channels'].append(citem)
-        return True
+        log(lambda: 'addChannel = %s'%(citem))
+        return citem
 
 
     def addProgram(self, channel, program):
         episode = program.get('episode',{})
         series  = episode.get('series',{})
         uri     = episode.get('_id','')
-        pitem   = {'channel'     : '%s@%s'%(channel['number'],slugify(ADDON_NAME)),
-                   'category'    : [(self.cleanString(episode.get('genre','Undefined')),LANG)],
-                   'title'       : [(self.cleanString(program['title']), LANG)],
-                   'desc'        : [((self.cleanString(episode.get('description','')) or xbmc.getLocalizedString(161)), LANG)],
-                   'stop'        : (strpTime(program['stop'] ,'%Y-%m-%dT%H:%M:%S.%fZ')).strftime(xmltv.date_format),
-                   'start'       : (strpTime(program['start'],'%Y-%m-%dT%H:%M:%S.%fZ')).strftime(xmltv.date_format),
-                   'icon'        : [{'src': (episode.get('poster','') or episode.get('thumbnail','') or episode.get('featuredImage',{})).get('path',FANART)}]}
-                   
+        length  = None
+        catchup = None
+        date    = None
+        rating  = None
+        system  = None
         if int(episode.get('duration','0') or '0') > 0:
-            pitem['length']    = {'units': 'seconds', 'length': str(int(episode['duration']) // 1000)}
+            length  = str(int(episode['duration']) // 1000)
     
         if uri:
-            pitem['catchup-id'] = 'plugin://%s/?mode=8&name=%s&url=%s'%(ADDON_ID,urllib.parse.quote(self.cleanString(program['title'])),urllib.parse.quote(uri))
-
-        if episode.get('name',''):
-            pitem['sub-title'] = [(self.cleanString(episode['name']), LANG)]
+            catchup = 'plugin://%s/?mode=8&name=%s&url=%s'%(ADDON_ID,urllib.parse.quote(self.cleanString(program['title'])),urllib.parse.quote(uri))
             
         if episode.get('clip',{}).get('originalReleaseDate',''):
             try:
-                pitem['date'] = (strpTime(episode['clip']['originalReleaseDate'])).strftime('%Y%m%d')
+                date = strfTime(episode['clip']['originalReleaseDate'], outformat='%Y%m%d')
             except: pass
 
         if episode.get('rating',''):
             rating = program.get('rating','')
-            if rating.startswith('TV'): 
-                pitem['rating'] = [{'system': 'VCHIP', 'value': rating}]
-            else:  
-                pitem['rating'] = [{'system': 'MPAA', 'value': rating}]
+            if rating.startswith('TV'): system = 'VCHIP'
+            else:                       system = 'MPAA'
       
-        log('addProgram = %s'%(pitem))
-        self.xmltvList['programmes'].append(pitem)
-        return True
+        pitem   = xmltv.Programme(channel       = getChannelID(channel['number']),
+                                  start         = strfTime(program['start'],'%Y-%m-%dT%H:%M:%S.%fZ'),
+                                  stop          = strfTime(program['stop'] ,'%Y-%m-%dT%H:%M:%S.%fZ'),
+                                  title         = self.cleanString(program['title']),
+                                  desc          = (self.cleanString(episode.get('description','')) or xbmc.getLocalizedString(161)),
+                                  sub_title     = (self.cleanString(episode['name']) if episode.get('name','') else None),
+                                  category      = [self.cleanString(episode.get('genre','Undefined'))],
+                                  date          = date,
+                                  length        = length,
+                                  icon          = (episode.get('poster','') or episode.get('thumbnail','') or episode.get('featuredImage',{})).get('path',FANART),
+                                  rating_system = system,
+                                  rating        = rating,
+                                  catchup_id    = catchup,
+                                  lang          = LANG)
+        log(lambda: 'addProgram = %s'%(pitem,))
+        return pitem
      
      
     def cleanString(self, text):
+        #keep tab, newline, carriage return and \x20-\x7f. most guide text is plain ascii already.
         if text is None: return ''
-        return re.sub(u'[^\n\r\t\x20-\x7f]+',u'',text)
-        
-        
-    def poolList(self, method, items=None, args=None, chunk=25):
-        log("poolList")
-        results = []
-        if ENABLE_POOL:
-            pool = ThreadPool(CORES)
-            if args is not None: 
-                results = pool.map(method, zip(items,repeat(args)))
-            elif items: 
-                results = pool.map(method, items)#, chunksize=chunk)
-            pool.close()
-            pool.join()
-        else:
-            if args is not None: 
-                results = [method((item, args)) for item in items]
-            elif items: 
-                results = [method(item) for item in items]
-        return filter(None, results)
-
+        try: return CLEAN_CACHE[text]
+        except KeyError: pass
+        clean = (text if text.isascii() else text.encode('ascii','ignore').decode('ascii'))
+        if not clean.isprintable(): clean = clean.translate(CLEAN_TABLE)
+        if len(CLEAN_CACHE) >= CACHE_LIMIT: CLEAN_CACHE.clear()
+        CLEAN_CACHE[text] = clean
+        return clean
+        
         
     def getParams(self):
         return dict(urllib.parse.parse_qsl(self.sysARG[2][1:]))
@@ -854,22 +1064,30 @@ class PlutoTV(object):
         log("URL : "+str(url))
         log("Name: "+str(name))
 
-        if mode==None:
-            if getPTVL(): 
-                return notificationDialog(LANGUAGE(30042))
-            self.mainMenu()
-        elif mode == 0 :  self.browseGuide(name, url)
-        elif mode == 1 :  self.browseLineup(name, url)
-        elif mode == 2 :  self.browseCategories()
-        elif mode == 3 :  self.browseOndemand(url)
-        elif mode == 4 :  self.browseSeason(url)
-        elif mode == 5 :  self.browseEpisodes(name, url)
-        elif mode == 8 :  self.playVOD(name, url)
-        elif mode == 9 :  self.playVideo(name, url)
-        
-        xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=DISC_CACHE)
\ No newline at end of file
+        if mode == 99: return xbmcgui.Dialog().textviewer(ADDON_NAME, TIMER.summary())
+        TIMER.begin(mode)
+        try:
+            if mode==None:
+                if getPTVL(): 
+                    return notificationDialog(LANGUAGE(30042))
+                self.mainMenu()
+            elif mode == 0 :  self.browseGuide(name, url)
+            elif mode == 1 :  self.browseLineup(name, url)
+            elif mode == 2 :  self.browseCategories()
+            elif mode == 3 :  self.browseOndemand(url)
+            elif mode == 4 :  self.browseSeason(url)
+            elif mode == 5 :  self.browseEpisodes(name, url)
+            elif mode == 8 :  self.playVOD(name, url)
+            elif mode == 9 :  self.playVideo(name, url)
+
+            xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
+            with TIMER.span('directory'): xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=DISC_CACHE)
+        finally:
+            self.executor.close()
+            TIMER.end()
+            self.art.close()
+            self.guideStore.close()
\ No newline at end of file
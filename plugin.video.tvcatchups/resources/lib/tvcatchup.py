@@ -18,17 +18,14 @@
 
 # -*- coding: utf-8 -*-
 import os, sys, time, _strptime, datetime, re, traceback, pytz, calendar
-import urlparse, urllib, urllib2, socket, json, threading, requests
+import urlparse, urllib, urllib2, socket, json, requests
 import xbmc, xbmcgui, xbmcplugin, xbmcaddon, xbmcvfs
 
 from bs4 import BeautifulSoup
 from simplecache import SimpleCache, use_cache
-
-try:
-    from multiprocessing import cpu_count 
-    from multiprocessing.pool import ThreadPool 
-    ENABLE_POOL = True
-except: ENABLE_POOL = False
+from resources.lib.artcache import ArtCache
+from resources.lib.executor import Executor, CORES
+from resources.lib.timings import Timer
 
 # Plugin Info
 ADDON_ID      = 'plugin.video.tvcatchups'
@@ -45,11 +42,13 @@ LANGUAGE      = REAL_SETTINGS.getLocalizedString
 TIMEOUT       = 15
 CONTENT_TYPE  = 'episodes'
 DEBUG         = REAL_SETTINGS.getSetting('Enable_Debugging') == 'true'
+ENABLE_TIMER  = REAL_SETTINGS.getSetting('Enable_Timings') == 'true'
 BASE_URL      = 'http://www.tvcatchup.com'
 ICON_URL      = 'http://images-cache.tvcatchup.com/NEW/images/channels/hover/channel_%d.png'
 LIVE_URL      = BASE_URL + '/channels'
 GUIDE_URL     = BASE_URL + '/tv-guide'
-LOGO          = os.path.join(SETTINGS_LOC,'%s.png')
+ART_LOC       = os.path.join(SETTINGS_LOC,'art')
+LOGO          = os.path.join(SETTINGS_LOC,'%s.png') #outside ART_LOC, so trim() never evicts a logo
 
 MAIN_MENU     = [(LANGUAGE(30003), '' , 1),
                  (LANGUAGE(30004), '' , 2),
@@ -57,6 +56,7 @@ MAIN_MENU     = [(LANGUAGE(30003), '' , 1),
 
 def log(msg, level=xbmc.LOGDEBUG):
     if DEBUG == False and level != xbmc.LOGERROR: return
+    if callable(msg): msg = msg()
     if level == xbmc.LOGERROR: msg += ' ,' + traceback.format_exc()
     xbmc.log(ADDON_ID + '-' + ADDON_VERSION + '-' + msg, level)
 
@@ -66,18 +66,15 @@ def cleanString(string1):
 def trimString(string1):
     return re.sub('[\s+]', '', string1.strip(' \t\n\r'))
 
-def retrieveURL(url, dest):
-    try: urllib.urlretrieve(url, dest)
-    except Exception as e: log("retrieveURL, Failed! " + str(e), xbmc.LOGERROR)
-    return True
-    
+TIMER = Timer(ADDON_ID, ENABLE_TIMER, log)
 socket.setdefaulttimeout(TIMEOUT)  
 class TVCatchup(object):
     def __init__(self, sysARG):
         log('__init__')
         self.cache   = SimpleCache()
+        self.executor = Executor(CORES, log)
         self.sysARG  = sysARG
-        self.downloadThread = threading.Timer(0.5, retrieveURL)
+        self.art     = ArtCache(ART_LOC, log=log)
         
         
     def getDuration(self, timeString):
@@ -101,10 +98,11 @@ class TVCatchup(object):
         else: return ltime - (datetime.datetime.utcnow() - datetime.datetime.now())
         
         
+    @TIMER.timed('fetch')
     def openURL(self, url):
         try:
             url = requests.head(url, allow_redirects=True).url
-            log('openURL, url = ' + str(url))
+            log(lambda: 'openURL, url = ' + str(url))
             if len(re.findall('http[s]?://transponder.tv', url)) > 0: 
                 xbmcgui.Dialog().ok(ADDON_NAME, LANGUAGE(30007))
                 xbmc.executebuiltin('XBMC.RunAddon(plugin.video.transpondertv)')
@@ -124,24 +122,19 @@ class TVCatchup(object):
         for item in items: self.addDir(*item)
         
 
-    def downloadQueue(self, url, dest):
-        if xbmcvfs.exists(LOGO%dest): return
-        if self.downloadThread.isAlive(): self.downloadThread.join()
-        self.downloadThread = threading.Timer(0.2, retrieveURL, [url, xbmc.translatePath(LOGO%dest)])
-        xbmcgui.Dialog().notification(ADDON_NAME, LANGUAGE(30006), ICON, 2)
-        self.downloadThread.name = "downloadThread"
-        self.downloadThread.start()
-        
-        
     def downloadLogos(self, items):
         log('downloadLogos')
+        #logos are kept by channel name, listings point at LOGO%chname whether or not it has arrived yet.
         if xbmcvfs.exists(SETTINGS_LOC) == False: xbmcvfs.mkdirs(SETTINGS_LOC)
-        for item in items: self.downloadQueue(*item)
+        items = [(url, dest) for url, dest in items if not xbmcvfs.exists(LOGO%dest)]
+        if not items: return
+        xbmcgui.Dialog().notification(ADDON_NAME, LANGUAGE(30006), ICON, 2)
+        for url, dest in items: self.art.prefetch(url, xbmc.translatePath(LOGO%dest))
         
         
     def buildLive(self):
         items   = []
-        soup    = BeautifulSoup(self.openURL(LIVE_URL), "html.parser")
+        with TIMER.span('parse'): soup = BeautifulSoup(self.openURL(LIVE_URL), "html.parser")
         results = soup('div' , {'class': 'channelsHolder'})
         for channel in results:
             chlogo = channel.find_all('img')[0].attrs['src']
@@ -158,7 +151,7 @@ class TVCatchup(object):
         
     def buildLineup(self, name=None):
         log('buildLineup, name = ' + str(name))
-        soup    = BeautifulSoup(self.openURL(GUIDE_URL), "html.parser")
+        with TIMER.span('parse'): soup = BeautifulSoup(self.openURL(GUIDE_URL), "html.parser")
         results = soup('div' , {'class': 'row'})
         now = datetime.datetime.now()
         for channel in results:
@@ -196,15 +189,15 @@ class TVCatchup(object):
     def uEPG(self):
         log('uEPG')
         #support for uEPG universal epg framework module available from the Kodi repository. https://github.com/Lunatixz/KODI_Addons/tree/master/script.module.uepg
-        soup    = BeautifulSoup(self.openURL(GUIDE_URL), "html.parser")
+        with TIMER.span('parse'): soup = BeautifulSoup(self.openURL(GUIDE_URL), "html.parser")
         results = soup('div' , {'class': 'row'})
         data    = [(idx, channel) for idx, channel in enumerate(results)]
-        return self.poolList(self.buildGuide, data)
+        return self.executor.map(self.buildGuide, data)
         
         
     def buildGuide(self, data):
         idx, channel = data
-        log('buildGuide, idx = ' + str(idx))
+        log(lambda: 'buildGuide, idx = ' + str(idx))
         now        = datetime.datetime.now()
         chname     = cleanString(channel.find_all('img')[0].attrs['alt'])
         link       = cleanString(channel.find_all('a')[0].attrs['href'])
@@ -240,18 +233,6 @@ class TVCatchup(object):
         return newChannel
         
         
-    def poolList(self, method, items):
-        results = []
-        if ENABLE_POOL:
-            pool = ThreadPool(cpu_count())
-            results = pool.imap_unordered(method, items)
-            pool.close()
-            pool.join()
-        else: results = [method(item) for item in items]
-        results = filter(None, results)
-        return results
-
-            
     def resolverURL(self, url):
         try: return re.compile('<source src="(.+?)" type="application/x-mpegURL">').findall(self.openURL(BASE_URL + url))[0]
         except: 
@@ -271,7 +252,7 @@ class TVCatchup(object):
 
     def addLink(self, name, u, mode, infoList=False, infoArt=False, total=0):
         name = name.encode("utf-8")
-        log('addLink, name = ' + name)
+        log(lambda: 'addLink, name = ' + name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'true')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
@@ -284,7 +265,7 @@ class TVCatchup(object):
 
     def addDir(self, name, u, mode, infoList=False, infoArt=False):
         name = name.encode("utf-8")
-        log('addDir, name = ' + name)
+        log(lambda: 'addDir, name = ' + name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'false')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
@@ -311,15 +292,22 @@ class TVCatchup(object):
         log("URL : "+str(url))
         log("Name: "+str(name))
 
-        if mode==None:  self.buildMenu(MAIN_MENU)
-        elif mode == 1: self.buildLive()
-        elif mode == 2: self.buildLineup(url)
-        elif mode == 9: self.playVideo(name, url)
-        elif mode == 20:xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s&row_count=%s)"%(urllib.quote(json.dumps(list(self.uEPG()))),urllib.quote(json.dumps(self.sysARG[0]+"?mode=20")),urllib.quote(json.dumps("7200")),urllib.quote(json.dumps("7"))))
+        if mode == 99: return xbmcgui.Dialog().textviewer(ADDON_NAME, TIMER.summary())
+        TIMER.begin(mode)
+        try:
+            if mode==None:  self.buildMenu(MAIN_MENU)
+            elif mode == 1: self.buildLive()
+            elif mode == 2: self.buildLineup(url)
+            elif mode == 9: self.playVideo(name, url)
+            elif mode == 20:xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s&row_count=%s)"%(urllib.quote(json.dumps(list(self.uEPG()))),urllib.quote(json.dumps(self.sysARG[0]+"?mode=20")),urllib.quote(json.dumps("7200")),urllib.quote(json.dumps("7"))))
 
-        xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=True)
\ No newline at end of file
+            xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
+            with TIMER.span('directory'): xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=True)
+        finally:
+            self.executor.close()
+            TIMER.end()
+            self.art.close()
\ No newline at end of file
@@ -0,0 +1,156 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of Xumo.TV.
+#
+# Xumo.TV is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Xumo.TV is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Xumo.TV.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import os, time, hashlib, threading
+
+import xbmc, xbmcvfs
+
+try:    from queue import Queue, Empty
+except: from Queue import Queue, Empty
+
+try:    from urllib.request import Request, urlopen
+except: from urllib2 import Request, urlopen
+
+WORKERS = 4 #concurrent downloads
+LIMIT   = 64 * 1024 * 1024 #bytes of art kept, least recently used goes first
+TIMEOUT = 15 #seconds per download
+STALE   = 4 * TIMEOUT #seconds before trim() takes a .part file for one cut short by its process exiting
+AGENT   = 'Mozilla/5.0 (Windows NT 6.2; rv:24.0) Gecko/20100101 Firefox/24.0'
+IMAGES  = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+def translatePath(path):
+    try:    return xbmcvfs.translatePath(path)
+    except AttributeError: return xbmc.translatePath(path)
+
+
+class ArtCache(object):
+    """
+    Local copies of remote art. get() answers with the cached file when there
+    is one, otherwise it queues the url for a background download and answers
+    with the url, so the next listing finds the file. Each url is fetched at
+    most once at a time, by at most 'workers' daemon threads. The last worker
+    to run out of urls trims the folder to 'limit' bytes, least recently used
+    first. close() never waits on a download.
+    """
+    def __init__(self, folder, workers=WORKERS, limit=LIMIT, log=None):
+        self.folder  = translatePath(folder)
+        self.workers = max(1, workers)
+        self.limit   = limit
+        self.log     = log
+        self.queue   = Queue()
+        self.pending = set()
+        self.lock    = threading.Lock()
+        self.threads = []
+        self.added   = 0 #bytes downloaded since the last trim
+        if not os.path.isdir(self.folder): os.makedirs(self.folder)
+
+
+    def getPath(self, url):
+        #hash the utf-8 bytes; a py2 byte string is hashed as is, as encoding it would first decode it as ascii.
+        if isinstance(url, bytes): key, url = url, url.decode('utf-8', 'ignore')
+        else: key = url.encode('utf-8')
+        ext = os.path.splitext(url.split('?')[0])[1].lower()
+        return os.path.join(self.folder, '%s%s'%(hashlib.md5(key).hexdigest(), (ext if ext in IMAGES else '.jpg')))
+
+
+    def get(self, url):
+        if not url or not url.startswith('http'): return url
+        path = self.getPath(url)
+        try:
+            os.utime(path, None) #recently used
+            return path
+        except OSError:
+            self.prefetch(url, path)
+            return url
+
+
+    def getArt(self, art):
+        return dict([(key, self.get(value)) for key, value in art.items()])
+
+
+    def prefetch(self, url, path):
+        #a worker only leaves under the lock once the queue is empty, so a url queued here is always picked up.
+        with self.lock:
+            if url in self.pending: return
+            self.pending.add(url)
+            self.queue.put((url, path))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work, name='ArtCache')
+                thread.daemon = True #a download still running when the plugin exits is abandoned
+                self.threads.append(thread)
+                thread.start()
+
+
+    def work(self):
+        while True:
+            with self.lock:
+                try: url, path = self.queue.get_nowait()
+                except Empty:
+                    self.threads.remove(threading.current_thread())
+                    if self.threads or not self.added: return
+                    break
+            try: self.download(url, path)
+            finally:
+                with self.lock: self.pending.discard(url)
+        self.trim()
+
+
+    def download(self, url, path):
+        try:
+            response = urlopen(Request(url, headers={'User-Agent':AGENT}), timeout=TIMEOUT)
+            data = response.read()
+            response.close()
+        except Exception as e:
+            if self.log: self.log('ArtCache, download failed %s %s'%(url, e))
+            return
+        if not data: return
+        part = '%s.part'%(path)
+        try:
+            with open(part, 'wb') as fle: fle.write(data)
+            os.rename(part, path) #a reader never sees half a file
+        except (IOError, OSError): return
+        with self.lock: self.added += len(data)
+
+
+    def close(self):
+        #downloads still running finish, or die with the process, on their own; an idle cache trims what it added.
+        with self.lock:
+            if self.threads or not self.added: return
+        self.trim()
+
+
+    def trim(self):
+        with self.lock: self.added = 0
+        files = []
+        now   = time.time()
+        for name in os.listdir(self.folder):
+            try:    stat = os.stat(os.path.join(self.folder, name))
+            except OSError: continue
+            if name.endswith('.part'):
+                if now - stat.st_mtime > STALE:
+                    try: os.remove(os.path.join(self.folder, name))
+                    except OSError: pass
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        total = sum([size for mtime, size, name in files])
+        for mtime, size, name in sorted(files):
+            if total <= self.limit: break
+            try: os.remove(os.path.join(self.folder, name))
+            except OSError: continue
+            total -= size
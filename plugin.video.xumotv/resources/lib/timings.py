@@ -0,0 +1,159 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of Xumo.TV.
+#
+# Xumo.TV is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Xumo.TV is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Xumo.TV.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+import time, json, functools, threading
+
+import xbmcgui
+
+RING   = 25 #plugin runs kept for the summary
+STAGES = ('fetch', 'parse', 'build', 'directory')
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+class Span(object):
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+
+    def __enter__(self):
+        self.timer.enter(self.stage)
+        return self
+
+
+    def __exit__(self, *args):
+        self.timer.exit()
+
+
+class Timer(object):
+    """
+    Wall time per stage of one plugin run. The run itself counts as 'build';
+    nested spans are exclusive, so a fetch inside a build is not counted
+    twice. Finished runs go to a ring of the last RING runs, kept in a home
+    window property so the summary outlives the plugin process. Disabled,
+    every call returns at once. Spans on pool threads are timed as they run,
+    so with workers the stages can add up past the total.
+    """
+    def __init__(self, addonid, enabled=False, log=None):
+        self.enabled  = enabled
+        self.property = '%s.timings'%(addonid)
+        self.log      = log
+        self.lock     = threading.Lock()
+        self.local    = threading.local()
+        self.mode     = None
+        self.stats    = {}
+
+
+    def begin(self, mode):
+        if not self.enabled: return
+        self.mode  = ('root' if mode is None else str(mode))
+        self.stats = {}
+        self.enter('build')
+
+
+    def span(self, stage):
+        if not self.enabled: return NULL_SPAN
+        return Span(self, stage)
+
+
+    def timed(self, stage):
+        #decorator, times each call of a method under 'stage'.
+        def decorator(method):
+            @functools.wraps(method)
+            def call(*args, **kwargs):
+                if not self.enabled: return method(*args, **kwargs)
+                with Span(self, stage): return method(*args, **kwargs)
+            return call
+        return decorator
+
+
+    def stack(self):
+        try: return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+
+    def enter(self, stage):
+        self.stack().append([stage, time.time(), 0.0])
+
+
+    def exit(self):
+        stack = self.stack()
+        stage, start, child = stack.pop()
+        elapsed = time.time() - start
+        if stack: stack[-1][2] += elapsed
+        with self.lock:
+            calls, ms = self.stats.get(stage, (0, 0.0))
+            self.stats[stage] = (calls + 1, ms + (elapsed - child) * 1000)
+        return elapsed
+
+
+    def end(self):
+        if not self.enabled or not self.stack(): return
+        while self.stack(): total = self.exit() * 1000 #the run's own span is last, any above it were left open by an exception
+        run   ={'mode':self.mode, 'time':int(time.time()), 'total':round(total, 1),
+                 'stages':dict([(stage, [calls, round(ms, 1)]) for stage, (calls, ms) in self.stats.items()])}
+        runs  = (self.getRuns() + [run])[-RING:]
+        xbmcgui.Window(10000).setProperty(self.property, json.dumps(runs))
+        if self.log: self.log('Timer, mode %s took %.1f ms, %s'%(self.mode, total, ', '.join(['%s %.1f ms'%(stage, run['stages'][stage][1]) for stage in STAGES if stage in run['stages']])))
+
+
+    def getRuns(self):
+        try:    return json.loads(xbmcgui.Window(10000).getProperty(self.property) or '[]')
+        except ValueError: return []
+
+
+    def clear(self):
+        xbmcgui.Window(10000).clearProperty(self.property)
+
+
+    def summary(self):
+        """
+        summary() -> str
+
+        Per mode the run count, then median and last wall time in ms for the
+        whole run and for each stage, over the runs still in the ring.
+        """
+        modes = {}
+        for run in self.getRuns(): modes.setdefault(run['mode'], []).append(run)
+        if not modes: return 'No timed runs yet.'
+        lines = []
+        for mode, runs in sorted(modes.items()):
+            lines.append('mode %s, %s runs'%(mode, len(runs)))
+            lines.append('  %-10s median %8.1f ms  last %8.1f ms'%('total', median([run['total'] for run in runs]), runs[-1]['total']))
+            for stage in STAGES:
+                values = [run['stages'].get(stage, [0, 0.0])[1] for run in runs]
+                if not any(values): continue
+                lines.append('  %-10s median %8.1f ms  last %8.1f ms'%(stage, median(values), values[-1]))
+        return '\n'.join(lines)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0.0
@@ -22,6 +22,8 @@ import urlparse, urllib, urllib2, socket, json, inputstreamhelper
 import xbmc, xbmcgui, xbmcplugin, xbmcaddon
 
 from simplecache import SimpleCache, use_cache
+from resources.lib.artcache import ArtCache
+from resources.lib.timings import Timer
 
 # Plugin Info
 ADDON_ID      = 'plugin.video.xumotv'
@@ -39,6 +41,8 @@ TIMEOUT       = 15
 CONTENT_TYPE  = 'episodes'
 PTVL_RUN      = xbmcgui.Window(10000).getProperty('PseudoTVRunning') == 'True'
 DEBUG         = REAL_SETTINGS.getSetting('Enable_Debugging') == 'true'
+ENABLE_TIMER  = REAL_SETTINGS.getSetting('Enable_Timings') == 'true'
+ART_LOC       = os.path.join(SETTINGS_LOC,'art')
 BASE_URL      = 'http://www.xumo.tv'
 BASE_API      = 'https://valencia-app-mds.xumo.com/v2/%s'
 BASE_LOGO     = 'https://image.xumo.com/v1/channels/channel/%s/512x512.png?type=color_onBlack'
@@ -52,6 +56,7 @@ MAIN_MENU     = [(LANGUAGE(30003), '0', 1),
              
 def log(msg, level=xbmc.LOGDEBUG):
     if DEBUG == False and level != xbmc.LOGERROR: return
+    if callable(msg): msg = msg()
     if level == xbmc.LOGERROR: msg += ' ,' + traceback.format_exc()
     xbmc.log(ADDON_ID + '-' + ADDON_VERSION + '-' + msg, level)
     
@@ -61,18 +66,21 @@ def uni(string1, encoding = 'utf-8'):
         elif isinstance(string1, unicode): string1 = string1.encode('ascii', 'replace')
     return string1  
     
+TIMER = Timer(ADDON_ID, ENABLE_TIMER, log)
 socket.setdefaulttimeout(TIMEOUT)  
 class XumoTV(object):
     def __init__(self, sysARG):
         log('__init__, sysARG = ' + str(sysARG))
         self.sysARG = sysARG
         self.cache  = SimpleCache()
+        self.art    = ArtCache(ART_LOC, log=log)
         self.geoID, self.geoLST  = self.getID()
         
            
+    @TIMER.timed('fetch')
     def openURL(self, url):
         try:
-            log('openURL, url = ' + str(url))
+            log(lambda: 'openURL, url = ' + str(url))
             cacheresponse = self.cache.get(ADDON_NAME + '.openURL, url = %s'%url)
             if not cacheresponse:
                 request = urllib2.Request(url)
@@ -86,46 +94,54 @@ class XumoTV(object):
             return ''
          
          
+    @TIMER.timed('parse')
     def getID(self):
         log('getID')
         results = json.loads(re.findall('__JOBS_REHYDRATE_STATE__=(.+?);</script>',(self.openURL(BASE_URL)), flags=re.DOTALL)[0])
         return results["jobs"]["1"]["data"]["geoId"], results["jobs"]["1"]["data"]["channelListId"]
         
         
+    @TIMER.timed('parse')
     def getChannels(self):
         log('getChannels')
         '''{u'description': u'Dedicated to providing the best in journalism under standards it pioneered at the dawn of radio and television and continue in the digital age.', u'title': u'CBS News', u'number': 125, u'callsign': u'XCBSNWS', u'genre': [{u'genreId': 13, u'value': u'News'}], u'guid': {u'isPermaLink': False, u'value': u'9999158'}, u'properties': {u'has_vod': u'false', u'hybrid_type': u'promoted', u'brand_color': u'rgba(48,129,180,1)', u'is_simulcast': u'true', u'is_live': u'true', u'has_discontinuity': u'true'}}'''
         return json.loads(self.openURL(BASE_API%'channels/list/%s.json?sort=hybrid&geoId=%s'%(self.geoLST, self.geoID)))['channel']['item']
        
              
+    @TIMER.timed('parse')
     def getChannelsByGenre(self, genre):
         log('getChannelsByGenre')
         return json.loads(self.openURL(BASE_API%'channels/list/%s.json?q=genreid:%s'%(self.geoLST, genre)))['channel']['item']
             
             
+    @TIMER.timed('parse')
     def getChannelCategories(self, channelID):
         log('getChannelCategories')
         return json.loads(self.openURL(BASE_API%'channels/channel/%s/categories.json'%(channelID)))['categories']
         
 
+    @TIMER.timed('parse')
     def getCategories(self, CatID):
         log('getCategories')
         try: return json.loads(self.openURL(BASE_API%'categories/category/%s.json?f=asset.title&f=asset.episodeTitle&f=asset.providers&f=asset.runtime&f=asset.availableSince'%(CatID)))
         except: return {}
         
         
+    @TIMER.timed('parse')
     def getGenres(self):
         log('getGenres')
         '''{u'genreId': 195, u'value': u'TV & Movies'}'''
         return json.loads(self.openURL(BASE_API%'channels/list/%s/genres.json'%(self.geoLST)))['genres']
         
         
+    @TIMER.timed('parse')
     def getOnNEXT(self, limit='3'):
         log('getOnNEXT')
         '''{u'end': 1536689700000L, u'title': u'Highlights', u'channelId': 9999301, u'start': 1536688800000L, u'descriptions': {u'small': u"Watch the world's best golfers in action with Highlights from the latest on the PGA TOUR."}, u'contentType': u'COMPOSITE', u'type': u'Asset', u'id': u'XM0FQO65KVUAYO'}'''
         return json.loads(self.openURL(BASE_API%'channels/list/%s/onnowandnext.json?f=asset.title&f=asset.descriptions&limit=%s'%(self.geoLST,limit)))['results']
 
         
+    @TIMER.timed('parse')
     def getOnNow(self, channelID):
         log('getOnNow')
         '''{u'timestamps': {u'start': 946684800, u'end': 2145916800}, u'live': True, u'type': u'Asset', u'id': u'XM0IFYLJ0RMD0X'}'''
@@ -133,6 +149,7 @@ class XumoTV(object):
         except: return {}
         
        
+    @TIMER.timed('parse')
     def getLineup(self, channelID, hour='22'):
         log('getLineup')
         '''{u'timestamps': {u'start': 946684800, u'end': 2145916800}, u'live': True, u'type': u'Asset', u'id': u'XM0IFYLJ0RMD0X'}'''
@@ -140,6 +157,7 @@ class XumoTV(object):
         
         
     @use_cache(28)
+    @TIMER.timed('parse')
     def getMeta(self, contentID):
         '''{u'contentType': u'SIMULCAST', u'providers': [{u'title': u'CBSN', u'color': u'rgba(48,129,180,1)', u'sources': [{u'lang': u'en', u'produces': u'application/x-mpegURL', u'uri': u'https://dai.google.com/linear/hls/event/Sid4xiTQTkCT1SLu6rjUSQ/master.m3u8?iu=/8264/vaw-can/ott/cbsnews_xumo', u'height': 720, u'width': 1280, u'bitrate': 3009}], u'sunset': u'Tue, 19 Jan 2038 03:14:07 +0000', u'id': 42, u'sunrise': u'Thu, 1 Jan 1970 00:00:01 +0000'}], u'title': u'CBS News', u'descriptions': {u'medium': u"CBSN offers original, up-to-the-minute coverage of national and global stories with dynamic on-demand video content, including video from CBS News' extensive archives."}, u'availableSince': u'Tue, 20 Dec 2016 23:25:37 +0000', u'type': u'Asset', u'id': u'XM0IFYLJ0RMD0X'}'''
         return json.loads(self.openURL(BASE_API%'assets/asset/%s.json?f=title&f=providers&f=descriptions&f=runtime&f=availableSince'%(contentID)))
@@ -211,7 +229,7 @@ class XumoTV(object):
         
   
     def buildAsset(self, chid, channelId, channelName=None, channelNumber=None):
-        log('buildAsset, chID = ' + chid)
+        log(lambda: 'buildAsset, chID = ' + chid)
         meta  = self.getMeta(chid)
         mType = ''
         url   = channelId
@@ -239,7 +257,7 @@ class XumoTV(object):
         liz.setMimeType(mType)
         liz.setSubtitles( [sub['url'] for sub in meta.get('captions',[]) if sub['type'] == 'text/srt'])
         liz.setInfo(type="Video", infoLabels={"mediatype":"episode","label":label ,"title":label,"plot":plot,"duration":duration,"aired":aired.strftime('%Y-%m-%d')})
-        liz.setArt({'thumb':thumb,'fanart':BASE_FANART%(channelId),'clearlogo':BASE_LOGO%(channelId)})
+        liz.setArt(self.art.getArt({'thumb':thumb,'fanart':BASE_FANART%(channelId),'clearlogo':BASE_LOGO%(channelId)}))
         return label, url, liz
   
   
@@ -333,20 +351,20 @@ class XumoTV(object):
         
     def addLink(self, name, u, mode, liz, total=0):
         name = name.encode("utf-8")
-        log('addLink, name = ' + name)
+        log(lambda: 'addLink, name = ' + name)
         u=self.sysARG[0]+"?url="+urllib.quote_plus(u)+"&mode="+str(mode)+"&name="+urllib.quote_plus(name)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,totalItems=total)
 
 
     def addDir(self, name, u, mode, infoList=False, infoArt=False):
         name = name.encode("utf-8")
-        log('addDir, name = ' + name)
+        log(lambda: 'addDir, name = ' + name)
         liz=xbmcgui.ListItem(name)
         liz.setProperty('IsPlayable', 'false')
         if infoList == False: liz.setInfo(type="Video", infoLabels={"mediatype":"video","label":name,"title":name})
         else: liz.setInfo(type="Video", infoLabels=infoList)
         if infoArt == False: liz.setArt({'thumb':ICON,'fanart':FANART})
-        else: liz.setArt(infoArt)
+        else: liz.setArt(self.art.getArt(infoArt))
         u=self.sysARG[0]+"?url="+urllib.quote_plus(u)+"&mode="+str(mode)+"&name="+urllib.quote_plus(name)
         xbmcplugin.addDirectoryItem(handle=int(self.sysARG[1]),url=u,listitem=liz,isFolder=True)
      
@@ -367,17 +385,23 @@ class XumoTV(object):
         log("URL : "+str(url))
         log("Name: "+str(name))
 
-        if mode==None:  self.buildMenu(MAIN_MENU)
-        elif mode == 1: self.buildChannels(int(url), opt='now')
-        elif mode == 2: self.buildOnDemand(name, url)
-        elif mode == 9: self.playVideo(name, url)
-        elif mode == 10: self.buildChannels(end=5000, opt='now')
-        elif mode == 20:xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s&row_count=%s)"%(self.uEPG(),urllib.quote(self.sysARG[0]+"?mode=20"),"3600","7"))
+        if mode == 99: return xbmcgui.Dialog().textviewer(ADDON_NAME, TIMER.summary())
+        TIMER.begin(mode)
+        try:
+            if mode==None:  self.buildMenu(MAIN_MENU)
+            elif mode == 1: self.buildChannels(int(url), opt='now')
+            elif mode == 2: self.buildOnDemand(name, url)
+            elif mode == 9: self.playVideo(name, url)
+            elif mode == 10: self.buildChannels(end=5000, opt='now')
+            elif mode == 20:xbmc.executebuiltin("RunScript(script.module.uepg,json=%s&refresh_path=%s&refresh_interval=%s&row_count=%s)"%(self.uEPG(),urllib.quote(self.sysARG[0]+"?mode=20"),"3600","7"))
 
 
-        xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
-        xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
-        xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=True)
\ No newline at end of file
+            xbmcplugin.setContent(int(self.sysARG[1])    , CONTENT_TYPE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_UNSORTED)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_NONE)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_LABEL)
+            xbmcplugin.addSortMethod(int(self.sysARG[1]) , xbmcplugin.SORT_METHOD_TITLE)
+            with TIMER.span('directory'): xbmcplugin.endOfDirectory(int(self.sysARG[1]), cacheToDisc=True)
+        finally:
+            TIMER.end()
+            self.art.close()
\ No newline at end of file
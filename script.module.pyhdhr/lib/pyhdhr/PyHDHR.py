@@ -19,9 +19,14 @@
 # -*- coding: utf-8 -*-
 # modified from original https://github.com/jumpmanjay/PyHDHR
 
-import time, string, json, os, operator, re
+import time, string, json, os, operator, re, threading, socket, struct, zlib, bisect
 import xbmc
 
+try:
+    from sys import intern
+except ImportError:
+    pass #python 2, a builtin
+
 from six.moves import urllib
 from datetime import datetime
 from decimal import Decimal
@@ -59,6 +64,29 @@ Log                 = Logger()
 URL_DISCOVER        = 'http://my.hdhomerun.com/discover'
 URL_GUIDE_BASE      = 'http://my.hdhomerun.com/api/guide.php?DeviceAuth='
 URL_RECORDING_RULES = 'http://my.hdhomerun.com/api/recording_rules?DeviceAuth='
+DISCOVER_DEADLINE   = 10 #seconds PyHDHR.discover waits for all devices, each request still times out at 5
+DISCOVER_PORT       = 65001
+DISCOVER_TARGET     = ('255.255.255.255', DISCOVER_PORT)
+DISCOVER_WAIT       = 0.25 #seconds to collect replies to a broadcast
+DISCOVER_TTL        = 300 #seconds a device that stops answering is kept
+DISCOVER_REFRESH    = 60 #seconds before the cached devices are re-broadcast for, in the background
+
+#HDHomeRun discover protocol, see libhdhomerun hdhomerun_pkt.h
+TYPE_DISCOVER_REQ   = 0x0002
+TYPE_DISCOVER_RPY   = 0x0003
+TAG_DEVICE_TYPE     = 0x01
+TAG_DEVICE_ID       = 0x02
+TAG_TUNER_COUNT     = 0x10
+TAG_LINEUP_URL      = 0x27
+TAG_STORAGE_URL     = 0x28
+TAG_BASE_URL        = 0x2A
+TAG_DEVICE_AUTH     = 0x2B
+TAG_STORAGE_ID      = 0x2C
+TAG_MULTI_TYPE      = 0x2D
+DEVICE_TYPE_TUNER   = 0x00000001
+DEVICE_TYPE_STORAGE = 0x00000005
+DEVICE_TYPE_ANY     = 0xFFFFFFFF
+DEVICE_ID_ANY       = 0xFFFFFFFF
 
 def searchString(needle,haystack):
     needles = needle.split(' ')
@@ -66,6 +94,210 @@ def searchString(needle,haystack):
         if re.search(n, haystack, re.IGNORECASE):
             return True
 
+def internString(value):
+    #one shared copy of strings repeated across a guide, filter names and series ids.
+    try:
+        return intern(value)
+    except TypeError:
+        return value #python 2 only interns byte strings
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(*texts):
+    tokens = set()
+    for text in texts:
+        if text:
+            tokens.update(WORD.findall(text.lower()))
+    return frozenset(tokens)
+
+class SearchIndex(object):
+    """
+    Inverted index from each word to the keys of the items holding it. An
+    item matches a query when any query word is a prefix of one of its words,
+    so "foot ne" finds "Football" and "News". Re-adding a key with unchanged
+    words is a no-op, so a refresh only pays for what changed.
+    """
+    def __init__(self):
+        self.Postings = {} #word: set of keys
+        self.Tokens   = {} #key: frozenset of words
+        self.Words    = None #sorted words for prefix lookups, None when stale
+
+    def add(self,key,tokens):
+        if self.Tokens.get(key) == tokens:
+            return
+        self.remove(key)
+        self.Tokens[key] = tokens
+        for token in tokens:
+            if token not in self.Postings:
+                self.Postings[token] = set()
+                self.Words = None
+            self.Postings[token].add(key)
+
+    def remove(self,key):
+        for token in self.Tokens.pop(key,()):
+            keys = self.Postings[token]
+            keys.discard(key)
+            if not keys:
+                del self.Postings[token]
+                self.Words = None
+
+    def keys(self):
+        return list(self.Tokens)
+
+    def search(self,query):
+        if self.Words is None:
+            self.Words = sorted(self.Postings)
+        found = set()
+        for term in tokenize(query):
+            pos = bisect.bisect_left(self.Words,term)
+            while pos < len(self.Words) and self.Words[pos].startswith(term):
+                found.update(self.Postings[self.Words[pos]])
+                pos += 1
+        return found
+
+def packTag(tag,value):
+    length = len(value)
+    if length <= 127:
+        return struct.pack('>BB',tag,length) + value
+    return struct.pack('>BBB',tag,(length & 0x7F) | 0x80,length >> 7) + value
+
+def packFrame(ptype,payload):
+    frame = struct.pack('>HH',ptype,len(payload)) + payload
+    return frame + struct.pack('<I',zlib.crc32(frame) & 0xFFFFFFFF)
+
+def unpackFrame(frame):
+    #-> (type, [(tag, value)]), None for a short or corrupt frame.
+    if len(frame) < 8:
+        return None
+    ptype, length = struct.unpack('>HH',frame[:4])
+    if len(frame) < 4 + length + 4:
+        return None
+    if struct.unpack('<I',frame[4+length:8+length])[0] != zlib.crc32(frame[:4+length]) & 0xFFFFFFFF:
+        return None
+    payload, pos, tags = bytearray(frame[4:4+length]), 0, []
+    while pos + 2 <= len(payload):
+        tag, length = payload[pos], payload[pos+1]
+        pos += 2
+        if length & 0x80:
+            if pos >= len(payload):
+                return None
+            length = (length & 0x7F) | (payload[pos] << 7)
+            pos += 1
+        if pos + length > len(payload):
+            return None
+        tags.append((tag, bytes(payload[pos:pos+length])))
+        pos += length
+    return ptype, tags
+
+class LocalDiscover(object):
+    """
+    Finds HDHomeRun tuners and DVRs on the LAN with the discover broadcast
+    the devices answer on UDP 65001, no cloud round trip. Replies are turned
+    into records shaped like the items of URL_DISCOVER and kept for
+    DISCOVER_TTL seconds. An empty cache or a forced lookup waits for the
+    broadcast; otherwise the cache answers at once and, once it is
+    DISCOVER_REFRESH seconds old, a background broadcast picks up devices
+    powered on since, for the next lookup.
+    """
+    def __init__(self,target=DISCOVER_TARGET,wait=DISCOVER_WAIT,ttl=DISCOVER_TTL,refresh=DISCOVER_REFRESH):
+        self.Target    = target
+        self.Wait      = wait
+        self.TTL       = ttl
+        self.Refresh   = refresh
+        self.Devices   = {} #DeviceID or StorageID: (expires, record)
+        self.Refreshed = 0 #time of the last broadcast
+        self.Updating  = None #background broadcast thread
+        self.Lock      = threading.Lock()
+
+    def getDevices(self,force=False):
+        now = time.time()
+        with self.Lock:
+            for key in [key for key in self.Devices if self.Devices[key][0] < now]:
+                del self.Devices[key]
+            if force or not self.Devices:
+                self.update(self.broadcast(),now)
+            elif now - self.Refreshed >= self.Refresh and not (self.Updating and self.Updating.is_alive()):
+                self.Refreshed = now
+                self.Updating = threading.Thread(target=self.refreshDevices,name="LocalDiscover")
+                self.Updating.daemon = True
+                self.Updating.start()
+            return [record for expires, record in self.Devices.values()]
+
+    def refreshDevices(self):
+        records = self.broadcast()
+        with self.Lock:
+            self.update(records,time.time())
+
+    def update(self,records,now):
+        self.Refreshed = now
+        for record in records:
+            self.Devices[record.get('StorageID') or record['DeviceID']] = (now + self.TTL, record)
+
+    def broadcast(self):
+        request = packFrame(TYPE_DISCOVER_REQ,packTag(TAG_DEVICE_TYPE,struct.pack('>I',DEVICE_TYPE_ANY)) +
+                                              packTag(TAG_DEVICE_ID,struct.pack('>I',DEVICE_ID_ANY)))
+        records = []
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET,socket.SO_BROADCAST,1)
+            sock.bind(('',0))
+            sock.sendto(request,self.Target)
+            deadline = time.time() + self.Wait
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    frame, address = sock.recvfrom(2048)
+                except socket.timeout:
+                    break
+                try:
+                    records.extend(self.parseReply(frame,address[0]))
+                except (struct.error, ValueError, IndexError, KeyError) as e:
+                    #a malformed reply costs that device, not the pass
+                    Log.Debug("LocalDiscover.broadcast - skipping bad reply from "+address[0]+": "+str(e))
+        except (socket.error, OSError) as e:
+            Log.Warn("LocalDiscover.broadcast failed: "+str(e))
+        finally:
+            if sock:
+                sock.close()
+        return records
+
+    def parseReply(self,frame,ip):
+        packet = unpackFrame(frame)
+        if not packet or packet[0] != TYPE_DISCOVER_RPY:
+            return []
+        types, tags = set(), {}
+        for tag, value in packet[1]:
+            if tag in (TAG_DEVICE_TYPE, TAG_MULTI_TYPE):
+                types.update(struct.unpack('>%dI'%(len(value) // 4),value[:len(value) // 4 * 4]))
+            else:
+                tags[tag] = value
+        baseurl = (tags.get(TAG_BASE_URL,b'').decode('utf-8') or "http://"+ip+":80")
+        records = []
+        if DEVICE_TYPE_TUNER in types and TAG_DEVICE_ID in tags:
+            record = {'DeviceID':'%08X'%(struct.unpack('>I',tags[TAG_DEVICE_ID])[0]),
+                      'LocalIP':ip,
+                      'BaseURL':baseurl,
+                      'DiscoverURL':baseurl+"/discover.json",
+                      'LineupURL':(tags.get(TAG_LINEUP_URL,b'').decode('utf-8') or baseurl+"/lineup.json")}
+            if TAG_TUNER_COUNT in tags:
+                record['TunerCount'] = bytearray(tags[TAG_TUNER_COUNT])[0]
+            if TAG_DEVICE_AUTH in tags:
+                record['DeviceAuth'] = tags[TAG_DEVICE_AUTH].decode('utf-8')
+            records.append(record)
+        if DEVICE_TYPE_STORAGE in types and TAG_STORAGE_ID in tags:
+            records.append({'StorageID':tags[TAG_STORAGE_ID].decode('utf-8'),
+                            'LocalIP':ip,
+                            'BaseURL':baseurl,
+                            'DiscoverURL':baseurl+"/discover.json",
+                            'StorageURL':(tags.get(TAG_STORAGE_URL,b'').decode('utf-8') or baseurl+"/recorded_files.json")})
+        return records
+
+Discovery = LocalDiscover()
+
 class SortType(object):
     asc  = 0
     desc = 1
@@ -76,12 +308,10 @@ class GroupType(object):
     Category = 2
 
 class SeriesSummary(object):
-    SeriesID     = ""
-    ImageURL     = ""
-    EpisodeCount = 0
+    __slots__ = ('SeriesID', 'ImageURL', 'EpisodeCount')
     
     def __init__(self,SeriesID,ImageURL):
-        self.SeriesID = SeriesID
+        self.SeriesID = internString(SeriesID)
         self.ImageURL = ImageURL
         self.EpisodeCount = 1
         
@@ -98,50 +328,42 @@ class SeriesSummary(object):
         self.EpisodeCount = self.EpisodeCount + ct
 
 class ChannelInfo(object):
-    GuideNumber = ""
-    GuideName = ""
-    ImageURL = ""
-    Affiliate = ""
-    ProgramInfos = []
-    VideoCodec = ""
-    AudioCodec = ""
-    HD =  -1
-    URL = ""
-    Favorite = -1
-    Tuner = None
-    DRM = False
+    __slots__ = ('GuideNumber', 'GuideName', 'ImageURL', 'Affiliate', 'ProgramInfos', 'StartTimes', 'VideoCodec', 'AudioCodec',
+                 'HD', 'URL', 'Favorite', 'Tuner', 'DRM')
     
     def __init__(self,Tuner):
+        self.GuideNumber = ""
+        self.GuideName = ""
+        self.ImageURL = ""
+        self.Affiliate = ""
+        self.ProgramInfos = []
+        self.StartTimes = [] #StartTime of each of ProgramInfos, for bisect
+        self.VideoCodec = ""
+        self.AudioCodec = ""
+        self.HD = -1
+        self.URL = ""
+        self.Favorite = -1
         self.Tuner = Tuner
-        return
+        self.DRM = False
 
     def parse(self,parsestr,PyHDHR):
+        get = parsestr.get
         if 'DRM' in parsestr:
             self.DRM = parsestr['DRM'] == 1
-        if 'GuideNumber' in parsestr:
-            self.GuideNumber = parsestr['GuideNumber']
-        if 'GuideName' in parsestr:
-            self.GuideName = parsestr['GuideName']
-        if 'ImageURL' in parsestr:
-            self.ImageURL = parsestr['ImageURL']
-        if 'Affiliate' in parsestr:
-            self.Affiliate = parsestr['Affiliate']
+        self.GuideNumber = get('GuideNumber',self.GuideNumber)
+        self.GuideName = get('GuideName',self.GuideName)
+        self.ImageURL = get('ImageURL',self.ImageURL)
+        self.Affiliate = get('Affiliate',self.Affiliate)
         if 'Guide' in parsestr:
-            self.ProgramInfos = []
-            for guideitem in parsestr['Guide']:
-                programinfo = ProgramInfo()
-                programinfo.parse(guideitem,PyHDHR)
-                self.ProgramInfos.append(programinfo)
-        if 'VideoCodec' in parsestr:
-            self.VideoCodec = parsestr['VideoCodec']
-        if 'AudioCodec' in parsestr:
-            self.AudioCodec = parsestr['AudioCodec']
-        if 'HD' in parsestr:
-            self.HD = parsestr['HD']
-        if 'URL' in parsestr:
-            self.URL = parsestr['URL']
-        if 'Favorite' in parsestr:
-            self.Favorite = parsestr['Favorite']
+            self.ProgramInfos = [ProgramInfo(guideitem,PyHDHR) for guideitem in parsestr['Guide']]
+            self.ProgramInfos.sort(key=operator.attrgetter('StartTime')) #already in order from the guide api, a single pass then
+            self.StartTimes = [programinfo.StartTime for programinfo in self.ProgramInfos]
+            PyHDHR.indexGuide(self)
+        self.VideoCodec = internString(get('VideoCodec',self.VideoCodec))
+        self.AudioCodec = internString(get('AudioCodec',self.AudioCodec))
+        self.HD = get('HD',self.HD)
+        self.URL = get('URL',self.URL)
+        self.Favorite = get('Favorite',self.Favorite)
         if self.HD != -1:
             self.Tuner.addHD()
         else:
@@ -150,6 +372,20 @@ class ChannelInfo(object):
     def getProgramInfos(self):
         return self.ProgramInfos
 
+    def getNowNext(self,now):
+        #-> (program on at now or None, the one after now or None, time the answer changes or None)
+        progs = self.ProgramInfos
+        pos = bisect.bisect_right(self.StartTimes,now) - 1
+        upcoming = (progs[pos+1] if pos + 1 < len(progs) else None)
+        if pos >= 0 and progs[pos].StartTime <= now < progs[pos].EndTime:
+            boundary = progs[pos].EndTime
+            if upcoming and upcoming.StartTime < boundary:
+                boundary = upcoming.StartTime
+            return progs[pos], upcoming, boundary
+        if upcoming:
+            return None, upcoming, upcoming.StartTime #between programs or before the guide starts
+        return None, None, None #no guide, or it has run out
+
     def getGuideNumber(self):
         return self.GuideNumber
 
@@ -184,43 +420,37 @@ class ChannelInfo(object):
         return self.Tuner
 
 class ProgramInfo(object):
-    SeriesID = ""
-    EpisodeNumber = ""
-    EpisodeTitle = ""
-    Title = ""
-    ImageURL = ""
-    OriginalAirdate = 0
-    Synopsis = ""
-    StartTime = 0
-    ProgramFilters = []
-    EndTime = 0
+    __slots__ = ('SeriesID', 'EpisodeNumber', 'EpisodeTitle', 'Title', 'ImageURL', 'OriginalAirdate', 'Synopsis',
+                 'StartTime', 'ProgramFilters', 'EndTime')
     
-    def __init__(self):
-        return
+    def __init__(self,parsestr=None,PyHDHR=None):
+        #built straight from a guide item when given one, each slot set once; parse() merges into an existing one.
+        get = (parsestr or {}).get
+        self.SeriesID = internString(get('SeriesID',""))
+        self.EpisodeNumber = get('EpisodeNumber',"")
+        self.EpisodeTitle = get('EpisodeTitle',"")
+        self.Title = get('Title',"")
+        self.ImageURL = get('ImageURL',"")
+        self.OriginalAirdate = get('OriginalAirdate',0)
+        self.Synopsis = get('Synopsis',"")
+        self.StartTime = get('StartTime',0)
+        self.EndTime = get('EndTime',0)
+        filters = get('Filter')
+        self.ProgramFilters = (tuple([PyHDHR.getProgramFilter(name) for name in filters]) if filters else ()) #shared ProgramFilter objects
         
     def parse(self,parsestr,PyHDHR):
-        if 'SeriesID' in parsestr:
-            self.SeriesID = parsestr['SeriesID']
-        if 'EpisodeNumber' in parsestr:
-            self.EpisodeNumber = parsestr['EpisodeNumber']
-        if 'EpisodeTitle' in parsestr:
-            self.EpisodeTitle = parsestr['EpisodeTitle']
-        if 'Title' in parsestr:
-            self.Title = parsestr['Title']
-        if 'ImageURL' in parsestr:
-            self.ImageURL = parsestr['ImageURL']
-        if 'OriginalAirdate' in parsestr:
-            self.OriginalAirdate = parsestr['OriginalAirdate']
-        if 'Synopsis' in parsestr:
-            self.Synopsis = parsestr['Synopsis']
-        if 'StartTime' in parsestr:
-            self.StartTime = parsestr['StartTime']
-        if 'EndTime' in parsestr:
-            self.EndTime = parsestr['EndTime']
+        get = parsestr.get
+        self.SeriesID = internString(get('SeriesID',self.SeriesID))
+        self.EpisodeNumber = get('EpisodeNumber',self.EpisodeNumber)
+        self.EpisodeTitle = get('EpisodeTitle',self.EpisodeTitle)
+        self.Title = get('Title',self.Title)
+        self.ImageURL = get('ImageURL',self.ImageURL)
+        self.OriginalAirdate = get('OriginalAirdate',self.OriginalAirdate)
+        self.Synopsis = get('Synopsis',self.Synopsis)
+        self.StartTime = get('StartTime',self.StartTime)
+        self.EndTime = get('EndTime',self.EndTime)
         if 'Filter' in parsestr:
-            for filter in parsestr['Filter']:
-                f = PyHDHR.addProgramFilter(ProgramFilter(filter))
-                self.addProgramFilter(f)
+            self.ProgramFilters = self.ProgramFilters + tuple([PyHDHR.getProgramFilter(name) for name in parsestr['Filter']])
         
     def getSeriesID(self):
         return self.SeriesID
@@ -247,7 +477,7 @@ class ProgramInfo(object):
         return self.StartTime
 
     def addProgramFilter(self,ProgramFilter):
-        self.ProgramFilters.append(ProgramFilter)
+        self.ProgramFilters = self.ProgramFilters + (ProgramFilter,)
         
     def getProgramFilters(self):
         return self.ProgramFilters
@@ -256,89 +486,69 @@ class ProgramInfo(object):
         return self.EndTime
 
 class ProgramFilter(object):
-    Name = ""
+    __slots__ = ('Name',)
     
     def __init__(self,Name):
-        self.Name = Name      
+        self.Name = internString(Name)
 
     def getName(self):
         return self.Name
 
 class RecordedProgram(object):
-    Category =  ""
-    ChannelAffiliate = ""
-    ChannelImageURL =  ""
-    ChannelName =  ""
-    ChannelNumber =  ""
-    EndTime = 0
-    EpisodeNumber =  ""
-    EpisodeTitle = ""
-    FirstAiring = 0
-    ImageURL =  ""
-    OriginalAirdate = 0
-    ProgramID =  ""
-    RecordEndTime = 0
-    RecordStartTime = 0
-    RecordSuccess = -1
-    SeriesID =  ""
-    StartTime = 0
-    Synopsis =  ""
-    Title =  ""
-    DisplayGroupID =  ""
-    DisplayGroupTitle =  ""
-    PlayURL =  ""
-    CmdURL =  ""
+    __slots__ = ('Category', 'ChannelAffiliate', 'ChannelImageURL', 'ChannelName', 'ChannelNumber', 'EndTime', 'EpisodeNumber', 'EpisodeTitle',
+                 'FirstAiring', 'ImageURL', 'OriginalAirdate', 'ProgramID', 'RecordEndTime', 'RecordStartTime', 'RecordSuccess', 'SeriesID',
+                 'StartTime', 'Synopsis', 'Title', 'DisplayGroupID', 'DisplayGroupTitle', 'PlayURL', 'CmdURL')
     
     def __init__(self):
-        return
+        self.Category = ""
+        self.ChannelAffiliate = ""
+        self.ChannelImageURL = ""
+        self.ChannelName = ""
+        self.ChannelNumber = ""
+        self.EndTime = 0
+        self.EpisodeNumber = ""
+        self.EpisodeTitle = ""
+        self.FirstAiring = 0
+        self.ImageURL = ""
+        self.OriginalAirdate = 0
+        self.ProgramID = ""
+        self.RecordEndTime = 0
+        self.RecordStartTime = 0
+        self.RecordSuccess = -1
+        self.SeriesID = ""
+        self.StartTime = 0
+        self.Synopsis = ""
+        self.Title = ""
+        self.DisplayGroupID = ""
+        self.DisplayGroupTitle = ""
+        self.PlayURL = ""
+        self.CmdURL = ""
         
     def parse(self,parsestr):
-        if 'Category' in parsestr:
-            self.Category = parsestr['Category']
-        if 'ChannelAffiliate' in parsestr:
-            self.ChannelAffiliate = parsestr['ChannelAffiliate']
-        if 'ChannelImageURL' in parsestr:
-            self.ChannelImageURL = parsestr['ChannelImageURL']
-        if 'ChannelName' in parsestr:
-            self.ChannelName = parsestr['ChannelName']
-        if 'ChannelNumber' in parsestr:
-            self.ChannelNumber = parsestr['ChannelNumber']
-        if 'EndTime' in parsestr:
-            self.EndTime = parsestr['EndTime']
-        if 'EpisodeNumber' in parsestr:
-            self.EpisodeNumber = parsestr['EpisodeNumber']
-        if 'EpisodeTitle' in parsestr:
-            self.EpisodeTitle = parsestr['EpisodeTitle']
-        if 'FirstAiring' in parsestr:
-            self.FirstAiring = parsestr['FirstAiring']
-        if 'ImageURL' in parsestr:
-            self.ImageURL = parsestr['ImageURL']
-        if 'OriginalAirdate' in parsestr:
-            self.OriginalAirdate = parsestr['OriginalAirdate']
-        if 'ProgramID' in parsestr:
-            self.ProgramID = parsestr['ProgramID']
-        if 'RecordEndTime' in parsestr:
-            self.RecordEndTime = parsestr['RecordEndTime']
-        if 'RecordStartTime' in parsestr:
-            self.RecordStartTime = parsestr['RecordStartTime']
-        if 'RecordSuccess' in parsestr:
-            self.RecordSuccess = parsestr['RecordSuccess']
-        if 'SeriesID' in parsestr:
-            self.SeriesID = parsestr['SeriesID']
-        if 'StartTime' in parsestr:
-            self.StartTime = parsestr['StartTime']
-        if 'Synopsis' in parsestr:
-            self.Synopsis = parsestr['Synopsis']
-        if 'Title' in parsestr:
-            self.Title = parsestr['Title']
-        if 'DisplayGroupID' in parsestr:
-            self.DisplayGroupID = parsestr['DisplayGroupID']
-        if 'DisplayGroupTitle' in parsestr:
-            self.DisplayGroupTitle = parsestr['DisplayGroupTitle']
-        if 'PlayURL' in parsestr:
-            self.PlayURL = parsestr['PlayURL']
-        if 'CmdURL' in parsestr:
-            self.CmdURL = parsestr['CmdURL']
+        get = parsestr.get
+        self.Category = internString(get('Category',self.Category))
+        self.ChannelAffiliate = internString(get('ChannelAffiliate',self.ChannelAffiliate))
+        self.ChannelImageURL = get('ChannelImageURL',self.ChannelImageURL)
+        self.ChannelName = internString(get('ChannelName',self.ChannelName))
+        self.ChannelNumber = internString(get('ChannelNumber',self.ChannelNumber))
+        self.EndTime = get('EndTime',self.EndTime)
+        self.EpisodeNumber = get('EpisodeNumber',self.EpisodeNumber)
+        self.EpisodeTitle = get('EpisodeTitle',self.EpisodeTitle)
+        self.FirstAiring = get('FirstAiring',self.FirstAiring)
+        self.ImageURL = get('ImageURL',self.ImageURL)
+        self.OriginalAirdate = get('OriginalAirdate',self.OriginalAirdate)
+        self.ProgramID = get('ProgramID',self.ProgramID)
+        self.RecordEndTime = get('RecordEndTime',self.RecordEndTime)
+        self.RecordStartTime = get('RecordStartTime',self.RecordStartTime)
+        self.RecordSuccess = get('RecordSuccess',self.RecordSuccess)
+        self.SeriesID = internString(get('SeriesID',self.SeriesID))
+        self.StartTime = get('StartTime',self.StartTime)
+        self.Synopsis = get('Synopsis',self.Synopsis)
+        self.Title = get('Title',self.Title)
+        self.DisplayGroupID = internString(get('DisplayGroupID',self.DisplayGroupID))
+        self.DisplayGroupTitle = internString(get('DisplayGroupTitle',self.DisplayGroupTitle))
+        self.PlayURL = get('PlayURL',self.PlayURL)
+        self.CmdURL = get('CmdURL',self.CmdURL)
 
     def getCategory(self):
         return self.Category
@@ -410,38 +620,31 @@ class RecordedProgram(object):
         return self.CmdURL
 
 class RecordingRule(object):
-    SeriesID = ""
-    Title = ""
-    ImageURL = ""
-    RecentOnly = 0
-    Priority = 0
-    Synopsis = ""
-    EndPadding = 0
-    StartPadding = 0
-    RecordingRuleID = ""
+    __slots__ = ('SeriesID', 'Title', 'ImageURL', 'RecentOnly', 'Priority',
+                 'Synopsis', 'EndPadding', 'StartPadding', 'RecordingRuleID')
     
     def __init__(self):
-        return
+        self.SeriesID = ""
+        self.Title = ""
+        self.ImageURL = ""
+        self.RecentOnly = 0
+        self.Priority = 0
+        self.Synopsis = ""
+        self.EndPadding = 0
+        self.StartPadding = 0
+        self.RecordingRuleID = ""
         
     def parse(self,parsestr):
-        if 'SeriesID' in parsestr:
-            self.SeriesID = parsestr['SeriesID']
-        if 'Title' in parsestr:
-            self.Title = parsestr['Title']
-        if 'ImageURL' in parsestr:
-            self.ImageURL = parsestr['ImageURL']
-        if 'RecentOnly' in parsestr:
-            self.RecentOnly = parsestr['RecentOnly']
-        if 'Priority' in parsestr:
-            self.Priority = parsestr['Priority']
-        if 'Synopsis' in parsestr:
-            self.Synopsis = parsestr['Synopsis']
-        if 'EndPadding' in parsestr:
-            self.EndPadding = parsestr['EndPadding']
-        if 'StartPadding' in parsestr:
-            self.StartPadding = parsestr['StartPadding']
-        if 'RecordingRuleID' in parsestr:
-            self.RecordingRuleID = parsestr['RecordingRuleID']
+        get = parsestr.get
+        self.SeriesID = internString(get('SeriesID',self.SeriesID))
+        self.Title = get('Title',self.Title)
+        self.ImageURL = get('ImageURL',self.ImageURL)
+        self.RecentOnly = get('RecentOnly',self.RecentOnly)
+        self.Priority = get('Priority',self.Priority)
+        self.Synopsis = get('Synopsis',self.Synopsis)
+        self.EndPadding = get('EndPadding',self.EndPadding)
+        self.StartPadding = get('StartPadding',self.StartPadding)
+        self.RecordingRuleID = get('RecordingRuleID',self.RecordingRuleID)
         
     def getSeriesID(self):
         return self.SeriesID
@@ -588,9 +791,9 @@ class Tuner(BaseDevice):
 
         if self.ModelNumber == "HDTC-2US":
             try:
-                response = urllib2.urlopen(self.BaseURL+"/transcode.html",None,5)
+                response = urllib.request.urlopen(self.BaseURL+"/transcode.html",None,5)
 
-                regx = re.search('transcodeChanged\(\)">((.|\n)+?)</select>',response.read())
+                regx = re.search('transcodeChanged\(\)">((.|\n)+?)</select>',response.read().decode('utf-8','ignore'))
                 selecttags = regx.group(1)
 
                 regx = re.search('.+"(.*)".+selected=',selecttags)
@@ -633,20 +836,20 @@ class Tuner(BaseDevice):
     def processLineup(self,PyHDHR):
         self.discover()
         try:
-            self.SDCount = 0
-            self.HDCount = 0
-
-            response = urllib2.urlopen(self.LineupURL,None,5)
+            response = urllib.request.urlopen(self.LineupURL,None,5)
             data = json.loads(response.read())
-            for item in data:
-                if 'GuideNumber' in item:
-                    if item['GuideNumber'] in self.ChannelInfos:
-                        self.ChannelInfos[item['GuideNumber']].parse(item,self.PyHDHR)
-                    else:
-                        chaninfo = ChannelInfo(self)
-                        chaninfo.parse(item,self.PyHDHR)
-                        self.ChannelInfos[item['GuideNumber']] = chaninfo
-                    PyHDHR.registerChannelInfo(self.ChannelInfos[item['GuideNumber']],self)
+            with PyHDHR.Lock:
+                self.SDCount = 0
+                self.HDCount = 0
+                for item in data:
+                    if 'GuideNumber' in item:
+                        if item['GuideNumber'] in self.ChannelInfos:
+                            self.ChannelInfos[item['GuideNumber']].parse(item,self.PyHDHR)
+                        else:
+                            chaninfo = ChannelInfo(self)
+                            chaninfo.parse(item,self.PyHDHR)
+                            self.ChannelInfos[item['GuideNumber']] = chaninfo
+                        PyHDHR.registerChannelInfo(self.ChannelInfos[item['GuideNumber']],self)
             return True
         except Exception as e:
             Log.Critical("Exception in Tuner.processLineup while attempting to load: "+str(self.LineupURL))
@@ -657,17 +860,18 @@ class Tuner(BaseDevice):
         if not self.DeviceAuth:
             return False
         try:
-            response = urllib2.urlopen(URL_GUIDE_BASE + self.DeviceAuth,None,5)
+            response = urllib.request.urlopen(URL_GUIDE_BASE + self.DeviceAuth,None,5)
             data = json.loads(response.read())
-            for item in data:
-                if 'GuideNumber' in item:
-                    if item['GuideNumber'] in self.ChannelInfos:
-                        self.ChannelInfos[item['GuideNumber']].parse(item,self.PyHDHR)
-                    else:
-                        chaninfo = ChannelInfo(self)
-                        chaninfo.parse(item,self.PyHDHR)
-                        self.ChannelInfos[item['GuideNumber']] = chaninfo
-                    PyHDHR.registerChannelInfo(self.ChannelInfos[item['GuideNumber']],self)
+            with PyHDHR.Lock:
+                for item in data:
+                    if 'GuideNumber' in item:
+                        if item['GuideNumber'] in self.ChannelInfos:
+                            self.ChannelInfos[item['GuideNumber']].parse(item,self.PyHDHR)
+                        else:
+                            chaninfo = ChannelInfo(self)
+                            chaninfo.parse(item,self.PyHDHR)
+                            self.ChannelInfos[item['GuideNumber']] = chaninfo
+                        PyHDHR.registerChannelInfo(self.ChannelInfos[item['GuideNumber']],self)
             return True
         except Exception as e:
             Log.Critical("Exception in Tuner.processGuide while attempting to load: "+str(URL_GUIDE_BASE + self.DeviceAuth))
@@ -713,7 +917,7 @@ class DVR(BaseDevice):
         
     def discover(self):
         try:
-            response = urllib2.urlopen(self.DiscoverURL,None,5)
+            response = urllib.request.urlopen(self.DiscoverURL,None,5)
             data = json.loads(response.read())
             if 'FreeSpace' in data:
                 self.FreeSpace = data['FreeSpace']
@@ -742,6 +946,13 @@ class PyHDHR(object):
     SDDVREnabled = False
     SDDVRDiscover = 0
     ManualTunerIPs = set()
+    GuideIndex = SearchIndex() #(guideno, position in ProgramInfos) by title, episode title and synopsis
+    FilterIndex = SearchIndex() #same keys by program filter name
+    RecordedIndex = SearchIndex() #ProgramID by the fields searchRecorded looks at
+    GuideSizes = {} #guideno: programs indexed for the channel
+    NowNext = None #guideno: (now, next) snapshot, None when a guide reload made it stale
+    NowNextExpires = 0 #first programme boundary after the snapshot was taken
+    Lock = threading.RLock() #guards the shared tables above while devices are discovered in parallel
     
     def __init__(self):
         return
@@ -754,27 +965,38 @@ class PyHDHR(object):
                 if regx and ip not in self.ManualTunerIPs:
                     self.ManualTunerIPs.add(ip)
         
+    #a device thread that missed the discover deadline can still register while a caller reads,
+    #so the shared tables are only walked through copies taken under the lock.
     def getTuners(self):
         self.discover()
-        return self.Tuners
+        with self.Lock:
+            return dict(self.Tuners)
 
     def getDVRs(self):
         self.discover()
-        return self.DVRs
+        with self.Lock:
+            return dict(self.DVRs)
 
     def setDeviceAuth(self,DeviceID,DeviceAuth):
-        self.DeviceAuths[DeviceID] = DeviceAuth
+        with self.Lock:
+            self.DeviceAuths[DeviceID] = DeviceAuth
         
     def getDeviceAuth(self):
-        retstr = ""
-        for key in self.DeviceAuths:
-            retstr += self.DeviceAuths[key]
-        return retstr
+        with self.Lock:
+            auths = list(self.DeviceAuths.values())
+        return "".join(auths)
     
     def addProgramFilter(self,pf):
         if pf.getName() not in self.ProgramFilters:
             self.ProgramFilters[pf.getName()] = pf
         return self.ProgramFilters[pf.getName()]
+
+    def getProgramFilter(self,name):
+        #the shared ProgramFilter for name, made on first use
+        pf = self.ProgramFilters.get(name)
+        if pf is None:
+            pf = self.addProgramFilter(ProgramFilter(name))
+        return pf
         
     def getProgramFilters(self):
         self.discover()
@@ -783,15 +1005,17 @@ class PyHDHR(object):
     def getHDCount(self):
         self.discover()
         count = 0
-        for tunerkey in self.Tuners:
-            count = count + self.Tuners[tunerkey].getHDCount()
+        with self.Lock:
+            for tunerkey in self.Tuners:
+                count = count + self.Tuners[tunerkey].getHDCount()
         return count
 
     def getSDCount(self):
         self.discover()
         count = 0
-        for tunerkey in self.Tuners:
-            count = count + self.Tuners[tunerkey].getSDCount()
+        with self.Lock:
+            for tunerkey in self.Tuners:
+                count = count + self.Tuners[tunerkey].getSDCount()
         return count
         
     def registerChannelInfo(self,chaninfo,tuner):
@@ -803,8 +1027,47 @@ class PyHDHR(object):
             chans = []
             chans.append(tuner)
             self.ChannelLineup[chaninfo.getGuideNumber()] = chans
-        self.ChannelInfos[chaninfo.getGuideNumber()] = chaninfo
+        if self.ChannelInfos.get(chaninfo.getGuideNumber()) is not chaninfo:
+            self.ChannelInfos[chaninfo.getGuideNumber()] = chaninfo
+            self.indexGuide(chaninfo) #index positions point into the registered ChannelInfo's programs
         
+    def indexGuide(self,chaninfo):
+        guideno = chaninfo.getGuideNumber()
+        progs = chaninfo.getProgramInfos()
+        with self.Lock:
+            if self.ChannelInfos.get(guideno,chaninfo) is not chaninfo:
+                return #another tuner's copy of the channel is registered, its guide is the one indexed
+            for pos in range(len(progs),self.GuideSizes.get(guideno,0)):
+                self.GuideIndex.remove((guideno,pos))
+                self.FilterIndex.remove((guideno,pos))
+            for pos, prog in enumerate(progs):
+                self.GuideIndex.add((guideno,pos),tokenize(prog.getTitle(),prog.getEpisodeTitle(),prog.getSynopsis()))
+                self.FilterIndex.add((guideno,pos),tokenize(*[filter.getName() for filter in prog.getProgramFilters()]))
+            self.GuideSizes[guideno] = len(progs)
+            self.NowNext = None
+
+    def indexRecorded(self):
+        with self.Lock:
+            for key in self.RecordedIndex.keys():
+                if key not in self.RecordedPrograms:
+                    self.RecordedIndex.remove(key)
+            for key, prog in self.RecordedPrograms.items():
+                self.RecordedIndex.add(key,tokenize(prog.getTitle(),prog.getDisplayGroupTitle(),prog.getEpisodeTitle(),prog.getSynopsis(),
+                                                    prog.getChannelNumber(),prog.getChannelName(),prog.getChannelAffiliate(),prog.getCategory()))
+
+    def getGuideMatches(self,index,query):
+        #-> {guideno: [ProgramInfo]} of the programs matching query, in guide order
+        positions = {}
+        with self.Lock:
+            for guideno, pos in index.search(query):
+                positions.setdefault(guideno,[]).append(pos)
+            matches = {}
+            for guideno in positions:
+                if guideno in self.ChannelInfos:
+                    progs = self.ChannelInfos[guideno].getProgramInfos()
+                    matches[guideno] = [progs[pos] for pos in sorted(positions[guideno]) if pos < len(progs)]
+        return matches
+
     def getChannelInfo(self,guideno):
         if guideno in self.ChannelInfos:
             return self.ChannelInfos[guideno]
@@ -813,24 +1076,48 @@ class PyHDHR(object):
         
     def getChannelList(self):
         self.discover()
-        self.ChannelArray.sort()
-        return self.ChannelArray
+        with self.Lock:
+            self.ChannelArray.sort()
+            return list(self.ChannelArray)
         
+    def getNowNext(self):
+        #-> {guideno: (now, next)}, rebuilt only after a programme boundary or a guide reload
+        now = time.time()
+        with self.Lock:
+            if self.NowNext is None or now >= self.NowNextExpires:
+                nownext = {}
+                expires = float('inf')
+                for key in self.ChannelInfos:
+                    onprog, nextprog, boundary = self.ChannelInfos[key].getNowNext(now)
+                    if onprog is None and nextprog is None:
+                        continue
+                    nownext[self.ChannelInfos[key].getGuideNumber()] = (onprog, nextprog)
+                    if boundary is not None and boundary < expires:
+                        expires = boundary
+                self.NowNext = nownext
+                self.NowNextExpires = expires
+            return self.NowNext
+
     def getWhatsOn(self,guideno=None):
         self.discover()
+        nownext = self.getNowNext()
         
         if not guideno:
-            onprogs = {}
-            for key in self.ChannelInfos:
-                progs = self.ChannelInfos[key].getProgramInfos()
-                if len(progs) > 0:
-                    onprogs[self.ChannelInfos[key].getGuideNumber()] = progs[0]
-            return onprogs        
+            return dict([(key, nownext[key][0]) for key in nownext if nownext[key][0]])
         else:
-            if guideno in self.ChannelInfos:
-                progs = self.ChannelInfos[guideno].getProgramInfos()
-                if len(progs) > 0:
-                    return progs[0]
+            if guideno in nownext:
+                return nownext[guideno][0]
+        return None
+
+    def getWhatsNext(self,guideno=None):
+        self.discover()
+        nownext = self.getNowNext()
+        
+        if not guideno:
+            return dict([(key, nownext[key][1]) for key in nownext if nownext[key][1]])
+        else:
+            if guideno in nownext:
+                return nownext[guideno][1]
         return None
 
     def getLiveTVURL(self,guideno):
@@ -841,18 +1128,18 @@ class PyHDHR(object):
         
     def getLiveTVChannelInfo(self,guideno):
         self.discover(True)
-        for tunerkey in self.Tuners:
-            chaninfos = self.Tuners[tunerkey].getChannelInfos()
-            if guideno in chaninfos:
-                try:
-                    response = urllib2.urlopen(chaninfos[guideno].getURL()+"?duration=1",None,5)
-                    return chaninfos[guideno]
-                except Exception as e:
-                    regx = re.search('HTTP Error 503:',str(e))
-                    if regx != None:
-                        Log.Debug("All tuners in use on "+self.Tuners[tunerkey].getLocalIP())
-                    else:
-                        Log.Critical("Exception: "+str(e))
+        with self.Lock:
+            candidates = [(tuner, tuner.getChannelInfos()[guideno]) for tuner in self.Tuners.values() if guideno in tuner.getChannelInfos()]
+        for tuner, chaninfo in candidates:
+            try:
+                response = urllib.request.urlopen(chaninfo.getURL()+"?duration=1",None,5)
+                return chaninfo
+            except Exception as e:
+                regx = re.search('HTTP Error 503:',str(e))
+                if regx != None:
+                    Log.Debug("All tuners in use on "+tuner.getLocalIP())
+                else:
+                    Log.Critical("Exception: "+str(e))
         return None
                 
     def getRecordedPrograms(self,force=False):
@@ -865,18 +1152,21 @@ class PyHDHR(object):
         self.LastRecordedDiscover = time.time()
 
         self.RecordedPrograms = {}
-        for key in self.DVRs:
+        with self.Lock:
+            dvrs = dict(self.DVRs)
+        for key in dvrs:
             Log.Debug("getRecordedPrograms key:"+key)
             try:
-                response = urllib2.urlopen(self.DVRs[key].getStorageURL(),None,5)
+                response = urllib.request.urlopen(dvrs[key].getStorageURL(),None,5)
                 data = json.loads(response.read())
                 for item in data:
                     recprog = RecordedProgram()
                     recprog.parse(item)
                     self.RecordedPrograms[recprog.getProgramID()] = recprog
             except Exception as e:
-                Log.Critical("Exception in PyHDHR.getRecordedPrograms while attempting to load: "+str(self.DVRs[key].getStorageURL()))
+                Log.Critical("Exception in PyHDHR.getRecordedPrograms while attempting to load: "+str(dvrs[key].getStorageURL()))
                 Log.Critical(e)
+        self.indexRecorded()
         return self.RecordedPrograms
 
     def getFilteredRecordedPrograms(self,sortby=SortType.asc,grouptype=GroupType.All,groupby=None):
@@ -923,13 +1213,8 @@ class PyHDHR(object):
     def search(self,query):
         self.discover()
         foundprogs = {}
-        for guideno in self.ChannelArray:
-            for key in self.ChannelInfos[str(guideno)].getProgramInfos():
-                if(searchString(query,key.getTitle()) or
-                        searchString(query,key.getEpisodeTitle()) or
-                        searchString(query,key.getSynopsis())
-                ):
-                    foundprogs[str(guideno)] = key
+        for guideno, progs in self.getGuideMatches(self.GuideIndex,query).items():
+            foundprogs[guideno] = progs[-1] #the channel's last match, as the scan this replaces kept it
         return foundprogs
         
     def searchWhatsOn(self,query):
@@ -937,33 +1222,23 @@ class PyHDHR(object):
         progs = self.getWhatsOn()
         
         foundprogs = {}
-        for key in progs:
-            if(searchString(query,progs[key].getTitle()) or
-                    searchString(query,progs[key].getEpisodeTitle()) or
-                    searchString(query,progs[key].getSynopsis())
-            ):
-                foundprogs[key] = progs[key]
-            else:
-                for filter in progs[key].getProgramFilters():
-                    if searchString(query, filter.getName()):
-                        foundprogs[key] = progs[key]
-                        break
+        for index in (self.GuideIndex, self.FilterIndex):
+            for guideno, matches in self.getGuideMatches(index,query).items():
+                if guideno in progs and guideno not in foundprogs:
+                    for prog in matches:
+                        if prog is progs[guideno]:
+                            foundprogs[guideno] = prog
+                            break
         return foundprogs
         
     def searchRecorded(self,query):
         self.discover()
         progs = self.getRecordedPrograms()
         foundprogs = {}
-        for key in progs:
-            if(searchString(query,progs[key].getTitle()) or
-                    searchString(query,progs[key].getDisplayGroupTitle()) or
-                    searchString(query,progs[key].getEpisodeTitle()) or
-                    searchString(query,progs[key].getSynopsis()) or
-                    searchString(query,progs[key].getChannelNumber()) or
-                    searchString(query,progs[key].getChannelName()) or
-                    searchString(query,progs[key].getChannelAffiliate()) or
-                    searchString(query,progs[key].getCategory())
-            ):
+        with self.Lock:
+            keys = self.RecordedIndex.search(query)
+        for key in keys:
+            if key in progs:
                 foundprogs[key] = progs[key]
         return foundprogs
         
@@ -976,7 +1251,7 @@ class PyHDHR(object):
         if not self.getDeviceAuth():
             return False
         try:
-            response = urllib2.urlopen(URL_RECORDING_RULES+self.getDeviceAuth(),None,5)
+            response = urllib.request.urlopen(URL_RECORDING_RULES+self.getDeviceAuth(),None,5)
             data = json.loads(response.read())
             for item in data:
                 if 'RecordingRuleID' in item:
@@ -1002,8 +1277,7 @@ class PyHDHR(object):
         self.SDDVRDiscover = time.time()
             
         try:
-            response = urllib2.urlopen(URL_DISCOVER,None,5)
-            data = json.loads(response.read())
+            data = self.getDiscoverItems()
             for item in data:
                 if 'StorageID' in item:
                     self.SDDVREnabled = True
@@ -1019,48 +1293,21 @@ class PyHDHR(object):
                 return True
             
         self.LastDiscover = time.time()
+        deadline = self.LastDiscover + DISCOVER_DEADLINE
+        threads = []
         for ip in self.ManualTunerIPs:
-            tuner = Tuner(self)
-            tuner.setLocalIP(ip)
-            if tuner.discover():
-                if tuner.getDeviceID() in self.Tuners:
-                    if self.Tuners[tuner.getDeviceID()].discover():
-                        self.Tuners[tuner.getDeviceID()].processLineup(self)
-                        self.Tuners[tuner.getDeviceID()].processGuide(self)
-                else:
-                    tuner.processLineup(self)
-                    tuner.processGuide(self)
-                    self.Tuners[tuner.getDeviceID()] = tuner
+            threads.append(self.startThread(self.discoverManualTuner,ip))
         
         try:
-            response = urllib2.urlopen(URL_DISCOVER,None,5)
-            data = json.loads(response.read())
+            data = self.getDiscoverItems(force)
             for item in data:
                 if 'StorageID' in item and 'StorageURL' in item:
                     #DVR
-                    if item['StorageID'] in self.DVRs:
-                        self.DVRs[item['StorageID']].parse(item)
-                        self.DVRs[item['StorageID']].discover()
-                    else:
-                        dvr = DVR()
-                        dvr.parse(item)
-                        if dvr.discover():
-                            self.DVRs[item['StorageID']] = dvr
+                    threads.append(self.startThread(self.discoverDVR,item))
                 elif 'DeviceID' in item and 'LineupURL' in item:
                     if len(self.ManualTunerIPs) == 0:
                         #Tuner
-                        if item['DeviceID'] in self.Tuners:
-                            self.Tuners[item['DeviceID']].parse(item)
-                            if self.Tuners[item['DeviceID']].discover():
-                                self.Tuners[item['DeviceID']].processLineup(self)
-                                self.Tuners[item['DeviceID']].processGuide(self)
-                        else:
-                            tuner = Tuner(self)
-                            tuner.parse(item)
-                            if tuner.discover():
-                                tuner.processLineup(self)
-                                tuner.processGuide(self)
-                                self.Tuners[item['DeviceID']] = tuner
+                        threads.append(self.startThread(self.discoverTuner,item))
                     else:
                         Log.Debug("PyHDHR.discover - ignoring tuner (in manual config mode)")
                 else:
@@ -1070,13 +1317,83 @@ class PyHDHR(object):
             Log.Critical("Exception in PyHDHR.discover while attempting to load: "+str(URL_DISCOVER))
             Log.Critical(e)
             return False
+        finally:
+            self.joinThreads(threads,deadline)
+
+    def getDiscoverItems(self,force=False):
+        #devices answering the LAN broadcast, the cloud listing only when none do.
+        items = Discovery.getDevices(force)
+        if items:
+            return items
+        response = urllib.request.urlopen(URL_DISCOVER,None,5)
+        return json.loads(response.read())
+
+    def startThread(self,target,arg):
+        thread = threading.Thread(target=target,args=(arg,),name="PyHDHR.discover")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def joinThreads(self,threads,deadline):
+        #a device still answering at the deadline is left behind, it registers itself if it finishes later.
+        for thread in threads:
+            thread.join(max(0,deadline - time.time()))
+        pending = len([thread for thread in threads if thread.is_alive()])
+        if pending:
+            Log.Warn("PyHDHR.discover - "+str(pending)+" device(s) did not answer within "+str(DISCOVER_DEADLINE)+"s")
+
+    def discoverManualTuner(self,ip):
+        tuner = Tuner(self)
+        tuner.setLocalIP(ip)
+        if tuner.discover():
+            with self.Lock:
+                known = self.Tuners.get(tuner.getDeviceID())
+            if known:
+                if known.discover():
+                    known.processLineup(self)
+                    known.processGuide(self)
+            else:
+                tuner.processLineup(self)
+                tuner.processGuide(self)
+                with self.Lock:
+                    self.Tuners[tuner.getDeviceID()] = tuner
+
+    def discoverTuner(self,item):
+        with self.Lock:
+            known = self.Tuners.get(item['DeviceID'])
+        if known:
+            known.parse(item)
+            if known.discover():
+                known.processLineup(self)
+                known.processGuide(self)
+        else:
+            tuner = Tuner(self)
+            tuner.parse(item)
+            if tuner.discover():
+                tuner.processLineup(self)
+                tuner.processGuide(self)
+                with self.Lock:
+                    self.Tuners[item['DeviceID']] = tuner
+
+    def discoverDVR(self,item):
+        with self.Lock:
+            known = self.DVRs.get(item['StorageID'])
+        if known:
+            known.parse(item)
+            known.discover()
+        else:
+            dvr = DVR()
+            dvr.parse(item)
+            if dvr.discover():
+                with self.Lock:
+                    self.DVRs[item['StorageID']] = dvr
             
     def discoveryDebug(self):
         outputstr = ""
         outputstr = outputstr+"<<< Discovery Debug >>>\n"
         try:
             outputstr = outputstr+"<<< Discover (MAIN): "+URL_DISCOVER+" >>>\n"
-            response = urllib2.urlopen(URL_DISCOVER,None,5)
+            response = urllib.request.urlopen(URL_DISCOVER,None,5)
             data = json.loads(response.read())
             outputstr = outputstr+"<<< (MAIN) >>>\n<<<\n"+str(data)+"\n>>>\n"
             for item in data:
@@ -1084,7 +1401,7 @@ class PyHDHR(object):
                     #DVR
                     outputstr = outputstr+"<<< Discover (DVR): "+item['DiscoverURL']+" >>>\n"
                     try:
-                        response1 = urllib2.urlopen(item['DiscoverURL'],None,5)
+                        response1 = urllib.request.urlopen(item['DiscoverURL'],None,5)
                         data1 = json.loads(response1.read())
                         outputstr = outputstr+"<<< (DVR) >>>\n<<<\n"+str(data1)+"\n>>>\n"
                     except Exception as e:
@@ -1093,7 +1410,7 @@ class PyHDHR(object):
                         Log.Critical("dump (failed):\n"+outputstr+"")
                     outputstr = outputstr+"<<< Discover (DVR_STORAGE): "+item['StorageURL']+" >>>\n"
                     try:
-                        response1 = urllib2.urlopen(item['StorageURL'],None,5)
+                        response1 = urllib.request.urlopen(item['StorageURL'],None,5)
                         data1 = json.loads(response1.read())
                         outputstr = outputstr+"<<< (DVR_STORAGE) >>>\n<<<\n"+str(data1)+"\n>>>\n"
                     except Exception as e:
@@ -1104,7 +1421,7 @@ class PyHDHR(object):
                     #Tuner
                     outputstr = outputstr+"<<< Discover (TUNER): "+item['DiscoverURL']+" >>>\n"
                     try:
-                        response1 = urllib2.urlopen(item['DiscoverURL'],None,5)
+                        response1 = urllib.request.urlopen(item['DiscoverURL'],None,5)
                         data1 = json.loads(response1.read())
                         outputstr = outputstr+"<<< (TUNER) >>>\n<<<\n"+str(data1)+"\n>>>\n"
                     except Exception as e:
@@ -1113,7 +1430,7 @@ class PyHDHR(object):
                         Log.Critical("dump (failed):\n"+outputstr+"")
                     outputstr = outputstr+"<<< Discover (TUNER_LINEUP): "+item['LineupURL']+" >>>\n"
                     try:
-                        response1 = urllib2.urlopen(item['LineupURL'],None,5)
+                        response1 = urllib.request.urlopen(item['LineupURL'],None,5)
                         data1 = json.loads(response1.read())
                         outputstr = outputstr+"<<< (TUNER_LINEUP) >>>\n<<<\n"+str(data1)+"\n>>>\n"
                     except Exception as e:
@@ -1134,7 +1451,7 @@ class PyHDHR(object):
         f.write("Full Discovery\n")
         try:
             f.write("\nDiscover: "+URL_DISCOVER+"\n")
-            response = urllib2.urlopen(URL_DISCOVER,None,5)
+            response = urllib.request.urlopen(URL_DISCOVER,None,5)
             data = json.loads(response.read())
             f.write("\nRAW:\n"+str(data)+"\n\nFormatted:\n")
             for item in data:
@@ -1147,7 +1464,7 @@ class PyHDHR(object):
                     #DVR
                     f.write("\nDiscover DVR: "+item['DiscoverURL']+"\n")
                     try:
-                        response1 = urllib2.urlopen(item['DiscoverURL'],None,5)
+                        response1 = urllib.request.urlopen(item['DiscoverURL'],None,5)
                         data1 = json.loads(response1.read())
                         f.write("\nRAW:\n"+str(data1)+"\n\nFormatted:\n")
                         for key1 in data1:
@@ -1160,7 +1477,7 @@ class PyHDHR(object):
                         Log.Critical(e)
                     f.write("\nDiscover DVR Storage: "+item['StorageURL']+"\n")                    
                     try:
-                        response1 = urllib2.urlopen(item['StorageURL'],None,5)
+                        response1 = urllib.request.urlopen(item['StorageURL'],None,5)
                         data1 = json.loads(response1.read())
                         f.write("\nRAW:\n"+str(data1)+"\n\nFormatted:\n")
                         for item1 in data1:
@@ -1177,7 +1494,7 @@ class PyHDHR(object):
                     #Tuner
                     f.write("\nDiscover Tuner: "+item['DiscoverURL']+"\n")
                     try:
-                        response1 = urllib2.urlopen(item['DiscoverURL'],None,5)
+                        response1 = urllib.request.urlopen(item['DiscoverURL'],None,5)
                         data1 = json.loads(response1.read())
                         f.write("\nRAW:\n"+str(data1)+"\n\nFormatted:\n")
                         for key1 in data1:
@@ -1190,7 +1507,7 @@ class PyHDHR(object):
                         Log.Critical(e)
                     f.write("\nDiscover Tuner Lineup: "+item['LineupURL']+"\n")
                     try:
-                        response1 = urllib2.urlopen(item['LineupURL'],None,5)
+                        response1 = urllib.request.urlopen(item['LineupURL'],None,5)
                         data1 = json.loads(response1.read())
                         f.write("\nRAW:\n"+str(data1)+"\n\nFormatted:\n")
                         for item1 in data1:
@@ -59,6 +59,7 @@ def busy_dialog():
 
 def log(msg, level=xbmc.LOGDEBUG):
     if DEBUG == False and level != xbmc.LOGERROR: return
+    if callable(msg): msg = msg()
     if level == xbmc.LOGERROR: msg += ' ,' + traceback.format_exc()
     xbmc.log(ADDON_ID + '-' + ADDON_VERSION + '-' + msg, level)
 
@@ -123,7 +124,7 @@ def busyDialog(percent=0, control=None):
     return control
         
 def buildListItem(item):
-    log('buildListItem, item = ' + str(item))
+    log(lambda: 'buildListItem, item = ' + str(item))
     try: 
         label, label2, url = tuple(item)
         liz = xbmcgui.ListItem(label, label2, path=url)
@@ -200,7 +201,7 @@ class SCAN(object):
 
     def openURL(self, url):
         try:
-            log('openURL, url = ' + str(url))
+            log(lambda: 'openURL, url = ' + str(url))
             cacheresponse = self.cache.get(ADDON_NAME + '.openURL, url = %s'%url)
             if not cacheresponse:
                 headers = {'User-Agent':'Kodi-Auditor'}
@@ -239,7 +240,7 @@ class SCAN(object):
         
 
     def checkID(self, id):
-        log('checkID, id = %s'%id)
+        log(lambda: 'checkID, id = %s'%id)
         match = self.scanID(id)
         if match: setProperty('checkID.%s'%(id),str(match[0][0]))
         
@@ -296,7 +297,7 @@ class SCAN(object):
             self.pUpdate = (idx1) * 100 // pTotal
             if not background: self.pDialog = progressDialog(self.pUpdate, control=self.pDialog, string1=LANGUAGE(32016))
             found, error, kodiModule = self.findModule(myModule, self.kodiModules[repository], background)
-            log('scanModules, myModule = %s, repository = %s, found = %s'%(myModule['addonid'],repository, found))
+            log(lambda: 'scanModules, myModule = %s, repository = %s, found = %s'%(myModule['addonid'],repository, found))
             verifed = 'True' if found and not error else 'False'
             if not background: self.pDialog = progressDialog(self.pUpdate, control=self.pDialog, string2=LANGUAGE(32017)%((myModule['addonid'])))
             if found and error:
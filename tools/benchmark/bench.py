@@ -0,0 +1,532 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+"""
+Replay the recorded provider payloads in fixtures/ through the live TV guide
+builders under the stub Kodi runtime, and report wall time, peak memory and
+allocations per stage.
+
+    python tools/benchmark/bench.py [provider ...] [--scale N] [--repeat N] [--threads] [--json] [--smoke]
+
+Each run is a fresh process with an empty Kodi profile, so every number is a
+cold build. Stage times are exclusive: a write that sorts reports the sort
+under 'sort' only. 'replay' is the harness serving the fixtures and is not
+add-on time. --smoke makes one untimed pass instead and exits non zero when
+a provider is skipped, makes no requests or builds nothing, for CI.
+"""
+import os, re, sys, json, time, copy, argparse, calendar, datetime, functools, inspect
+import subprocess, tempfile, shutil, threading
+
+try:    import resource
+except ImportError: resource = None #windows
+try:    import tracemalloc
+except ImportError: tracemalloc = None
+
+HERE      = os.path.dirname(os.path.abspath(__file__))
+ROOT      = os.path.dirname(os.path.dirname(HERE))
+STUBS     = os.path.join(ROOT, 'tools', 'kodistub')
+FIXTURES  = os.path.join(HERE, 'fixtures')
+RECORDED  = datetime.datetime(2020, 6, 1, 12, 0, 0) #utc hour the fixtures start at, replayed as the current hour
+STAGES    = ('fetch', 'parse', 'build', 'sort', 'write', 'replay')
+ISO_TIME  = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d)(?::(\d\d)(\.\d+)?)?Z')
+EPOCH     = re.compile(r'(?<=[:\[,])(\d{10}|\d{13})(?=[,\]}])')
+PROVIDERS = {}
+SETTINGS  = {'locast':{'User_Email':'bench@example.com'}} #over the defaults, so the add-on gets past its login
+
+def provider(addonid, module):
+    #register the fixture routes of an add-on, the build that times them follows with build().
+    def decorator(func):
+        PROVIDERS[addonid.split('.')[-1]] = {'addonid':addonid, 'module':module, 'routes':func, 'build':None}
+        return func
+    return decorator
+
+
+def build(name):
+    def decorator(func):
+        PROVIDERS[name]['build'] = func
+        return func
+    return decorator
+
+
+class Recorder(object):
+    """
+    Exclusive per stage wall time, call count, peak traced memory, net
+    allocated blocks and the process peak RSS seen when each stage ended.
+    """
+    def __init__(self, memory=False):
+        self.memory = (memory and tracemalloc is not None)
+        self.stats  = dict([(stage, {'calls':0, 'ms':0.0, 'peak_kib':0, 'blocks':0, 'rss_mib':0}) for stage in STAGES])
+        self.local  = threading.local()
+        if self.memory: tracemalloc.start()
+
+
+    def stack(self):
+        try: return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+
+    def notePeak(self, stack):
+        if not self.memory or not stack: return
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in stack: frame['peak'] = max(frame['peak'], peak)
+
+
+    def enter(self, stage):
+        stack = self.stack()
+        frame = {'stage':stage, 'child':0.0, 'childblocks':0, 'mem':0, 'peak':0}
+        if self.memory:
+            self.notePeak(stack)
+            if hasattr(tracemalloc, 'reset_peak'): tracemalloc.reset_peak()
+            frame['mem'] = frame['peak'] = tracemalloc.get_traced_memory()[0]
+        stack.append(frame)
+        frame['blocks'] = sys.getallocatedblocks()
+        frame['start']  = time.perf_counter()
+        return frame
+
+
+    def exit(self, frame):
+        elapsed = time.perf_counter() - frame['start']
+        blocks  = sys.getallocatedblocks() - frame['blocks']
+        stack   = self.stack()
+        self.notePeak(stack)
+        stack.pop()
+        if stack:
+            stack[-1]['child']       += elapsed
+            stack[-1]['childblocks'] += blocks
+        stats = self.stats.setdefault(frame['stage'], {'calls':0, 'ms':0.0, 'peak_kib':0, 'blocks':0, 'rss_mib':0})
+        stats['calls']  += 1
+        stats['ms']     += (elapsed - frame['child']) * 1000
+        stats['blocks'] += blocks - frame['childblocks']
+        if self.memory: stats['peak_kib'] = max(stats['peak_kib'], (frame['peak'] - frame['mem']) // 1024)
+        stats['rss_mib'] = max(stats['rss_mib'], getRSS())
+
+
+    def span(self, stage):
+        recorder = self
+        class Span(object):
+            def __enter__(self):
+                self.frame = recorder.enter(stage)
+            def __exit__(self, *args):
+                recorder.exit(self.frame)
+        return Span()
+
+
+    def wrap(self, owner, stages):
+        #time methods (or module functions) of 'owner' under their stage, generators per item.
+        for name, stage in stages.items():
+            raw = (owner.__dict__[name] if inspect.isclass(owner) else getattr(owner, name))
+            setattr(owner, name, self.timed(raw, stage))
+
+
+    def timed(self, raw, stage):
+        recorder = self
+        if inspect.isgeneratorfunction(raw):
+            @functools.wraps(raw)
+            def timedGenerator(*args, **kwargs):
+                items = raw(*args, **kwargs)
+                while True:
+                    with recorder.span(stage):
+                        try: item = next(items)
+                        except StopIteration: return
+                    yield item
+            return timedGenerator
+        @functools.wraps(raw)
+        def timedCall(*args, **kwargs):
+            with recorder.span(stage): return raw(*args, **kwargs)
+        return timedCall
+
+
+def getRSS():
+    if resource is None: return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // (1024 * 1024) if sys.platform == 'darwin' else rss // 1024
+
+
+class Response(object):
+    """
+    The parts of a requests response (and of a urllib one) the add-ons use.
+    """
+    def __init__(self, recorder, url, body, status_code=200):
+        self.recorder    = recorder
+        self.url         = url
+        self.body        = body
+        self.status_code = status_code
+        self.ok          = status_code < 400
+        self.headers     = {}
+        self.encoding    = 'utf-8'
+        self.offset      = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    @property
+    def content(self):
+        return self.body
+
+
+    @property
+    def text(self):
+        return self.body.decode(self.encoding or 'utf-8')
+
+
+    def json(self, **kwargs):
+        with self.recorder.span('parse'): return json.loads(self.text, **kwargs)
+
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False):
+        for line in self.body.splitlines():
+            yield line.decode(self.encoding or 'utf-8') if decode_unicode else line
+
+
+    def read(self, amt=-1):
+        end = len(self.body) if amt is None or amt < 0 else self.offset + amt
+        data, self.offset = self.body[self.offset:end], min(end, len(self.body))
+        return data
+
+
+    def raise_for_status(self):
+        if not self.ok: raise IOError('%s for url: %s'%(self.status_code, self.url))
+
+
+    def close(self):
+        pass
+
+
+class Transport(object):
+    """
+    Stands in for requests.get/post/Session and urlopen, answering each url
+    from the first matching route.
+    """
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.routes   = []
+        self.headers  = {}
+        self.requests = 0
+
+
+    def route(self, pattern, handler):
+        self.routes.append((re.compile(pattern), handler))
+
+
+    def get(self, url, params=None, **kwargs):
+        self.requests += 1
+        with self.recorder.span('replay'):
+            for pattern, handler in self.routes:
+                match = pattern.search(url)
+                if match is None: continue
+                body = (handler(match) if callable(handler) else handler)
+                if not isinstance(body, bytes): body = json.dumps(body).encode('utf-8')
+                return Response(self.recorder, url, body)
+            return Response(self.recorder, url, b'{}', 404)
+
+
+    def post(self, url, data=None, **kwargs):
+        return self.get(url, **kwargs)
+
+
+    def urlopen(self, url, *args, **kwargs):
+        #urllib raises on an error status where requests hands the response back.
+        response = self.get(getattr(url, 'full_url', url))
+        response.raise_for_status()
+        return response
+
+
+    def session(self, *args, **kwargs):
+        return self
+
+
+    def mount(self, prefix, adapter):
+        pass
+
+
+    def close(self):
+        pass
+
+
+def rebase(text, delta):
+    #move the recorded air times to now, leave older dates (release dates, birthdays) alone.
+    first = calendar.timegm((RECORDED - datetime.timedelta(days=1)).timetuple())
+    last  = calendar.timegm((RECORDED + datetime.timedelta(days=2)).timetuple())
+    def iso(match):
+        stamp = datetime.datetime(*[int(value) for value in match.groups()[:5]] + [int(match.group(6) or 0)])
+        if not first <= calendar.timegm(stamp.timetuple()) <= last: return match.group(0)
+        moved = stamp + delta
+        text  = moved.strftime('%Y-%m-%dT%H:%M')
+        if match.group(6) is not None: text += moved.strftime(':%S')
+        return text + (match.group(7) or '') + 'Z'
+    def epoch(match):
+        value = int(match.group(1))
+        scale = (1000 if len(match.group(1)) == 13 else 1)
+        if not first <= value // scale <= last: return match.group(0)
+        return str(value + int(delta.total_seconds()) * scale)
+    return EPOCH.sub(epoch, ISO_TIME.sub(iso, text))
+
+
+class Bench(object):
+    def __init__(self, addonid, scale=1, memory=False, threads=False):
+        self.addonid   = addonid
+        self.scale     = max(1, scale)
+        self.threads   = threads
+        self.recorder  = Recorder(memory)
+        self.transport = Transport(self.recorder)
+        now            = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self.delta     = now - RECORDED
+
+
+    def fixture(self, name, parse=True):
+        with open(os.path.join(FIXTURES, name), 'rb') as fle:
+            text = rebase(fle.read().decode('utf-8'), self.delta)
+        return json.loads(text) if parse else text.encode('utf-8')
+
+
+    def replay(self, settings=None):
+        #answer the add-on's requests from the fixtures, under the stub runtime.
+        import _kodistub, requests
+        _kodistub.ADDON_ID = self.addonid
+        _kodistub.getSettings(self.addonid).update(settings or {})
+        requests.get, requests.post, requests.Session = self.transport.get, self.transport.post, self.transport.session
+        try:
+            from urllib import request as urlrequest
+            urlrequest.urlopen = self.transport.urlopen
+        except ImportError: pass
+        PROVIDERS[self.addonid.split('.')[-1]]['routes'](self)
+
+
+    def addon(self, module):
+        #import resources.lib.<module> of the add-on with the network already replaced.
+        sys.path.insert(0, os.path.join(ROOT, self.addonid))
+        __import__('resources.lib.%s'%(module))
+        if not self.threads:
+            try:
+                executor = __import__('resources.lib.executor', fromlist=['Executor'])
+                executor.Executor.getPool = lambda self: None
+            except ImportError: pass
+        return sys.modules['resources.lib.%s'%(module)]
+
+
+    def run(self, method, *args):
+        start = time.perf_counter()
+        method(*args)
+        total = (time.perf_counter() - start) * 1000
+        stats = dict([(stage, value) for stage, value in self.recorder.stats.items() if value['calls']])
+        return {'provider':self.addonid, 'scale':self.scale, 'total_ms':total, 'requests':self.transport.requests,
+                'rss_mib':getRSS(), 'stages':stats, 'memory':self.recorder.memory}
+
+
+def scaled(items, scale, change):
+    #the recorded channels plus 'scale' - 1 renumbered copies of them.
+    out = list(items)
+    for copyno in range(1, scale):
+        for item in items:
+            item = copy.deepcopy(item)
+            change(item, copyno)
+            out.append(item)
+    return out
+
+
+def guideWindow(guide, match):
+    start, stop = [urlTime(value) for value in match.groups()]
+    channels = []
+    for channel in guide['channels']:
+        timelines = [program for program in channel['timelines'] if program['stop'] > start and program['start'] < stop]
+        channels.append(dict(channel, timelines=timelines))
+    return dict(guide, channels=channels)
+
+
+def urlTime(value):
+    #'%Y-%m-%dT%H:00:00Z' as it compares against the fixtures' '%Y-%m-%dT%H:%M:%S.000Z'
+    return value.replace('%3A', ':').rstrip('Z') + '.000Z'
+
+
+@provider('plugin.video.plutotv', 'plutotv')
+def plutotv(bench):
+    def renumber(channel, copyno):
+        channel['_id']    = '%s-%s'%(channel['_id'], copyno)
+        channel['number'] = channel['number'] + 1000 * copyno
+    guide    = bench.fixture('plutotv/guide.json')
+    channels = scaled(bench.fixture('plutotv/channels.json'), bench.scale, renumber)
+    guide['channels'] = scaled(guide['channels'], bench.scale, renumber)
+    bench.transport.route(r'/v2/channels(?:\.json)?(?:\?|$)', channels)
+    bench.transport.route(r'/v1/guide\?start=([^&]+)&stop=([^&]+)', lambda match: guideWindow(guide, match))
+
+
+@build('plutotv')
+def buildPlutoTV(bench):
+    module = bench.addon('plutotv')
+    bench.recorder.wrap(module.PlutoTV, {'getURL':'fetch', 'getGuideChunks':'parse', 'buildM3U':'build', 'buildXMLTV':'build',
+                                         'sortChannels':'sort', 'sortProgrammes':'sort', 'save':'write'})
+    return bench.run(lambda: module.PlutoTV(['plugin://plugin.video.plutotv/', '1', '']).buildService())
+
+
+@provider('plugin.video.channelsdvr', 'channelsdvr')
+def channelsdvr(bench):
+    lines  = bench.fixture('channelsdvr/channels.m3u', parse=False).decode('utf-8').splitlines()
+    m3u    = lines[:1]
+    for copyno in range(bench.scale):
+        for line in lines[1:]:
+            if copyno: line = re.sub(r'(channel-id|tvg-chno)="([\d.]+)"', lambda match: '%s="%g"'%(match.group(1), copyno * 1000 + float(match.group(2))), line)
+            m3u.append(line)
+    def renumber(content, copyno):
+        content['Channel']['Number'] = '%g'%(copyno * 1000 + float(content['Channel']['Number']))
+    guide  = scaled(bench.fixture('channelsdvr/guide.json'), bench.scale, renumber)
+    bench.transport.route(r'/devices/ANY/channels\.m3u', '\n'.join(m3u).encode('utf-8'))
+    bench.transport.route(r'/devices/ANY/guide', guide)
+
+
+@build('channelsdvr')
+def buildChannelsDVR(bench):
+    module = bench.addon('channelsdvr')
+    bench.recorder.wrap(module.Channels, {'openURL':'fetch', 'getM3U':'fetch', 'getChannels':'parse', 'getGuidedata':'parse',
+                                          'buildM3U':'build', 'buildXMLTV':'build', 'sortChannels':'sort', 'sortProgrammes':'sort',
+                                          'saveM3U':'write', 'saveXMLTV':'write'})
+    return bench.run(lambda: module.Channels(['plugin://plugin.video.channelsdvr/', '1', '']).buildService())
+
+
+@provider('plugin.video.locast', 'locast')
+def locast(bench):
+    def renumber(station, copyno):
+        station['id'] = station['id'] + 100000 * copyno
+    bench.transport.route(r'ip-api\.com/json', bench.fixture('locast/geo.json'))
+    bench.transport.route(r'/user/me', bench.fixture('locast/user.json'))
+    bench.transport.route(r'/watch/dma/', bench.fixture('locast/dma.json'))
+    bench.transport.route(r'/watch/epg/', scaled(bench.fixture('locast/epg.json'), bench.scale, renumber))
+
+
+@build('locast')
+def buildLocast(bench):
+    module = bench.addon('locast')
+    bench.recorder.wrap(module.Locast, {'getURL':'fetch', 'postURL':'fetch', 'setRegion':'fetch', 'getGuideRows':'parse',
+                                        'buildListings':'build', 'buildStation':'build'})
+    bench.recorder.wrap(module.GuideStore, {'load':'write'})
+    def build():
+        addon = module.Locast(['plugin://plugin.video.locast/', '1', ''])
+        city  = addon.getRegion()
+        addon.getStations('', city, 'Live')
+        addon.uEPG()
+    return bench.run(build)
+
+
+@provider('plugin.video.xumotv', 'xumotv')
+def xumotv(bench):
+    assets = bench.fixture('xumotv/assets.json')
+    bench.transport.route(r'xumo\.tv/?$', bench.fixture('xumotv/home.html', parse=False))
+    bench.transport.route(r'/channels/list/[^/]+\.json', bench.fixture('xumotv/channels.json'))
+    bench.transport.route(r'/onnowandnext\.json', bench.fixture('xumotv/onnowandnext.json'))
+    bench.transport.route(r'/assets/asset/([^.]+)\.json', lambda match: assets.get(match.group(1), {}))
+
+
+@build('xumotv')
+def buildXumoTV(bench):
+    module = bench.addon('xumotv')
+    bench.recorder.wrap(module.XumoTV, {'openURL':'fetch', 'getChannels':'parse', 'getOnNEXT':'parse', 'buildGuide':'build'})
+    return bench.run(lambda: module.XumoTV(['plugin://plugin.video.xumotv/', '1', '']).uEPG())
+
+
+def child(args):
+    sys.path.insert(0, STUBS)
+    bench = Bench(PROVIDERS[args.child]['addonid'], args.scale, args.memory, args.threads)
+    try:
+        bench.replay(SETTINGS.get(args.child))
+        result = PROVIDERS[args.child]['build'](bench)
+    except (ImportError, SyntaxError) as e:
+        result = {'provider':bench.addonid, 'skipped':'%s: %s'%(type(e).__name__, e)}
+    sys.stdout.write('\n%s\n'%(json.dumps(result)))
+
+
+def spawn(name, args, memory):
+    home = tempfile.mkdtemp(prefix='kodistub-')
+    env  = dict(os.environ, KODISTUB_HOME=home, PYTHONPATH=os.pathsep.join([STUBS, os.environ.get('PYTHONPATH', '')]))
+    cmd  = [sys.executable, os.path.abspath(__file__), '--child', name, '--scale', str(args.scale)]
+    if memory:       cmd.append('--memory')
+    if args.threads: cmd.append('--threads')
+    try:
+        output = subprocess.check_output(cmd, env=env, cwd=ROOT).decode('utf-8')
+        return json.loads(output.strip().splitlines()[-1])
+    except subprocess.CalledProcessError as e:
+        return {'provider':name, 'skipped':'exit status %s'%(e.returncode)}
+    finally: shutil.rmtree(home, ignore_errors=True)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+
+def report(name, timings, traced):
+    if 'skipped' in traced:
+        print('%s: skipped, %s'%(name, traced['skipped']))
+        return
+    print('%s (scale %s, %s requests, total %.1f ms median of %s, peak rss %s MiB)'%(traced['provider'], traced['scale'], traced['requests'],
+          median([run['total_ms'] for run in timings]), len(timings), traced['rss_mib']))
+    print('  %-8s %7s %10s %10s %10s %8s'%('stage', 'calls', 'wall ms', 'peak KiB', 'blocks', 'rss MiB'))
+    for stage in STAGES:
+        if stage not in traced['stages']: continue
+        stats = traced['stages'][stage]
+        wall  = median([run['stages'].get(stage, {}).get('ms', 0) for run in timings])
+        print('  %-8s %7d %10.1f %10s %10d %8d'%(stage, stats['calls'], wall, (stats['peak_kib'] if traced['memory'] else '-'), stats['blocks'], stats['rss_mib']))
+
+
+def smoke(name, args):
+    #-> the reason a single replayed build is not sane, None when it is.
+    result = spawn(name, args, memory=False)
+    if 'skipped' in result: return 'skipped, %s'%(result['skipped'])
+    if not result['requests']: return 'made no requests'
+    if not result['stages'].get('build', {}).get('calls'): return 'built nothing'
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('providers', nargs='*', help='any of %s, default all'%(', '.join(sorted(PROVIDERS))))
+    parser.add_argument('--scale'  , type=int, default=1, help='replay the recorded channels this many times over')
+    parser.add_argument('--repeat' , type=int, default=3, help='timed runs per provider, the median is reported')
+    parser.add_argument('--threads', action='store_true', help='keep the add-ons\' thread pools, stage times then add up past the total')
+    parser.add_argument('--json'   , action='store_true', help='print the raw results')
+    parser.add_argument('--smoke'  , action='store_true', help='one untimed run per provider, exit status 1 when any fails')
+    parser.add_argument('--child'  , help=argparse.SUPPRESS)
+    parser.add_argument('--memory' , action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child: return child(args)
+    for name in args.providers:
+        if name not in PROVIDERS: parser.error('unknown provider %s'%(name))
+
+    if args.smoke:
+        failed = [(name, smoke(name, args)) for name in (args.providers or sorted(PROVIDERS))]
+        for name, reason in failed: print('%s: %s'%(name, (reason or 'ok')))
+        return sys.exit(1 if [reason for name, reason in failed if reason] else 0)
+
+    results = {}
+    for name in (args.providers or sorted(PROVIDERS)):
+        traced  = spawn(name, args, memory=True)
+        timings = ([spawn(name, args, memory=False) for run in range(args.repeat)] if 'skipped' not in traced else [])
+        results[name] = {'timings':timings, 'traced':traced}
+        if not args.json: report(name, [run for run in timings if 'skipped' not in run], traced)
+    if args.json: print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
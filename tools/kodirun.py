@@ -0,0 +1,98 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+"""
+Run an add-on entry point headless under the stub Kodi runtime, the way Kodi
+would invoke it for a plugin url, optionally under cProfile.
+
+    python tools/kodirun.py plugin.video.plutotv "mode=1&name=Lineup" [--replay] [--profile FILE] [--calls] [--max-ms MS]
+
+Without --replay the add-on talks to the real network.
+"""
+import os, sys, time, argparse, tempfile
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+ROOT  = os.path.dirname(HERE)
+STUBS = os.path.join(HERE, 'kodistub')
+
+def parse():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('addonid'   , help='add-on folder name, e.g. plugin.video.plutotv')
+    parser.add_argument('query'     , nargs='?', default='', help='plugin url query, e.g. "mode=1", empty for the root menu')
+    parser.add_argument('--entry'   , default='default.py', help='script to run, relative to the add-on folder')
+    parser.add_argument('--handle'  , type=int, default=1, help='plugin handle passed in sys.argv[1]')
+    parser.add_argument('--home'    , help='kodi home to use, a temp folder by default')
+    parser.add_argument('--set'     , action='append', default=[], metavar='ID=VALUE', help='add-on setting to use over its default, repeatable')
+    parser.add_argument('--replay'  , action='store_true', help='answer requests from tools/benchmark/fixtures')
+    parser.add_argument('--profile' , metavar='FILE', help='run under cProfile and dump the stats to FILE')
+    parser.add_argument('--sort'    , default='cumulative', help='pstats sort key for the printed profile')
+    parser.add_argument('--limit'   , type=int, default=25, help='profile rows to print, 0 for none')
+    parser.add_argument('--calls'   , action='store_true', help='print calls and time per stub kodi api')
+    parser.add_argument('--max-ms'  , type=float, help='exit with status 3 when the run takes longer')
+    return parser.parse_args()
+
+
+def main():
+    args = parse()
+    os.environ['KODISTUB_ADDON'] = args.addonid
+    os.environ['KODISTUB_HOME']  = (args.home or os.environ.get('KODISTUB_HOME') or tempfile.mkdtemp(prefix='kodistub-'))
+    folder = os.path.join(ROOT, args.addonid)
+    sys.path[:0] = [STUBS, folder]
+    import _kodistub, xbmcplugin
+
+    settings = dict([value.split('=', 1) for value in args.set if '=' in value])
+    if args.replay:
+        sys.path.insert(0, os.path.join(HERE, 'benchmark'))
+        import bench
+        name = args.addonid.split('.')[-1]
+        if name not in bench.PROVIDERS: sys.exit('no recorded fixtures for %s'%(args.addonid))
+        bench.Bench(args.addonid, threads=True).replay(dict(bench.SETTINGS.get(name, {}), **settings))
+    else: _kodistub.getSettings(args.addonid).update(settings)
+
+    timings = _kodistub.Timings()
+    if args.calls: _kodistub.addHook(timings)
+    sys.argv = ['plugin://%s/'%(args.addonid), str(args.handle), ('?%s'%(args.query.lstrip('?')) if args.query else '')]
+    entry    = os.path.join(folder, args.entry)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.time()
+    #not runpy, it would put the script path in sys.argv[0] where kodi passes the plugin url.
+    try: exec(compile(open(entry, 'rb').read(), entry, 'exec'), {'__name__':'__main__', '__file__':entry})
+    finally:
+        elapsed = (time.time() - start) * 1000
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+    sys.stderr.write('%s %s: %.1f ms, %s items, %s resolved, ended %s\n'%(args.addonid, ' '.join(sys.argv[1:]).strip(), elapsed,
+                     len(xbmcplugin.DIRECTORY), len(xbmcplugin.RESOLVED), [ended[1] for ended in xbmcplugin.ENDED]))
+    if args.calls: timings.report()
+    if profiler is not None and args.limit:
+        import pstats
+        pstats.Stats(args.profile, stream=sys.stderr).sort_stats(args.sort).print_stats(args.limit)
+    if args.max_ms is not None and elapsed > args.max_ms:
+        sys.stderr.write('over budget: %.1f ms > %.1f ms\n'%(elapsed, args.max_ms))
+        sys.exit(3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#state shared by the stub xbmc* modules; nothing in here is part of the Kodi api.
+import os, re, sys, json, time, tempfile, functools, collections
+
+import xml.etree.ElementTree as ET
+
+ROOT      = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ADDONS    = os.environ.get('KODISTUB_ADDONS', ROOT)
+HOME      = os.environ.get('KODISTUB_HOME', os.path.join(tempfile.gettempdir(), 'kodistub'))
+ADDON_ID  = os.environ.get('KODISTUB_ADDON', '')
+LOG_LEVEL = int(os.environ.get('KODISTUB_LOGLEVEL', '5')) #echo log lines at or above this level to stderr
+LOG       = collections.deque(maxlen=1000)
+SETTINGS  = {} #addon id: {setting id: value}, over the settings.xml defaults
+STRINGS   = {} #addon id: {string id: text}
+INFO      = {} #addon id: addon.xml attributes and assets
+ENABLED   = {} #addon id: enabled state as set over json-rpc
+GUI       = {'locale.language':'resource.language.en_gb', 'locale.country':'USA', 'pvrmanager.syncchannelgroups':True}
+HOOKS     = [] #callables taking (api name, seconds), see timed()
+METHODS   = {} #json-rpc method: handler taking the params dict
+CLOCK     = getattr(time, 'perf_counter', time.time)
+SPECIAL   = (('special://home/addons/', lambda: ADDONS),
+             ('special://profile/'    , lambda: os.path.join(HOME, 'userdata')),
+             ('special://userdata/'   , lambda: os.path.join(HOME, 'userdata')),
+             ('special://masterprofile/', lambda: os.path.join(HOME, 'userdata')),
+             ('special://temp/'       , lambda: os.path.join(HOME, 'temp')),
+             ('special://home/'       , lambda: HOME))
+
+def translatePath(path):
+    path = str(path)
+    for prefix, target in SPECIAL:
+        if path.startswith(prefix):
+            rest = path[len(prefix):]
+            return os.path.join(target(), *rest.split('/')) if rest else os.path.join(target(), '')
+    return path
+
+def log(msg, level):
+    LOG.append((level, msg))
+    if level >= LOG_LEVEL: sys.stderr.write('%s\n'%(msg))
+
+def addonPath(addonid):
+    return os.path.join(ADDONS, addonid)
+
+def getInfo(addonid):
+    if addonid not in INFO:
+        info = {'id':addonid, 'name':addonid, 'version':'0.0.0', 'author':'', 'icon':'', 'fanart':''}
+        try:
+            root = ET.parse(os.path.join(addonPath(addonid), 'addon.xml')).getroot()
+            info.update({'name':root.get('name', addonid), 'version':root.get('version', '0.0.0'), 'author':root.get('provider-name', '')})
+            for key in ('icon', 'fanart'):
+                node = root.find('.//assets/%s'%(key))
+                if node is not None and node.text: info[key] = os.path.join(addonPath(addonid), node.text)
+        except (IOError, OSError, ET.ParseError): pass
+        INFO[addonid] = info
+    return INFO[addonid]
+
+def profilePath(addonid):
+    return os.path.join(HOME, 'userdata', 'addon_data', addonid)
+
+def getSettings(addonid):
+    #read with a regex, not a parser, kodi itself accepts the loose settings.xml some add-ons ship.
+    if addonid not in SETTINGS:
+        settings = {}
+        try:
+            with open(os.path.join(addonPath(addonid), 'resources', 'settings.xml'), 'rb') as fle:
+                text = fle.read().decode('utf-8')
+            for node in re.findall(r'<setting\b[^>]*>', text):
+                attrs = dict(re.findall(r'([\w-]+)\s*=\s*"([^"]*)"', node))
+                if attrs.get('id'): settings[attrs['id']] = attrs.get('default', '')
+        except (IOError, OSError): pass
+        try:
+            #values saved by an earlier run in the same profile, as kodi keeps them.
+            for node in ET.parse(os.path.join(profilePath(addonid), 'settings.xml')).getroot().iter('setting'):
+                settings[node.get('id')] = (node.text if node.text is not None else node.get('value', ''))
+        except (IOError, OSError, ET.ParseError): pass
+        SETTINGS[addonid] = settings
+    return SETTINGS[addonid]
+
+def saveSettings(addonid):
+    root = ET.Element('settings', version='2')
+    for key, value in sorted(getSettings(addonid).items()):
+        ET.SubElement(root, 'setting', id=key).text = value
+    folder = profilePath(addonid)
+    if not os.path.isdir(folder): os.makedirs(folder)
+    ET.ElementTree(root).write(os.path.join(folder, 'settings.xml'), encoding='utf-8')
+
+def getStrings(addonid):
+    if addonid not in STRINGS:
+        strings = {}
+        try:
+            with open(os.path.join(addonPath(addonid), 'resources', 'language', 'resource.language.en_gb', 'strings.po'), 'rb') as fle:
+                text = fle.read().decode('utf-8')
+            for key, value in re.findall(r'msgctxt "#(\d+)"\s*msgid "((?:[^"\\]|\\.)*)"', text):
+                strings[int(key)] = value.replace('\\"', '"')
+        except (IOError, OSError): pass
+        STRINGS[addonid] = strings
+    return STRINGS[addonid]
+
+def addHook(hook):
+    #hook(name, seconds) runs after every timed stub call, e.g. 'xbmcvfs.File.write'.
+    if hook not in HOOKS: HOOKS.append(hook)
+
+def removeHook(hook):
+    if hook in HOOKS: HOOKS.remove(hook)
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            if not HOOKS: return func(*args, **kwargs)
+            start = CLOCK()
+            try: return func(*args, **kwargs)
+            finally:
+                seconds = CLOCK() - start
+                for hook in list(HOOKS): hook(name, seconds)
+        return call
+    return decorator
+
+
+class Timings(object):
+    """
+    A hook totalling calls and seconds per stub api, add it with addHook().
+    """
+    def __init__(self):
+        self.calls   = collections.Counter()
+        self.seconds = collections.Counter()
+
+
+    def __call__(self, name, seconds):
+        self.calls[name]   += 1
+        self.seconds[name] += seconds
+
+
+    def report(self, stream=sys.stderr):
+        stream.write('  %-36s %7s %10s\n'%('api', 'calls', 'ms'))
+        for name, seconds in self.seconds.most_common():
+            stream.write('  %-36s %7d %10.2f\n'%(name, self.calls[name], seconds * 1000))
+
+
+def rpc(method):
+    def decorator(func):
+        METHODS[method] = func
+        return func
+    return decorator
+
+def dispatch(command):
+    #answer as kodi's json-rpc server does, errors included.
+    try: request = json.loads(command)
+    except ValueError: return {'id':None, 'jsonrpc':'2.0', 'error':{'code':-32700, 'message':'Parse error.'}}
+    if not isinstance(request, dict) or 'method' not in request:
+        return {'id':None, 'jsonrpc':'2.0', 'error':{'code':-32600, 'message':'Invalid request.'}}
+    response = {'id':request.get('id'), 'jsonrpc':'2.0'}
+    handler  = METHODS.get(request['method'])
+    if handler is None:
+        response['error'] = {'code':-32601, 'message':'Method not found.'}
+        return response
+    try: response['result'] = handler(request.get('params') or {})
+    except (KeyError, TypeError, ValueError):
+        response['error'] = {'code':-32602, 'message':'Invalid params.'}
+    return response
+
+@rpc('JSONRPC.Ping')
+def ping(params):
+    return 'pong'
+
+@rpc('JSONRPC.Version')
+def version(params):
+    return {'version':{'major':10, 'minor':3, 'patch':0}}
+
+@rpc('Addons.SetAddonEnabled')
+def setAddonEnabled(params):
+    addonid, enabled = params['addonid'], params['enabled']
+    if enabled == 'toggle': enabled = not ENABLED.get(addonid, True)
+    elif not isinstance(enabled, bool): raise TypeError(enabled)
+    ENABLED[addonid] = enabled
+    return 'OK'
+
+@rpc('Addons.GetAddonDetails')
+def getAddonDetails(params):
+    info = getInfo(params['addonid'])
+    if not os.path.isdir(addonPath(info['id'])): raise ValueError(info['id'])
+    details = {'addonid':info['id'], 'type':'unknown'}
+    for key in params.get('properties', []):
+        if key == 'enabled': details[key] = ENABLED.get(info['id'], True)
+        elif key == 'path':  details[key] = addonPath(info['id'])
+        elif key in info:    details[key] = info[key]
+    return {'addon':details}
+
+@rpc('Settings.GetSettingValue')
+def getSettingValue(params):
+    return {'value':GUI[params['setting']]}
+
+@rpc('Settings.SetSettingValue')
+def setSettingValue(params):
+    GUI[params['setting']] = params['value']
+    return True
+
+@rpc('Player.GetActivePlayers')
+def getActivePlayers(params):
+    return []
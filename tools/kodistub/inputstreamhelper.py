@@ -0,0 +1,29 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# -*- coding: utf-8 -*-
+#stand-in for script.module.inputstreamhelper, every inputstream is reported as installed.
+class Helper(object):
+    def __init__(self, protocol, drm=None):
+        self.protocol = protocol
+        self.drm      = drm
+
+
+    def check_inputstream(self):
+        return True
@@ -0,0 +1,30 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# -*- coding: utf-8 -*-
+#stand-in for script.module.kodi-six, on python 3 the wrapped modules are the plain stubs.
+import xbmc, xbmcaddon, xbmcgui, xbmcplugin, xbmcvfs
+
+__all__ = ['xbmc', 'xbmcaddon', 'xbmcgui', 'xbmcplugin', 'xbmcvfs', 'py2_encode', 'py2_decode']
+
+def py2_encode(s, encoding='utf-8', errors='strict'):
+    return s
+
+def py2_decode(s, encoding='utf-8', errors='strict'):
+    return s
@@ -0,0 +1,54 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# -*- coding: utf-8 -*-
+#stand-in for script.module.simplecache, an in memory cache that honours expiration.
+import datetime, functools
+
+class SimpleCache(object):
+    def __init__(self):
+        self.cache = {}
+        self.enable_mem_cache = True
+
+
+    def get(self, endpoint, checksum='', json_data=False):
+        item = self.cache.get(endpoint)
+        if item is None: return None
+        expires, data, itemsum = item
+        if expires < datetime.datetime.now() or (checksum and checksum != itemsum):
+            self.cache.pop(endpoint, None)
+            return None
+        return data
+
+
+    def set(self, endpoint, data, checksum='', expiration=datetime.timedelta(days=30), json_data=False):
+        self.cache[endpoint] = (datetime.datetime.now() + expiration, data, checksum)
+
+
+    def close(self):
+        self.cache = {}
+
+
+def use_cache(cache_days=14):
+    def decorator(func):
+        @functools.wraps(func)
+        def decorated(*args, **kwargs):
+            return func(*args, **kwargs)
+        return decorated
+    return decorator
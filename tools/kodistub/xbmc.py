@@ -0,0 +1,102 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#headless stand-in for Kodi's xbmc module.
+import time, json
+
+import _kodistub
+
+LOGDEBUG, LOGINFO, LOGNOTICE, LOGWARNING, LOGERROR, LOGSEVERE, LOGFATAL, LOGNONE = 0, 1, 2, 3, 4, 5, 6, 7
+
+def log(msg, level=LOGDEBUG):
+    _kodistub.log(msg, level)
+
+def translatePath(path):
+    return _kodistub.translatePath(path)
+
+def getLocalizedString(id):
+    return ''
+
+def getCondVisibility(condition):
+    return False
+
+def getInfoLabel(label):
+    return ''
+
+BUILTINS = [] #builtin commands in the order they were run
+
+@_kodistub.timed('xbmc.executebuiltin')
+def executebuiltin(function, wait=False):
+    BUILTINS.append(function)
+
+@_kodistub.timed('xbmc.executeJSONRPC')
+def executeJSONRPC(jsonrpccommand):
+    return json.dumps(_kodistub.dispatch(jsonrpccommand))
+
+def sleep(timemillis):
+    time.sleep(timemillis / 1000.0)
+
+def getSkinDir():
+    return 'skin.estuary'
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return False
+
+
+    def waitForAbort(self, timeout=0):
+        return False
+
+
+class Player(object):
+    def __init__(self):
+        pass
+
+
+    def play(self, item='', listitem=None, windowed=False, startpos=-1):
+        pass
+
+
+    def stop(self):
+        pass
+
+
+    def isPlaying(self):
+        return False
+
+
+class PlayList(object):
+    def __init__(self, playList):
+        self.items = []
+
+
+    def add(self, url, listitem=None, index=-1):
+        self.items.append((url, listitem))
+
+
+    def clear(self):
+        self.items = []
+
+
+    def size(self):
+        return len(self.items)
+
+
+PLAYLIST_MUSIC, PLAYLIST_VIDEO = 0, 1
@@ -0,0 +1,86 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#headless stand-in for Kodi's xbmcaddon module, settings and strings come from the add-on's own resources.
+import os
+
+import _kodistub
+
+class Addon(object):
+    def __init__(self, id=None):
+        self.id = (id or _kodistub.ADDON_ID)
+        if not self.id: raise RuntimeError('No valid addon id could be obtained, set KODISTUB_ADDON')
+        #an installed add-on that has saved its settings once has its profile folder.
+        if not os.path.isdir(_kodistub.profilePath(self.id)): _kodistub.saveSettings(self.id)
+
+
+    def getAddonInfo(self, id):
+        info = _kodistub.getInfo(self.id)
+        if id == 'path':    return _kodistub.addonPath(self.id)
+        elif id == 'profile': return 'special://profile/addon_data/%s/'%(self.id)
+        return info.get(id, '')
+
+
+    def getLocalizedString(self, id):
+        return _kodistub.getStrings(self.id).get(int(id), '')
+
+
+    @_kodistub.timed('xbmcaddon.Addon.getSetting')
+    def getSetting(self, id):
+        return _kodistub.getSettings(self.id).get(id, '')
+
+
+    def getSettingBool(self, id):
+        return self.getSetting(id).lower() == 'true'
+
+
+    def getSettingInt(self, id):
+        try: return int(self.getSetting(id) or 0)
+        except ValueError: return 0
+
+
+    def getSettingNumber(self, id):
+        try: return float(self.getSetting(id) or 0)
+        except ValueError: return 0.0
+
+
+    def getSettingString(self, id):
+        return self.getSetting(id)
+
+
+    @_kodistub.timed('xbmcaddon.Addon.setSetting')
+    def setSetting(self, id, value):
+        _kodistub.getSettings(self.id)[id] = str(value)
+        _kodistub.saveSettings(self.id)
+
+
+    def setSettingBool(self, id, value):
+        self.setSetting(id, 'true' if value else 'false')
+
+
+    def setSettingInt(self, id, value):
+        self.setSetting(id, int(value))
+
+
+    def setSettingString(self, id, value):
+        self.setSetting(id, value)
+
+
+    def openSettings(self):
+        pass
@@ -0,0 +1,174 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#headless stand-in for Kodi's xbmcgui module, dialogs answer as a user who cancels.
+import _kodistub
+
+INPUT_ALPHANUM, INPUT_NUMERIC, INPUT_DATE, INPUT_TIME, INPUT_IPADDRESS, INPUT_PASSWORD = 0, 1, 2, 3, 4, 5
+ALPHANUM_HIDE_INPUT, PASSWORD_VERIFY = 2, 1
+NOTIFICATION_INFO, NOTIFICATION_WARNING, NOTIFICATION_ERROR = 'info', 'warning', 'error'
+
+PROPERTIES = {} #window id: {property: value}
+TEXT       = (type(u''), type('')) #unicode and str, the same type on python 3
+
+class Window(object):
+    def __init__(self, existingWindowId=-1):
+        self.properties = PROPERTIES.setdefault(existingWindowId, {})
+
+
+    @_kodistub.timed('xbmcgui.Window.getProperty')
+    def getProperty(self, key):
+        return self.properties.get(key.lower(), '')
+
+
+    @_kodistub.timed('xbmcgui.Window.setProperty')
+    def setProperty(self, key, value):
+        #kodi only stores strings, anything else is a TypeError there too.
+        if not isinstance(value, TEXT): raise TypeError('value must be a string, not %s'%(type(value).__name__))
+        self.properties[key.lower()] = value
+
+
+    def clearProperty(self, key):
+        self.properties.pop(key.lower(), None)
+
+
+    def clearProperties(self):
+        self.properties.clear()
+
+
+class Dialog(object):
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        pass
+
+
+    def ok(self, heading, message='', *lines):
+        return True
+
+
+    def yesno(self, heading, message='', *args, **kwargs):
+        return False
+
+
+    def select(self, heading, list, *args, **kwargs):
+        return -1
+
+
+    def multiselect(self, heading, options, *args, **kwargs):
+        return None
+
+
+    def input(self, heading, defaultt='', type=INPUT_ALPHANUM, option=0, autoclose=0):
+        return ''
+
+
+    def textviewer(self, heading, text, usemono=False):
+        pass
+
+
+class DialogProgress(object):
+    def create(self, heading, message=''):
+        self.percent = 0
+
+
+    def update(self, percent, *args):
+        self.percent = percent
+
+
+    def iscanceled(self):
+        return False
+
+
+    def close(self):
+        pass
+
+
+class DialogProgressBG(object):
+    def create(self, heading, message=''):
+        self.percent = 0
+
+
+    def update(self, percent=0, heading='', message=''):
+        self.percent = percent
+
+
+    def isFinished(self):
+        return False
+
+
+    def close(self):
+        pass
+
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label      = label
+        self.label2     = label2
+        self.path       = path
+        self.art        = {}
+        self.info       = {}
+        self.properties = {}
+        self.streams    = []
+
+
+    def getLabel(self):
+        return self.label
+
+
+    def setLabel(self, label):
+        self.label = label
+
+
+    def getPath(self):
+        return self.path
+
+
+    def setPath(self, path):
+        self.path = path
+
+
+    def setArt(self, dictionary):
+        self.art.update(dictionary)
+
+
+    def setInfo(self, type, infoLabels):
+        self.info.setdefault(type, {}).update(infoLabels)
+
+
+    def setProperty(self, key, value):
+        self.properties[key.lower()] = value
+
+
+    def getProperty(self, key):
+        return self.properties.get(key.lower(), '')
+
+
+    def addStreamInfo(self, cType, dictionary):
+        self.streams.append((cType, dictionary))
+
+
+    def setMimeType(self, mimetype):
+        self.properties['mimetype'] = mimetype
+
+
+    def setContentLookup(self, enable):
+        pass
+
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        pass
@@ -0,0 +1,71 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#headless stand-in for Kodi's xbmcplugin module, the listing is kept in DIRECTORY.
+import xbmcgui, _kodistub
+
+SORT_METHOD_NONE, SORT_METHOD_LABEL, SORT_METHOD_LABEL_IGNORE_THE, SORT_METHOD_DATE, SORT_METHOD_SIZE = 0, 1, 2, 3, 4
+SORT_METHOD_FILE, SORT_METHOD_DRIVE_TYPE, SORT_METHOD_TRACKNUM, SORT_METHOD_DURATION, SORT_METHOD_TITLE = 5, 6, 7, 8, 9
+SORT_METHOD_EPISODE, SORT_METHOD_VIDEO_YEAR, SORT_METHOD_VIDEO_RATING, SORT_METHOD_DATEADDED = 24, 18, 19, 21
+SORT_METHOD_UNSORTED, SORT_METHOD_GENRE, SORT_METHOD_VIDEO_TITLE, SORT_METHOD_VIDEO_SORT_TITLE = 40, 16, 26, 27
+
+DIRECTORY = [] #(url, listitem, isFolder) of the listing being built
+RESOLVED  = [] #(succeeded, listitem) handed to setResolvedUrl
+CONTENT   = {} #handle: content type
+ENDED     = [] #(handle, succeeded, updateListing, cacheToDisc) per endOfDirectory
+SORTS     = {} #handle: sort methods in the order added
+CATEGORY  = {} #handle: plugin category
+
+def checkHandle(handle):
+    #kodi rejects anything but the int handle it passed in sys.argv[1].
+    if not isinstance(handle, int) or isinstance(handle, bool): raise TypeError('handle must be an int, not %s'%(type(handle).__name__))
+
+@_kodistub.timed('xbmcplugin.addDirectoryItem')
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    checkHandle(handle)
+    if not isinstance(listitem, xbmcgui.ListItem): raise TypeError('listitem must be a xbmcgui.ListItem')
+    DIRECTORY.append((url, listitem, isFolder))
+    return True
+
+@_kodistub.timed('xbmcplugin.addDirectoryItems')
+def addDirectoryItems(handle, items, totalItems=0):
+    for item in items: addDirectoryItem(handle, *item)
+    return True
+
+@_kodistub.timed('xbmcplugin.endOfDirectory')
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    checkHandle(handle)
+    ENDED.append((handle, succeeded, updateListing, cacheToDisc))
+
+def setContent(handle, content):
+    checkHandle(handle)
+    CONTENT[handle] = content
+
+def addSortMethod(handle, sortMethod, label2Mask=''):
+    checkHandle(handle)
+    SORTS.setdefault(handle, []).append(sortMethod)
+
+def setPluginCategory(handle, category):
+    checkHandle(handle)
+    CATEGORY[handle] = category
+
+@_kodistub.timed('xbmcplugin.setResolvedUrl')
+def setResolvedUrl(handle, succeeded, listitem):
+    checkHandle(handle)
+    RESOLVED.append((succeeded, listitem))
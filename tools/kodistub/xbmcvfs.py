@@ -0,0 +1,133 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+#headless stand-in for Kodi's xbmcvfs module, special:// paths map under KODISTUB_HOME.
+import os, shutil
+
+import _kodistub
+
+def translatePath(path):
+    return _kodistub.translatePath(path)
+
+class File(object):
+    def __init__(self, filepath, mode=None):
+        #like kodi, a missing file or folder is not an error here, reads come back empty and writes False.
+        self.path = translatePath(filepath)
+        try:    self.fle = open(self.path, 'wb' if mode and 'w' in mode else 'rb')
+        except (IOError, OSError): self.fle = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    @_kodistub.timed('xbmcvfs.File.read')
+    def read(self, numBytes=-1):
+        if self.fle is None: return ''
+        return self.fle.read(numBytes if numBytes > 0 else -1).decode('utf-8', 'replace')
+
+
+    @_kodistub.timed('xbmcvfs.File.readBytes')
+    def readBytes(self, numBytes=-1):
+        if self.fle is None: return bytearray()
+        return bytearray(self.fle.read(numBytes if numBytes > 0 else -1))
+
+
+    @_kodistub.timed('xbmcvfs.File.write')
+    def write(self, buffer):
+        if self.fle is None: return False
+        if not isinstance(buffer, (bytes, bytearray)): buffer = buffer.encode('utf-8')
+        self.fle.write(buffer)
+        return True
+
+
+    def size(self):
+        try:    return os.path.getsize(self.path)
+        except OSError: return 0
+
+
+    def seek(self, seekBytes, iWhence=0):
+        if self.fle is None: return -1
+        self.fle.seek(seekBytes, iWhence)
+        return self.fle.tell()
+
+
+    def close(self):
+        if self.fle is not None:
+            self.fle.close()
+            self.fle = None
+
+
+@_kodistub.timed('xbmcvfs.exists')
+def exists(path):
+    path = translatePath(path)
+    if path.endswith(('/', os.sep)): return os.path.isdir(path)
+    return os.path.exists(path)
+
+@_kodistub.timed('xbmcvfs.mkdir')
+def mkdir(path):
+    try:    os.mkdir(translatePath(path))
+    except OSError: return False
+    return True
+
+@_kodistub.timed('xbmcvfs.mkdirs')
+def mkdirs(path):
+    try:    os.makedirs(translatePath(path))
+    except OSError: return os.path.isdir(translatePath(path))
+    return True
+
+@_kodistub.timed('xbmcvfs.rmdir')
+def rmdir(path, force=False):
+    try:
+        if force: shutil.rmtree(translatePath(path))
+        else:     os.rmdir(translatePath(path))
+    except OSError: return False
+    return True
+
+@_kodistub.timed('xbmcvfs.delete')
+def delete(file):
+    try:    os.remove(translatePath(file))
+    except OSError: return False
+    return True
+
+@_kodistub.timed('xbmcvfs.rename')
+def rename(file, newFile):
+    #like kodi, an existing target is not replaced on every platform.
+    if os.path.exists(translatePath(newFile)): return False
+    try:    os.rename(translatePath(file), translatePath(newFile))
+    except OSError: return False
+    return True
+
+@_kodistub.timed('xbmcvfs.copy')
+def copy(strSource, strDestination):
+    try:    shutil.copyfile(translatePath(strSource), translatePath(strDestination))
+    except (IOError, OSError): return False
+    return True
+
+@_kodistub.timed('xbmcvfs.listdir')
+def listdir(path):
+    path = translatePath(path)
+    dirs, files = [], []
+    for name in sorted(os.listdir(path)):
+        (dirs if os.path.isdir(os.path.join(path, name)) else files).append(name)
+    return dirs, files
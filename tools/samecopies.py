@@ -0,0 +1,58 @@
+#   Copyright (C) 2020 Lunatixz
+#
+#
+# This file is part of KODI_Addons.
+#
+# KODI_Addons is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# KODI_Addons is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with KODI_Addons.  If not, see <http://www.gnu.org/licenses/>.
+
+# -*- coding: utf-8 -*-
+"""
+Check that the helper modules copied into each add-on have not drifted.
+
+    python tools/samecopies.py
+
+Every add-on ships as its own zip and only depends on what the Kodi
+repository already carries, so timings.py, executor.py, guidestore.py and
+artcache.py are copied into resources/lib of each add-on that uses them
+rather than moved into a new script.module every add-on would have to
+depend on and release in step with. A copy may only differ in its license
+header and in importing xbmc modules through kodi_six. Exits with status 1
+and names the copies that differ from the first one otherwise.
+"""
+import os, re, sys, glob
+
+HERE    = os.path.dirname(os.path.abspath(__file__))
+ROOT    = os.path.dirname(HERE)
+MODULES = ['timings', 'executor', 'guidestore', 'artcache']
+IMPORT  = re.compile(r'^from kodi_six\s+import (.*)$', re.M)
+
+def body(path):
+    #the code below the license header, xbmc modules imported directly.
+    with open(path) as fle: text = fle.read()
+    text = text[text.find('# -*- coding'):]
+    return IMPORT.sub(lambda match: 'import %s'%(', '.join(sorted(name.strip() for name in match.group(1).split(',')))), text).rstrip()
+
+
+def main():
+    drifted = []
+    for module in MODULES:
+        copies = sorted(glob.glob(os.path.join(ROOT, 'plugin.video.*', 'resources', 'lib', '%s.py'%(module))))
+        for path in copies[1:]:
+            if body(path) != body(copies[0]): drifted.append((os.path.relpath(path, ROOT), os.path.relpath(copies[0], ROOT)))
+    for path, first in drifted: print('%s differs from %s'%(path, first))
+    return 1 if drifted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())